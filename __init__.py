@@ -34,29 +34,56 @@ class WordDumbDumb(InterfaceActionBase):
         from calibre.utils.logging import Log
 
         from .metadata import check_word_wise_language, cli_check_metadata
-        from .parse_job import ParseJobData, do_job
+        from .parse_job import ParseJobData, do_batch_jobs, do_job
 
         parser = argparse.ArgumentParser(prog="calibre-debug -r WordDumb --")
         parser.add_argument("-w", help="Create Word Wise", action="store_true")
         parser.add_argument("-x", help="Create X-Ray", action="store_true")
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            help="Create files in parallel with this many worker processes",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--wikipedia-dump",
+            help="Build an index from a Wikipedia pages-articles or abstract dump "
+            "file, X-Ray of books in this language won't send Wikipedia requests",
+            nargs=2,
+            metavar=("LANGUAGE_CODE", "DUMP_PATH"),
+        )
         parser.add_argument(
             "-v", "--version", action="version", version=".".join(map(str, VERSION))
         )
-        parser.add_argument("book_path", nargs="+")
+        parser.add_argument("book_path", nargs="*")
         args = parser.parse_args(argv[1:])
+        if not args.book_path and not args.wikipedia_dump:
+            parser.error("the following arguments are required: book_path")
 
         log = Log()
+        if args.wikipedia_dump:
+            from pathlib import Path
+
+            from .utils import get_plugin_path
+            from .wikipedia_dump import build_wikipedia_dump_index, wikipedia_dump_path
+
+            lang, dump_path = args.wikipedia_dump
+            index_path = wikipedia_dump_path(get_plugin_path(), lang)
+            count = build_wikipedia_dump_index(Path(dump_path), index_path)
+            log.prints(Log.INFO, f"Saved {count} titles to {index_path}")
         create_w = args.w
         create_x = args.x
         if not create_w and not create_x:
             create_w = True
             create_x = True
 
+        batch_jobs = []
         for file_path in args.book_path:
             data = cli_check_metadata(file_path, log)
             if data is None:
                 continue
-            book_fmt, mi, lang = data
+            book_fmt, mi, lang, kfx_book = data
             if create_w:
                 create_w, gloss_lang = check_word_wise_language(
                     lang, book_fmt != "EPUB"
@@ -86,5 +113,13 @@ class WordDumbDumb(InterfaceActionBase):
                 book_lang=lang,
                 create_ww=create_w,
                 create_x=create_x,
+                # don't keep decoded books of queued batch jobs
+                kfx_book=kfx_book if args.jobs == 1 else None,
             )
-            do_job(job_data)
+            if args.jobs > 1:
+                batch_jobs.append(job_data)
+            else:
+                do_job(job_data)
+
+        if batch_jobs:
+            do_batch_jobs(batch_jobs, args.jobs, log)
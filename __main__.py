@@ -3,6 +3,8 @@
 """
 Create X-Ray file on macOS: run this script in subprocess to bypass
 the ludicrous library validation
+
+Run with "--worker" to keep spaCy pipelines loaded and read jobs from stdin
 """
 
 import argparse
@@ -12,28 +14,41 @@ from pathlib import Path
 
 from dump_lemmas import dump_spacy_docs
 from parse_job import ParseJobData, create_files
+from worker import run_worker
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("job_data", nargs="?")
+    parser.add_argument("prefs", nargs="?")
+    parser.add_argument("--worker", type=int, metavar="MEMORY_LIMIT_MB")
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_worker(args.worker)
+        return
+
+    job_data = json.loads(args.job_data)
+    prefs = json.loads(args.prefs)
+    if "db_path" in job_data:
+        dump_spacy_docs(
+            job_data["model_name"],
+            job_data["is_kindle"],
+            job_data["lemma_lang"],
+            Path(job_data["db_path"]),
+            Path(job_data["plugin_path"]),
+            prefs,
+        )
+    else:
+        data = ParseJobData(**job_data)
+        if data.book_fmt == "KFX":
+            data.kfx_content = sys.stdin.buffer.read()
+        elif data.book_fmt != "EPUB":
+            data.mobi_html = sys.stdin.buffer.read()
+
+        create_files(data, prefs, None)
+
 
-parser = argparse.ArgumentParser()
-parser.add_argument("job_data")
-parser.add_argument("prefs")
-args = parser.parse_args()
-
-job_data = json.loads(args.job_data)
-prefs = json.loads(args.prefs)
-if "db_path" in job_data:
-    dump_spacy_docs(
-        job_data["model_name"],
-        job_data["is_kindle"],
-        job_data["lemma_lang"],
-        Path(job_data["db_path"]),
-        Path(job_data["plugin_path"]),
-        prefs,
-    )
-else:
-    data = ParseJobData(**job_data)
-    if data.book_fmt == "KFX":
-        data.kfx_json = json.load(sys.stdin)
-    elif data.book_fmt != "EPUB":
-        data.mobi_html = sys.stdin.buffer.read()
-
-    create_files(data, prefs, None)
+# spaCy processes started with "spawn" import this module
+if __name__ == "__main__":
+    main()
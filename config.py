@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import json
 import webbrowser
 from functools import partial
 from pathlib import Path
@@ -41,7 +40,6 @@ from .utils import (
     kindle_db_path,
     load_languages_data,
     load_plugin_json,
-    run_subprocess,
     spacy_model_name,
     wiktionary_db_path,
 )
@@ -66,6 +64,19 @@ prefs.defaults["cuda"] = "cu118"
 prefs.defaults["last_opened_kindle_lemmas_language"] = "ca"
 prefs.defaults["last_opened_wiktionary_lemmas_language"] = "ca"
 prefs.defaults["use_wiktionary_for_kindle"] = False
+prefs.defaults["worker_idle_timeout"] = 300  # seconds
+prefs.defaults["worker_memory_limit"] = 4096  # MB
+prefs.defaults["use_lemma_index"] = False
+prefs.defaults["use_parse_cache"] = False
+prefs.defaults["parse_cache_max_mb"] = 1000
+prefs.defaults["mediawiki_workers"] = 4
+prefs.defaults["mediawiki_cache_ttl"] = 180  # days
+prefs.defaults["mediawiki_not_found_ttl"] = 14  # days
+prefs.defaults["mediawiki_cache_max_mb"] = 200
+prefs.defaults["map_cache_max_mb"] = 500
+prefs.defaults["parse_processes"] = 1
+prefs.defaults["parse_batch_size"] = 64  # texts sent to a process at once
+prefs.defaults["parse_chunk_size"] = 0  # tokens, 0 to parse each text alone
 for code in load_plugin_json(get_plugin_path(), "data/languages.json").keys():
     prefs.defaults[f"{code}_wiktionary_difficulty_limit"] = 5
 
@@ -102,6 +113,26 @@ class ConfigWidget(QWidget):
         self.use_pos_box.setChecked(prefs["use_pos"])
         vl.addWidget(self.use_pos_box)
 
+        self.use_lemma_index_box = QCheckBox(_("Find Word Wise lemmas with index file"))
+        self.use_lemma_index_box.setToolTip(
+            _(
+                "Save a lookup table next to the lemmas database to find definitions"
+                " faster, uses more disk space"
+            )
+        )
+        self.use_lemma_index_box.setChecked(prefs["use_lemma_index"])
+        vl.addWidget(self.use_lemma_index_box)
+
+        self.use_parse_cache_box = QCheckBox(_("Save parsed books for later jobs"))
+        self.use_parse_cache_box.setToolTip(
+            _(
+                "Creating files again for the same book skips spaCy, parsed books"
+                " use at most {} MB"
+            ).format(prefs["parse_cache_max_mb"])
+        )
+        self.use_parse_cache_box.setChecked(prefs["use_parse_cache"])
+        vl.addWidget(self.use_parse_cache_box)
+
         self.search_people_box = QCheckBox(
             _("Fetch X-Ray people descriptions from Wikipedia/Fandom")
         )
@@ -216,6 +247,8 @@ class ConfigWidget(QWidget):
 
     def save_settings(self) -> None:
         prefs["use_pos"] = self.use_pos_box.isChecked()
+        prefs["use_lemma_index"] = self.use_lemma_index_box.isChecked()
+        prefs["use_parse_cache"] = self.use_parse_cache_box.isChecked()
         prefs["search_people"] = self.search_people_box.isChecked()
         prefs["model_size"] = self.model_size_box.currentData()
         prefs["zh_wiki_variant"] = self.zh_wiki_box.currentData()
@@ -329,7 +362,7 @@ def import_lemmas_job(
     notifications: Any = None,
 ) -> None:
     apply_imported_lemmas_data(db_path, import_path, retain_lemmas, lemma_lang)
-    dump_lemmas_job(is_kindle, db_path, lemma_lang)
+    dump_lemmas_job(is_kindle, db_path, lemma_lang, notifications=notifications)
 
 
 def dump_lemmas_job(
@@ -346,6 +379,8 @@ def dump_lemmas_job(
     )
     install_deps(model_name, notifications)
     if isfrozen:
+        from .worker import acquire_job_worker
+
         options = {
             "is_kindle": is_kindle,
             "db_path": str(db_path),
@@ -353,15 +388,19 @@ def dump_lemmas_job(
             "plugin_path": str(plugin_path),
             "model_name": model_name,
         }
-        args = [
-            which_python()[0],
-            str(plugin_path),
-            json.dumps(options),
-            dump_prefs(prefs),
-        ]
-        run_subprocess(args)
+        # job worker forwards progress of the subprocess
+        with acquire_job_worker(which_python()[0], plugin_path, prefs) as worker:
+            worker.run_job(options, dump_prefs(prefs), b"", notifications)
     else:
-        dump_spacy_docs(model_name, is_kindle, lemma_lang, db_path, plugin_path, prefs)
+        dump_spacy_docs(
+            model_name,
+            is_kindle,
+            lemma_lang,
+            db_path,
+            plugin_path,
+            prefs,
+            notifications,
+        )
 
 
 class FormatOrderDialog(QDialog):
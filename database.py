@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import sqlite3
 from pathlib import Path
 from typing import Iterator
@@ -8,16 +9,42 @@ try:
 except ImportError:
     from utils import load_plugin_json
 
+# sidecar files are written once, trade durability for speed and rename them
+# into place after they are complete
+SIDECAR_PAGE_SIZE = 4096
+SIDECAR_CACHE_KIB = 64 * 1024
+
 
 def get_ll_path(asin: str, book_path: str) -> Path:
     return Path(book_path).parent.joinpath(f"LanguageLayer.en.{asin}.kll")
 
 
+def sidecar_tmp_path(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.name}.tmp")
+
+
+def connect_sidecar_db(db_path: Path) -> sqlite3.Connection:
+    "Write to a temporary file next to `db_path`, `save_db` moves it"
+    tmp_path = sidecar_tmp_path(db_path)
+    # left by a crashed job
+    tmp_path.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(
+        f"""
+        PRAGMA page_size = {SIDECAR_PAGE_SIZE};
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        PRAGMA cache_size = -{SIDECAR_CACHE_KIB};
+        """
+    )
+    return conn
+
+
 def create_lang_layer(
     asin: str, book_path: str, acr: str, revision: str
 ) -> tuple[sqlite3.Connection, Path]:
     db_path = get_ll_path(asin, book_path)
-    ll_conn = sqlite3.connect(":memory:")
+    ll_conn = connect_sidecar_db(db_path)
     ll_conn.executescript(
         """
         CREATE TABLE metadata (
@@ -50,14 +77,40 @@ def create_lang_layer(
     return ll_conn, db_path
 
 
-def insert_lemma(ll_conn: sqlite3.Connection, data: tuple[int, int, int, int]) -> None:
-    ll_conn.execute(
-        """
-        INSERT INTO glosses (start, end, difficulty, sense_id, low_confidence)
-        VALUES (?, ?, ?, ?, 0)
-        """,
-        data,
-    )
+class LangLayerWriter:
+    """
+    Buffer Word Wise rows then insert them sorted by the primary key `start`,
+    later rows starting at the same position are dropped.
+    """
+
+    def __init__(self, ll_conn: sqlite3.Connection) -> None:
+        self.conn = ll_conn
+        self.rows: dict[int, tuple[int, int | None, int, int]] = {}
+        self.written = 0
+        self.duplicates = 0
+
+    def add(self, start: int, end: int | None, difficulty: int, sense_id: int) -> None:
+        if start in self.rows:
+            self.duplicates += 1
+        else:
+            self.rows[start] = (start, end, difficulty, sense_id)
+
+    def flush(self) -> None:
+        self.conn.executemany(
+            """
+            INSERT INTO glosses (start, end, difficulty, sense_id, low_confidence)
+            VALUES (?, ?, ?, ?, 0)
+            """,
+            sorted(self.rows.values()),
+        )
+        self.written += len(self.rows)
+        self.rows.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "word_wise_rows": self.written,
+            "word_wise_duplicates": self.duplicates,
+        }
 
 
 def get_x_ray_path(asin: str, book_path: str) -> Path:
@@ -68,7 +121,7 @@ def create_x_ray_db(
     asin: str, book_path: str, lang: str, plugin_path: Path, prefs: dict[str, str]
 ) -> tuple[sqlite3.Connection, Path]:
     db_path = get_x_ray_path(asin, book_path)
-    x_ray_conn = sqlite3.connect(":memory:")
+    x_ray_conn = connect_sidecar_db(db_path)
     x_ray_conn.executescript(
         """
     PRAGMA user_version = 1;
@@ -219,11 +272,14 @@ def insert_x_excerpt_image(
 
 def save_db(source: sqlite3.Connection, dest_path: Path) -> None:
     source.commit()
-    dest = sqlite3.connect(dest_path)
-    with dest:
-        source.backup(dest)
     source.close()
-    dest.close()
+    os.replace(sidecar_tmp_path(dest_path), dest_path)
+
+
+def discard_db(source: sqlite3.Connection, dest_path: Path) -> None:
+    "Close the database of a failed job and delete its temporary file"
+    source.close()
+    sidecar_tmp_path(dest_path).unlink(missing_ok=True)
 
 
 def compare_klld_metadata(
@@ -43,6 +43,9 @@ def install_deps(pkg: str, notif: Any) -> None:
     dep_versions = load_plugin_json(plugin_path, "data/deps.json")
     if pkg == "lxml":
         pip_install("lxml", dep_versions["lxml"], notif=notif)
+    elif pkg == "spacy":
+        # tokenizer of `spacy.blank()`, Word Wise without POS
+        pip_install("spacy", dep_versions["spacy"], notif=notif)
     else:
         # Install X-Ray dependencies
         pip_install("rapidfuzz", dep_versions["rapidfuzz"], notif=notif)
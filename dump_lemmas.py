@@ -1,5 +1,7 @@
 import sqlite3
+from collections import defaultdict
 from pathlib import Path
+from typing import Any, Iterator
 
 try:
     from .utils import (
@@ -18,6 +20,10 @@ except ImportError:
         use_kindle_ww_db,
     )
 
+# lemmas are short, send more of them to a process at once
+PATTERN_BATCH_SIZE = 1000
+PROGRESS_INTERVAL = 10000
+
 
 def spacy_doc_path(
     spacy_model: str,
@@ -53,6 +59,7 @@ def dump_spacy_docs(
     db_path: Path,
     plugin_path: Path,
     prefs: Prefs,
+    notifications: Any = None,
 ):
     insert_installed_libs(plugin_path)
     import spacy
@@ -76,6 +83,7 @@ def dump_spacy_docs(
         lemmas_conn,
         plugin_path,
         prefs,
+        notifications,
     )
     lemmas_conn.close()
 
@@ -89,6 +97,7 @@ def save_spacy_docs(
     lemmas_conn: sqlite3.Connection,
     plugin_path: Path,
     prefs: Prefs,
+    notifications: Any = None,
 ):
     from spacy.tokens import DocBin
 
@@ -99,18 +108,25 @@ def save_spacy_docs(
         None if is_kindle else prefs[f"{lemma_lang}_wiktionary_difficulty_limit"]
     )
     if prefs["use_pos"]:
-        for doc in create_lemma_patterns_with_pos(
-            lemma_lang, lemmas_conn, nlp, difficulty_limit
-        ):
-            if " " in doc.text or lemma_lang == "zh":
-                phrases_doc_bin.add(doc)
-            if " " not in doc.text and lemma_lang != "zh":
-                lemmas_doc_bin.add(doc)
+        texts = list(
+            lemma_pattern_texts_with_pos(lemma_lang, lemmas_conn, difficulty_limit)
+        )
+        pipe_options = {"batch_size": PATTERN_BATCH_SIZE}
+        # spaCy doesn't support multiprocessing on GPU
+        if prefs["parse_processes"] > 1 and not prefs["use_gpu"]:
+            pipe_options["n_process"] = prefs["parse_processes"]
+        docs = nlp.pipe(texts, **pipe_options)
     else:
-        for doc in create_lemma_patterns_without_pos(
-            lemmas_conn, nlp, difficulty_limit
-        ):
+        texts = list(lemma_pattern_texts_without_pos(lemmas_conn, difficulty_limit))
+        docs = map(nlp.make_doc, texts)
+
+    for index, doc in enumerate(docs, 1):
+        if not prefs["use_pos"] or " " in doc.text or lemma_lang == "zh":
             phrases_doc_bin.add(doc)
+        if prefs["use_pos"] and " " not in doc.text and lemma_lang != "zh":
+            lemmas_doc_bin.add(doc)
+        if notifications and index % PROGRESS_INTERVAL == 0:
+            notifications.put((index / len(texts), "Creating spaCy docs"))
 
     with open(
         spacy_doc_path(
@@ -136,24 +152,37 @@ def save_spacy_docs(
             f.write(lemmas_doc_bin.to_bytes())
 
 
-def create_lemma_patterns_with_pos(lemma_lang, conn, nlp, difficulty_limit):
-    query_sql = """
+def lemma_pattern_texts_with_pos(
+    lemma_lang: str, conn: sqlite3.Connection, difficulty_limit: int | None
+) -> Iterator[str]:
+    "Lemmas, and forms of phrases"
+    difficulty_sql = ""
+    if difficulty_limit is not None:
+        difficulty_sql = f" AND difficulty <= {difficulty_limit}"
+    forms_sql = f"""
+    SELECT DISTINCT forms.lemma_id, form
+    FROM forms JOIN lemmas ON forms.lemma_id = lemmas.id
+    WHERE forms.lemma_id IN
+    (SELECT lemma_id FROM senses WHERE enabled = 1{difficulty_sql})
+    """
+    if lemma_lang != "zh":
+        forms_sql += " AND lemma LIKE '% %'"
+    forms: defaultdict[int, list[str]] = defaultdict(list)
+    for lemma_id, form in conn.execute(forms_sql):
+        forms[lemma_id].append(form)
+
+    query_sql = f"""
     SELECT DISTINCT lemma, lemma_id
     FROM senses JOIN lemmas ON senses.lemma_id = lemmas.id
-    WHERE enabled = 1
+    WHERE enabled = 1{difficulty_sql}
     """
-    if difficulty_limit is not None:
-        query_sql += f" AND difficulty <= {difficulty_limit}"
     for lemma, lemma_id in conn.execute(query_sql):
-        yield nlp(lemma)
+        yield lemma
         if " " in lemma or lemma_lang == "zh":
-            for (form,) in conn.execute(
-                "SELECT DISTINCT form FROM forms WHERE lemma_id = ?", (lemma_id,)
-            ):
-                yield nlp(form)
+            yield from forms[lemma_id]
 
 
-def create_lemma_patterns_without_pos(conn, nlp, difficulty_limit):
+def lemma_pattern_texts_without_pos(conn, difficulty_limit):
     query_sql = """
     SELECT DISTINCT lemma
     FROM senses JOIN lemmas ON senses.lemma_id = lemmas.id
@@ -162,7 +191,7 @@ def create_lemma_patterns_without_pos(conn, nlp, difficulty_limit):
     if difficulty_limit is not None:
         query_sql += f" AND difficulty <= {difficulty_limit}"
     for (lemma,) in conn.execute(query_sql):
-        yield nlp.make_doc(lemma)
+        yield lemma
 
     query_sql = """
     SELECT DISTINCT form
@@ -173,4 +202,4 @@ def create_lemma_patterns_without_pos(conn, nlp, difficulty_limit):
     if difficulty_limit is not None:
         query_sql += f" AND difficulty <= {difficulty_limit}"
     for (form,) in conn.execute(query_sql):
-        yield nlp.make_doc(form)
+        yield form
@@ -1,18 +1,23 @@
 #!/usr/bin/env python3
 
+import copy
+import io
 import operator
+import posixpath
 import re
 import shutil
 import sqlite3
+import struct
 import zipfile
 from collections import defaultdict
-from functools import partial
 from html import escape, unescape
 from pathlib import Path
 from typing import Iterator
 from urllib.parse import quote, unquote
 
 try:
+    from .escaped_text import EscapedText
+    from .lemma_index import LemmaIndex
     from .mediawiki import (
         Fandom,
         Wikidata,
@@ -24,14 +29,16 @@ try:
     )
     from .utils import CJK_LANGS, Prefs
     from .x_ray_share import (
-        FUZZ_THRESHOLD,
         PERSON_LABELS,
         CustomX,
+        EntityIndex,
         XRayEntity,
         is_full_name,
         x_ray_source,
     )
 except ImportError:
+    from escaped_text import EscapedText
+    from lemma_index import LemmaIndex
     from mediawiki import (
         Fandom,
         Wikidata,
@@ -43,9 +50,9 @@ except ImportError:
     )
     from utils import CJK_LANGS, Prefs
     from x_ray_share import (
-        FUZZ_THRESHOLD,
         PERSON_LABELS,
         CustomX,
+        EntityIndex,
         XRayEntity,
         is_full_name,
         x_ray_source,
@@ -75,48 +82,59 @@ class EPUB:
         self.wikidata = wikidata
         self.entity_id = 0
         self.entities: dict[str, XRayEntity] = {}
+        self.entity_index = EntityIndex()
         self.entity_occurrences: dict[
-            Path, list[tuple[int, int, str, int | str]]
+            str, list[tuple[int, int, str, int | str]]
         ] = defaultdict(list)
         self.removed_entity_ids: set[int] = set()
-        self.extract_folder = self.book_path.with_name("extract")
-        if self.extract_folder.exists():
-            shutil.rmtree(self.extract_folder)
-        self.xhtml_folder = self.extract_folder
+        # paths of zip members, folders are empty string if files are not in folder
+        self.zip_names: list[str] = []
+        self.xhtml_texts: dict[str, str] = {}
+        # new or modified files, unmodified files are copied without decompressing
+        self.modified_files: dict[str, list[str] | str | bytes | Path] = {}
+        self.xhtml_folder = ""
         self.xhtml_href_has_folder = False
-        self.image_folder = self.extract_folder
+        self.image_folder = ""
         self.image_href_has_folder = False
         self.image_filenames: set[str] = set()
         self.custom_x_ray = custom_x_ray
         self.lemmas: dict[str, int] = {}
         self.lemma_id = 0
         self.lemmas_conn: sqlite3.Connection | None = None
+        self.lemma_index: LemmaIndex | None = None
+        # glosses of `self.lemmas`
+        self.glosses: dict[str, list[tuple[str, str, str, str]]] = {}
         self.prefs: Prefs = {}
 
-    def extract_epub(self) -> Iterator[tuple[str, tuple[int, str, Path]]]:
+    def find_zip_name(self, href: str, base_folder: str = "") -> str:
+        "Find the zip member of a path relative to the OPF file or in any folder"
+        names = set(self.zip_names)
+        for name in (posixpath.normpath(posixpath.join(base_folder, href)), href):
+            if name in names:
+                return name
+        for name in self.zip_names:
+            if name.endswith(f"/{href}"):
+                return name
+        # same error as `ZipFile.getinfo`
+        raise KeyError(f"There is no item named {href!r} in {self.book_path}")
+
+    def extract_epub(self) -> Iterator[tuple[str, tuple[int, EscapedText, str]]]:
         from lxml import etree
 
         with zipfile.ZipFile(self.book_path) as zf:
-            zf.extractall(self.extract_folder)
-
-        with self.extract_folder.joinpath("META-INF/container.xml").open("rb") as f:
-            root = etree.fromstring(f.read())
+            self.zip_names = zf.namelist()
+            root = etree.fromstring(zf.read("META-INF/container.xml"))
             opf_path = unquote(root.find(".//n:rootfile", NAMESPACES).get("full-path"))
-            self.opf_path = self.extract_folder.joinpath(opf_path)
-            if not self.opf_path.exists():
-                self.opf_path = next(self.extract_folder.rglob(opf_path))
-        with self.opf_path.open("rb") as opf:
-            self.opf_root = etree.fromstring(opf.read())
+            self.opf_path = self.find_zip_name(opf_path)
+            opf_folder = posixpath.dirname(self.opf_path)
+            self.opf_root = etree.fromstring(zf.read(self.opf_path))
             for item in self.opf_root.xpath(
                 'opf:manifest/opf:item[starts-with(@media-type, "image/")]',
                 namespaces=NAMESPACES,
             ):
                 image_href = unquote(item.get("href"))
-                image_path = self.extract_folder.joinpath(image_href)
-                if not image_path.exists():
-                    image_path = next(self.extract_folder.rglob(image_href))
-                if not image_path.parent.samefile(self.extract_folder):
-                    self.image_folder = image_path.parent
+                image_path = self.find_zip_name(image_href, opf_folder)
+                self.image_folder = posixpath.dirname(image_path)
                 if "/" in image_href:
                     self.image_href_has_folder = True
                     break
@@ -127,23 +145,21 @@ class EPUB:
                 if item.get("properties") == "nav":
                     continue
                 xhtml_href = unquote(item.get("href"))
-                xhtml_path = self.extract_folder.joinpath(xhtml_href)
-                if not xhtml_path.exists():
-                    xhtml_path = next(self.extract_folder.rglob(xhtml_href))
-                if not xhtml_path.parent.samefile(self.extract_folder):
-                    self.xhtml_folder = xhtml_path.parent
+                xhtml_path = self.find_zip_name(xhtml_href, opf_folder)
+                self.xhtml_folder = posixpath.dirname(xhtml_path)
                 if "/" in xhtml_href:
                     self.xhtml_href_has_folder = True
-                with xhtml_path.open("r", encoding="utf-8") as f:
-                    # remove soft hyphen, byte order mark, word joiner
-                    xhtml_text = re.sub(
-                        r"\xad|&shy;|&#xad;|&#173;|\ufeff|\u2060|&NoBreak;",
-                        "",
-                        f.read(),
-                        flags=re.I,
-                    )
-                with xhtml_path.open("w", encoding="utf-8") as f:
-                    f.write(xhtml_text)
+                original_text = zf.read(xhtml_path).decode("utf-8")
+                # remove soft hyphen, byte order mark, word joiner
+                xhtml_text = re.sub(
+                    r"\xad|&shy;|&#xad;|&#173;|\ufeff|\u2060|&NoBreak;",
+                    "",
+                    original_text,
+                    flags=re.I,
+                )
+                self.xhtml_texts[xhtml_path] = xhtml_text
+                if xhtml_text != original_text:
+                    self.modified_files[xhtml_path] = xhtml_text
                 for match_body in re.finditer(
                     r"<body.{3,}?</body>", xhtml_text, re.DOTALL
                 ):
@@ -151,7 +167,7 @@ class EPUB:
                         text = m.group(0)[1:-1]
                         yield unescape(text), (
                             match_body.start() + m.start() + 1,
-                            text,
+                            EscapedText(text),
                             xhtml_path,
                         )
 
@@ -162,31 +178,22 @@ class EPUB:
         book_quote: str,
         start: int,
         end: int,
-        xhtml_path: Path,
+        xhtml_path: str,
         origin_entity: str,
     ) -> None:
-        from rapidfuzz.fuzz import token_set_ratio
-        from rapidfuzz.process import extractOne
-        from rapidfuzz.utils import default_process
-
         if entity_data := self.entities.get(entity):
             entity_id = entity_data["id"]
             entity_data["count"] += 1
         elif entity not in self.custom_x_ray and (
-            r := extractOne(
-                entity,
-                self.entities.keys(),
-                score_cutoff=FUZZ_THRESHOLD,
-                scorer=partial(token_set_ratio, processor=default_process),
-            )
+            matched_name := self.entity_index.find(entity)
         ):
-            matched_name = r[0]
             matched_entity = self.entities[matched_name]
             matched_entity["count"] += 1
             entity_id = matched_entity["id"]
             if is_full_name(matched_name, matched_entity["label"], entity, ner_label):
                 self.entities[entity] = matched_entity
                 del self.entities[matched_name]
+                self.entity_index.replace(matched_name, entity)
         else:
             entity_id = self.entity_id
             self.entities[entity] = {
@@ -195,6 +202,7 @@ class EPUB:
                 "quote": book_quote,
                 "count": 1,
             }
+            self.entity_index.add(entity)
             self.entity_id += 1
 
         self.entity_occurrences[xhtml_path].append(
@@ -202,7 +210,7 @@ class EPUB:
         )
 
     def add_lemma(
-        self, lemma: str, start: int, end: int, xhtml_path: Path, origin_text: str
+        self, lemma: str, start: int, end: int, xhtml_path: str, origin_text: str
     ) -> None:
         self.entity_occurrences[xhtml_path].append((start, end, origin_text, lemma))
         if lemma not in self.lemmas:
@@ -226,8 +234,10 @@ class EPUB:
         lang: str,
         lemmas_conn: sqlite3.Connection | None,
         has_multiple_ipas: bool,
+        lemma_index: LemmaIndex | None = None,
     ) -> None:
         self.lemmas_conn = lemmas_conn
+        self.lemma_index = lemma_index
         self.prefs = prefs
         self.has_multiple_ipas = has_multiple_ipas
         if self.entities:
@@ -237,11 +247,13 @@ class EPUB:
             if prefs["minimal_x_ray_count"] > 1:
                 self.remove_entities(prefs["minimal_x_ray_count"])
             self.create_x_ray_footnotes(prefs, lang)
+        if self.lemmas:
+            self.resolve_glosses(lang)
         self.insert_anchor_elements(lang)
         if self.lemmas:
             self.create_word_wise_footnotes(lang)
         self.modify_opf()
-        self.zip_extract_folder()
+        self.write_epub()
         if self.mediawiki is not None:
             self.mediawiki.close()
         if self.wikidata is not None:
@@ -256,40 +268,37 @@ class EPUB:
             if self.entities and self.lemmas:
                 entity_list = sorted(entity_list, key=operator.itemgetter(0))
 
-            with xhtml_path.open(encoding="utf-8") as f:
-                xhtml_str = f.read()
-            new_xhtml_str = ""
+            xhtml_str = self.xhtml_texts[xhtml_path]
+            parts = []
             last_end = 0
             for start, end, entity, entity_id in entity_list:
                 if entity_id in self.removed_entity_ids:
                     continue
-                new_xhtml_str += xhtml_str[last_end:start]
+                parts.append(xhtml_str[last_end:start])
                 if isinstance(entity_id, int):
-                    new_xhtml_str += (
+                    parts.append(
                         f'<a epub:type="noteref" href="x_ray.xhtml#'
                         f'{entity_id}">{entity}</a>'
                     )
                 else:
-                    new_xhtml_str += self.build_word_wise_tag(entity_id, entity, lang)
+                    parts.append(self.build_word_wise_tag(entity_id, entity, lang))
                 last_end = end
-            new_xhtml_str += xhtml_str[last_end:]
-
-            # add epub namespace and Word Wise CSS
-            with xhtml_path.open("w", encoding="utf-8") as f:
-                if NAMESPACES["ops"] not in new_xhtml_str:
-                    new_xhtml_str = new_xhtml_str.replace(
-                        f'xmlns="{NAMESPACES["xml"]}"',
-                        f'xmlns="{NAMESPACES["xml"]}" '
-                        f'xmlns:epub="{NAMESPACES["ops"]}"',
-                    )
-                if self.lemmas:
-                    new_xhtml_str = new_xhtml_str.replace(
-                        "</head>",
-                        "<style>body {line-height: 2.5;} ruby "
-                        "{text-decoration:overline;} ruby a {text-decoration:none;}"
-                        "</style></head>",
-                    )
-                f.write(new_xhtml_str)
+            parts.append(xhtml_str[last_end:])
+
+            # add epub namespace and Word Wise CSS, anchors are after the head
+            if NAMESPACES["ops"] not in xhtml_str:
+                parts[0] = parts[0].replace(
+                    f'xmlns="{NAMESPACES["xml"]}"',
+                    f'xmlns="{NAMESPACES["xml"]}" xmlns:epub="{NAMESPACES["ops"]}"',
+                )
+            if self.lemmas:
+                parts[0] = parts[0].replace(
+                    "</head>",
+                    "<style>body {line-height: 2.5;} ruby "
+                    "{text-decoration:overline;} ruby a {text-decoration:none;}"
+                    "</style></head>",
+                )
+            self.modified_files[xhtml_path] = parts
 
     def build_word_wise_tag(self, word: str, origin_word: str, lang: str) -> str:
         if word not in self.lemmas:
@@ -314,11 +323,7 @@ class EPUB:
             )
 
     def split_p_tags(self, intro: str) -> str:
-        intro = escape(intro)
-        p_tags = ""
-        for p_str in intro.splitlines():
-            p_tags += f"<p>{p_str}</p>"
-        return p_tags
+        return "".join(f"<p>{p_str}</p>" for p_str in escape(intro).splitlines())
 
     def create_x_ray_footnotes(self, prefs: Prefs, lang: str) -> None:
         if self.mediawiki is None:  # just let mypy know it's not None
@@ -328,18 +333,12 @@ class EPUB:
         if self.xhtml_href_has_folder:
             image_prefix += "../"
         if self.image_href_has_folder:
-            image_prefix += f"{self.image_folder.name}/"
-        s = f"""
-        <html xmlns="http://www.w3.org/1999/xhtml"
-        xmlns:epub="http://www.idpf.org/2007/ops"
-        lang="{lang}" xml:lang="{lang}">
-        <head><title>X-Ray</title><meta charset="utf-8"/></head>
-        <body>
-        """
+            image_prefix += f"{posixpath.basename(self.image_folder)}/"
+        parts = [footnotes_header("X-Ray", lang)]
         for entity, data in self.entities.items():
             if custom_data := self.custom_x_ray.get(entity):
                 custom_desc, custom_source_id, _ = custom_data
-                s += (
+                parts.append(
                     f'<aside id="{data["id"]}" epub:type="footnote">'
                     f"{self.split_p_tags(custom_desc)}"
                 )
@@ -348,23 +347,25 @@ class EPUB:
                         custom_source_id, prefs, lang
                     )
                     if custom_source_link:
-                        s += (
+                        parts.append(
                             f'<p>Source: <a href="{custom_source_link}{quote(entity)}'
                             f'">{custom_source_name}</a></p>'
                         )
                     else:
-                        s += f"<p>Source: {custom_source_name}</p>"
-                s += "</aside>"
+                        parts.append(f"<p>Source: {custom_source_name}</p>")
+                parts.append("</aside>")
             elif (prefs["search_people"] or data["label"] not in PERSON_LABELS) and (
                 intro_cache := self.mediawiki.get_cache(entity)
             ):
-                s += f'<aside id="{data["id"]}" epub:type="footnote">'
-                s += self.split_p_tags(
-                    intro_cache
-                    if isinstance(intro_cache, str)
-                    else intro_cache["intro"]
+                parts.append(f'<aside id="{data["id"]}" epub:type="footnote">')
+                parts.append(
+                    self.split_p_tags(
+                        intro_cache
+                        if isinstance(intro_cache, str)
+                        else intro_cache["intro"]
+                    )
                 )
-                s += (
+                parts.append(
                     f'<p>Source: <a href="{source_link}{quote(entity)}">'
                     f"{source_name}</a></p>"
                 )
@@ -373,73 +374,66 @@ class EPUB:
                 ):
                     add_wikidata_source = False
                     if inception := wikidata_cache.get("inception"):
-                        s += f"<p>{inception_text(inception)}</p>"
+                        parts.append(f"<p>{inception_text(inception)}</p>")
                         add_wikidata_source = True
                     if self.wiki_commons and (
                         filename := wikidata_cache.get("map_filename")
                     ):
                         file_path = self.wiki_commons.get_image(filename)
                         if file_path is not None:
-                            s += (
+                            parts.append(
                                 '<img style="max-width:100%" src="'
                                 f'{image_prefix}{filename}" />'
                             )
-                            shutil.copy(file_path, self.image_folder.joinpath(filename))
+                            self.modified_files[
+                                posixpath.join(self.image_folder, filename)
+                            ] = file_path
                             self.image_filenames.add(filename)
                             add_wikidata_source = True
                     if add_wikidata_source:
-                        s += (
+                        parts.append(
                             '<p>Source: <a href="https://www.wikidata.org/wiki/'
                             f'{intro_cache["item_id"]}">Wikidata</a></p>'
                         )
-                s += "</aside>"
+                parts.append("</aside>")
             else:
-                s += (
+                parts.append(
                     f'<aside id="{data["id"]}" epub:type="footnote"><p>'
                     f'{escape(data["quote"])}</p></aside>'
                 )
 
-        s += "</body></html>"
-        with self.xhtml_folder.joinpath("x_ray.xhtml").open("w", encoding="utf-8") as f:
-            f.write(s)
+        parts.append("</body></html>")
+        self.modified_files[posixpath.join(self.xhtml_folder, "x_ray.xhtml")] = parts
 
     def create_word_wise_footnotes(self, lang: str) -> None:
-        s = f"""
-        <html xmlns="http://www.w3.org/1999/xhtml"
-        xmlns:epub="http://www.idpf.org/2007/ops"
-        lang="{lang}" xml:lang="{lang}">
-        <head><title>Word Wise</title><meta charset="utf-8"/></head>
-        <body>
-        """
+        parts = [footnotes_header("Word Wise", lang)]
         for lemma, lemma_id in self.lemmas.items():
-            s += self.create_ww_aside_tag(lemma, lemma_id, lang)
-        s += "</body></html>"
-        with self.xhtml_folder.joinpath("word_wise.xhtml").open(
-            "w", encoding="utf-8"
-        ) as f:
-            f.write(s)
-
-    def create_ww_aside_tag(self, lemma: str, lemma_id: int, lemma_lang: str) -> str:
+            self.create_ww_aside_tag(parts, lemma, lemma_id, lang)
+        parts.append("</body></html>")
+        ww_path = posixpath.join(self.xhtml_folder, "word_wise.xhtml")
+        self.modified_files[ww_path] = parts
+
+    def create_ww_aside_tag(
+        self, parts: list[str], lemma: str, lemma_id: int, lemma_lang: str
+    ) -> None:
         data = self.get_lemma_gloss(lemma, lemma_lang)
-        tag_str = ""
         added_ipa = False
-        tag_str += f'<aside id="{lemma_id}" epub:type="footnote">'
+        parts.append(f'<aside id="{lemma_id}" epub:type="footnote">')
         if self.prefs["use_pos"]:
             lemma, pos = lemma.rsplit("_", 1)
-            tag_str += f"<p>{pos}</p>"
+            parts.append(f"<p>{pos}</p>")
         for _, full_def, example, ipa in data:
             if ipa and not added_ipa:
-                tag_str += f"<p>{escape(ipa)}</p>"
+                parts.append(f"<p>{escape(ipa)}</p>")
                 added_ipa = True
-            tag_str += f"<p>{escape(full_def)}</p>"
+            parts.append(f"<p>{escape(full_def)}</p>")
             if example:
-                tag_str += f"<p><i>{escape(example)}</i></p>"
-            tag_str += "<hr/>"
-        tag_str += (
+                parts.append(f"<p><i>{escape(example)}</i></p>")
+            parts.append("<hr/>")
+        parts.append(
             f"<p>Source: <a href='https://en.wiktionary.org/wiki/"
             f"{quote(lemma)}'>Wiktionary</a></p></aside>"
         )
-        return tag_str
 
     def modify_opf(self) -> None:
         from lxml import etree
@@ -447,9 +441,9 @@ class EPUB:
         xhtml_prefix = ""
         image_prefix = ""
         if self.xhtml_href_has_folder:
-            xhtml_prefix = f"{self.xhtml_folder.name}/"
+            xhtml_prefix = f"{posixpath.basename(self.xhtml_folder)}/"
         if self.image_href_has_folder:
-            image_prefix = f"{self.image_folder.name}/"
+            image_prefix = f"{posixpath.basename(self.image_folder)}/"
         manifest = self.opf_root.find("opf:manifest", NAMESPACES)
         if self.entities:
             s = (
@@ -485,34 +479,172 @@ class EPUB:
             spine.append(etree.fromstring('<itemref idref="x_ray.xhtml"/>'))
         if self.lemmas:
             spine.append(etree.fromstring('<itemref idref="word_wise.xhtml"/>'))
-        with self.opf_path.open("w", encoding="utf-8") as f:
-            f.write(etree.tostring(self.opf_root, encoding=str))
-
-    def zip_extract_folder(self) -> None:
-        shutil.make_archive(str(self.extract_folder), "zip", self.extract_folder)
-        self.extract_folder.with_suffix(".zip").replace(self.book_path)
-        shutil.rmtree(self.extract_folder)
+        self.modified_files[self.opf_path] = etree.tostring(self.opf_root, encoding=str)
+
+    def write_epub(self) -> None:
+        "Write the new EPUB file in one pass then replace the book file"
+        tmp_path = self.book_path.with_name(f"{self.book_path.name}.tmp")
+        with (
+            zipfile.ZipFile(self.book_path) as src_zf,
+            zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as dest_zf,
+        ):
+            for info in src_zf.infolist():
+                if info.filename in self.modified_files:
+                    write_zip_member(
+                        dest_zf, info, self.modified_files.pop(info.filename)
+                    )
+                elif info.flag_bits & 0x1:  # encrypted
+                    dest_zf.writestr(info, src_zf.read(info))
+                else:
+                    copy_zip_member(src_zf, dest_zf, info)
+            for name, data in self.modified_files.items():
+                write_zip_member(dest_zf, zipfile.ZipInfo(name), data)
+        tmp_path.replace(self.book_path)
 
-    def get_lemma_gloss(self, lemma: str, lang: str) -> list[tuple[str, str, str, str]]:
+    def gloss_select_sql(self, lang: str) -> str:
         select_sql = "SELECT short_def, full_def, example, "
         if self.has_multiple_ipas:
             select_sql += self.prefs[f"{lang}_ipa"]
         else:
             select_sql += "ipa"
-        select_sql += " FROM senses JOIN lemmas ON senses.lemma_id = lemmas.id "
+        return select_sql + " FROM senses JOIN lemmas ON senses.lemma_id = lemmas.id "
+
+    def get_lemma_gloss(self, lemma: str, lang: str) -> list[tuple[str, str, str, str]]:
+        if lemma not in self.glosses:
+            self.glosses[lemma] = self.query_lemma_gloss(lemma, lang)
+        return self.glosses[lemma]
+
+    def resolve_glosses(self, lang: str) -> None:
+        """
+        Query glosses of all lemmas with a temporary table, same results as
+        `query_gloss_with_pos` and `query_gloss_without_pos`. Rows are ordered
+        like queries of one lemma use the lemma and form indexes.
+        """
+        if self.lemmas_conn is None or self.lemma_index is not None:
+            return
+        keys: dict[str, tuple[str, str | None]] = {}
+        for lemma in self.lemmas:
+            if self.prefs["use_pos"]:
+                word, pos = lemma.rsplit("_", 1)
+                keys[lemma] = (word, spacy_to_wiktionary_pos(pos))
+            else:
+                keys[lemma] = (lemma, None)
+            self.glosses[lemma] = []
+
+        self.lemmas_conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS gloss_keys "
+            "(gloss_key TEXT, key_lemma TEXT, key_pos TEXT)"
+        )
+        select_sql = self.gloss_select_sql(lang).replace(
+            "SELECT ", "SELECT gloss_key, ", 1
+        )
+        forms_sql = (
+            "JOIN forms "
+            "ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos "
+        )
+        if self.prefs["use_pos"]:
+            self.query_glosses_by_keys(
+                select_sql
+                + "JOIN gloss_keys ON lemma = key_lemma AND senses.pos = key_pos "
+                + "ORDER BY lemmas.id, senses.id",
+                keys,
+            )
+            self.query_glosses_by_keys(
+                select_sql
+                + forms_sql
+                + "JOIN gloss_keys ON form = key_lemma "
+                + "ORDER BY forms.rowid, senses.id",
+                {key: value for key, value in keys.items() if " " in value[0]},
+            )
+            if lang == "zh":
+                self.query_glosses_by_keys(
+                    select_sql
+                    + forms_sql
+                    + "JOIN gloss_keys ON form = key_lemma AND forms.pos = key_pos "
+                    + "ORDER BY forms.rowid, senses.id",
+                    {key: value for key, value in keys.items() if " " not in value[0]},
+                )
+        else:
+            self.query_glosses_by_keys(
+                select_sql
+                + "JOIN gloss_keys ON lemma = key_lemma WHERE enabled = 1 "
+                + "ORDER BY lemmas.id, senses.id",
+                keys,
+                True,
+            )
+            self.query_glosses_by_keys(
+                select_sql
+                + forms_sql
+                + "JOIN gloss_keys ON form = key_lemma WHERE enabled = 1 "
+                + "ORDER BY forms.rowid, senses.id",
+                keys,
+                True,
+            )
+        self.lemmas_conn.execute("DELETE FROM gloss_keys")
+        self.lemmas_conn.commit()
+
+    def query_glosses_by_keys(
+        self, sql: str, keys: dict[str, tuple[str, str | None]], first_row=False
+    ) -> None:
+        "Only query lemmas don't have glosses"
+        conn: sqlite3.Connection = self.lemmas_conn  # type: ignore
+        conn.execute("DELETE FROM gloss_keys")
+        conn.executemany(
+            "INSERT INTO gloss_keys VALUES(?, ?, ?)",
+            (
+                (key, lemma, pos)
+                for key, (lemma, pos) in keys.items()
+                if not self.glosses[key]
+            ),
+        )
+        found_keys = set()
+        for key, *data in conn.execute(sql):
+            if first_row and key in found_keys:
+                continue
+            self.glosses[key].append(tuple(data))  # type: ignore
+            found_keys.add(key)
+
+    def query_lemma_gloss(
+        self, lemma: str, lang: str
+    ) -> list[tuple[str, str, str, str]]:
+        select_sql = self.gloss_select_sql(lang)
         if self.prefs["use_pos"]:
             lemma, pos = lemma.rsplit("_", 1)
             pos = spacy_to_wiktionary_pos(pos)
+            if self.lemma_index is not None:
+                return self.query_gloss_by_ids(
+                    select_sql,
+                    self.lemma_index.gloss_sense_ids_with_pos(lemma, pos, lang),
+                )
             return self.query_gloss_with_pos(select_sql, lemma, pos, lang)
+        elif self.lemma_index is not None:
+            return self.query_gloss_by_ids(
+                select_sql, self.lemma_index.gloss_sense_ids_without_pos(lemma)
+            )
         else:
             return self.query_gloss_without_pos(select_sql, lemma)
 
+    def query_gloss_by_ids(
+        self, sql: str, sense_ids: list[int]
+    ) -> list[tuple[str, str, str, str]]:
+        if not sense_ids:
+            return []
+        glosses = {
+            sense_id: data
+            for sense_id, *data in self.lemmas_conn.execute(  # type: ignore
+                sql.replace("SELECT ", "SELECT senses.id, ", 1)
+                + f"WHERE senses.id IN ({', '.join('?' * len(sense_ids))})",
+                sense_ids,
+            )
+        }
+        return [tuple(glosses[sense_id]) for sense_id in sense_ids]  # type: ignore
+
     def query_gloss_with_pos(
         self, sql: str, lemma: str, pos: str, lang: str
     ) -> list[tuple[str, str, str, str]]:
         lemmas_data = []
         for data in self.lemmas_conn.execute(  # type: ignore
-            sql + "WHERE lemma = ? AND pos = ?", (lemma, pos)
+            sql + "WHERE lemma = ? AND pos = ? ORDER BY senses.id", (lemma, pos)
         ):
             lemmas_data.append(data)
         if lemmas_data:
@@ -523,7 +655,7 @@ class EPUB:
                 sql
                 + "JOIN forms ON "
                 + "senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos "
-                + "WHERE form = ?",
+                + "WHERE form = ? ORDER BY forms.rowid, senses.id",
                 (lemma,),
             ):
                 lemmas_data.append(data)
@@ -532,7 +664,8 @@ class EPUB:
                 sql
                 + "JOIN forms "
                 + "ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos "
-                + "WHERE form = ? AND forms.pos = ?",
+                + "WHERE form = ? AND forms.pos = ? "
+                + "ORDER BY forms.rowid, senses.id",
                 (lemma, pos),
             ):
                 lemmas_data.append(data)
@@ -542,20 +675,83 @@ class EPUB:
         self, sql: str, lemma: str
     ) -> list[tuple[str, str, str, str]]:
         for data in self.lemmas_conn.execute(  # type: ignore
-            sql + " WHERE lemma = ? AND enabled = 1 LIMIT 1", (lemma,)
+            sql + " WHERE lemma = ? AND enabled = 1 ORDER BY senses.id LIMIT 1",
+            (lemma,),
         ):
             return [data]
         for data in self.lemmas_conn.execute(  # type: ignore
             sql
             + "JOIN forms "
             + "ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos "
-            + "WHERE form = ? AND enabled = 1 LIMIT 1",
+            + "WHERE form = ? AND enabled = 1 "
+            + "ORDER BY forms.rowid, senses.id LIMIT 1",
             (lemma,),
         ):
             return [data]
         return []
 
 
+def footnotes_header(title: str, lang: str) -> str:
+    return f"""
+        <html xmlns="http://www.w3.org/1999/xhtml"
+        xmlns:epub="http://www.idpf.org/2007/ops"
+        lang="{lang}" xml:lang="{lang}">
+        <head><title>{title}</title><meta charset="utf-8"/></head>
+        <body>
+        """
+
+
+def write_zip_member(
+    zf: zipfile.ZipFile, info: zipfile.ZipInfo, data: list[str] | str | bytes | Path
+) -> None:
+    "Parts of a list are written without joining them"
+    info.compress_type = zipfile.ZIP_DEFLATED
+    if isinstance(data, list):
+        # keep "\r\n" line endings, the same as `writestr`
+        with (
+            zf.open(info, "w") as f,
+            io.TextIOWrapper(f, encoding="utf-8", newline="") as text_f,
+        ):
+            text_f.writelines(data)
+    elif isinstance(data, Path):
+        with zf.open(info, "w") as f, data.open("rb") as src_f:
+            shutil.copyfileobj(src_f, f)
+    else:
+        zf.writestr(info, data)
+
+
+def copy_zip_member(
+    src_zf: zipfile.ZipFile, dest_zf: zipfile.ZipFile, info: zipfile.ZipInfo
+) -> None:
+    """
+    Copy compressed data of a member, `ZipFile` doesn't have API for this.
+    Same as how `ZipFile.mkdir` writes a member, so it depends on the private
+    `ZipFile` attributes `fp`, `start_dir`, `filelist`, `NameToInfo` and
+    `_didModify`. `tests/test_epub.py` checks the copied members.
+    """
+    src_fp = src_zf.fp
+    src_fp.seek(info.header_offset)  # type: ignore
+    header = src_fp.read(zipfile.sizeFileHeader)  # type: ignore
+    filename_len, extra_len = struct.unpack("<HH", header[26:30])
+    src_fp.seek(  # type: ignore
+        info.header_offset + zipfile.sizeFileHeader + filename_len + extra_len
+    )
+    raw_data = src_fp.read(info.compress_size)  # type: ignore
+
+    new_info = copy.copy(info)
+    new_info.extra = b""
+    new_info.flag_bits &= ~0x08  # sizes are in the local header, no data descriptor
+    dest_zf.fp.seek(dest_zf.start_dir)  # type: ignore
+    new_info.header_offset = dest_zf.start_dir
+    dest_zf.fp.write(new_info.FileHeader())  # type: ignore
+    dest_zf.fp.write(raw_data)  # type: ignore
+    dest_zf.filelist.append(new_info)
+    dest_zf.NameToInfo[new_info.filename] = new_info
+    dest_zf.start_dir = dest_zf.fp.tell()  # type: ignore
+    # write the central directory when closing
+    dest_zf._didModify = True
+
+
 def spacy_to_wiktionary_pos(pos: str) -> str:
     # spaCy POS: https://universaldependencies.org/u/pos
     # Wiktioanry POS: https://github.com/tatuylonen/wiktextract/blob/master/wiktextract/data/en/pos_subtitles.json
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import re
+from html import unescape
+from html.entities import html5
+from itertools import accumulate
+
+# same pattern as `html.unescape`
+CHARREF = re.compile(r"&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)")
+
+
+class EscapedText:
+    """
+    HTML text node and offset tables that map each character of the unescaped
+    text to the escaped text, and the escaped text to its encoded bytes.
+    """
+
+    def __init__(self, text: str, codec: str = "") -> None:
+        self.text = text
+        self.codec = codec
+        # escaped start and end offsets of each unescaped character
+        self.starts: list[int] | None = None
+        self.ends: list[int] | None = None
+        self.byte_offsets: list[int] | None = None
+        # tables are created on first use, most text nodes are never converted
+        self.has_char_tables = False
+        self.has_byte_table = False
+
+    def create_char_tables(self) -> None:
+        self.has_char_tables = True
+        text = self.text
+        if "&" in text:
+            self.starts = []
+            self.ends = []
+            last_end = 0
+            for m in CHARREF.finditer(text):
+                self.add_chars(last_end, m.start())
+                ref = m.group(0)
+                replacement = unescape(ref)
+                # unknown or partly matched references keep some characters,
+                # whole references like "&semi;" may end with their replacement
+                suffix_len = 0
+                if ref[1] != "#" and ref[1:] not in html5:
+                    while (
+                        suffix_len < min(len(ref), len(replacement))
+                        and ref[-suffix_len - 1] == replacement[-suffix_len - 1]
+                    ):
+                        suffix_len += 1
+                suffix_start = m.end() - suffix_len
+                replaced_len = len(replacement) - suffix_len
+                self.starts.extend([m.start()] * replaced_len)
+                self.ends.extend([suffix_start] * replaced_len)
+                self.add_chars(suffix_start, m.end())
+                last_end = m.end()
+            self.add_chars(last_end, len(text))
+
+    def create_byte_table(self) -> None:
+        self.has_byte_table = True
+        if self.codec and not self.text.isascii():
+            self.byte_offsets = list(
+                accumulate((len(c.encode(self.codec)) for c in self.text), initial=0)
+            )
+
+    def add_chars(self, start: int, end: int) -> None:
+        self.starts.extend(range(start, end))  # type: ignore
+        self.ends.extend(range(start + 1, end + 1))  # type: ignore
+
+    def escaped_range(self, start: int, end: int) -> tuple[int, int]:
+        "Convert unescaped text range to escaped text range"
+        if not self.has_char_tables:
+            self.create_char_tables()
+        if self.starts is None or self.ends is None:
+            return start, end
+        return self.starts[start], self.ends[end - 1]
+
+    def byte_offset(self, index: int) -> int:
+        "Convert escaped text offset to encoded bytes offset"
+        if not self.has_byte_table:
+            self.create_byte_table()
+        return index if self.byte_offsets is None else self.byte_offsets[index]
@@ -1,61 +1,45 @@
 #!/usr/bin/env python3
 
+from bisect import bisect_right
 from collections import namedtuple
-from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable
 
 Interval = namedtuple("Interval", ["low", "high"])
 
 
-@dataclass
-class Node:
-    interval = Interval(0, 0)
-    max_high = 0
-    left: Optional["Node"] = None
-    right: Optional["Node"] = None
+class IntervalIndex:
+    """
+    Closed intervals sorted by low end. `max_highs[i]` is the largest high end
+    of the first i + 1 intervals and `max_high_indexes[i]` is its position.
+    """
 
-
-class IntervalTree:
     def __init__(self) -> None:
-        self.root: Node | None = None
-
-    def check_overlap(self, interval_a: Interval, interval_b: Interval) -> bool:
-        return interval_a.low <= interval_b.high and interval_a.high >= interval_b.low
-
-    def insert(self, node: Node | None, interval: Interval) -> Node:
-        if node is None:
-            new_node = Node()
-            new_node.interval = interval
-            new_node.max_high = interval.high
-            if self.root is None:
-                self.root = new_node
-            return new_node
-
-        if interval.low < node.interval.low:
-            node.left = self.insert(node.left, interval)
-        else:
-            node.right = self.insert(node.right, interval)
-
-        if node.max_high < interval.high:
-            node.max_high = interval.high
-
-        return node
-
-    def insert_intervals(self, intervals: Interval) -> None:
-        for interval in intervals:
-            self.insert(self.root, interval)
+        self.intervals: list[Interval] = []
+        self.lows: list[int] = []
+        self.max_highs: list[int] = []
+        self.max_high_indexes: list[int] = []
+
+    @classmethod
+    def build(cls, intervals: Iterable[Interval]) -> "IntervalIndex":
+        index = cls()
+        index.intervals = sorted(intervals)
+        index.lows = [interval.low for interval in index.intervals]
+        for i, interval in enumerate(index.intervals):
+            if i == 0 or interval.high > index.max_highs[-1]:
+                index.max_highs.append(interval.high)
+                index.max_high_indexes.append(i)
+            else:
+                index.max_highs.append(index.max_highs[-1])
+                index.max_high_indexes.append(index.max_high_indexes[-1])
+        return index
+
+    def __len__(self) -> int:
+        return len(self.intervals)
 
     def is_overlap(self, interval: Interval) -> Interval | None:
-        return self.search_overlap(self.root, interval)
-
-    def search_overlap(self, node: Node | None, interval: Interval) -> Interval | None:
-        if node is None:
-            return None
-
-        if self.check_overlap(node.interval, interval):
-            return node.interval
-
-        if node.left and node.left.max_high >= interval.low:
-            return self.search_overlap(node.left, interval)
-
-        return self.search_overlap(node.right, interval)
+        "Return an interval overlaps with `interval`"
+        # intervals start before `interval` ends
+        end = bisect_right(self.lows, interval.high)
+        if end > 0 and self.max_highs[end - 1] >= interval.low:
+            return self.intervals[self.max_high_indexes[end - 1]]
+        return None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""
+KFX content records packed in one bytes object: it's sent to the worker
+process unchanged and records are read from it when needed instead of
+keeping a dict of every content fragment.
+
+A record is a header of position, type and content size in bytes followed by
+the UTF-8 encoded content.
+"""
+
+import json
+import struct
+from collections import namedtuple
+from typing import Any, Iterator
+
+KFXRecord = namedtuple("KFXRecord", ["position", "content", "type"])
+RECORD_HEADER = struct.Struct(">QBI")
+TEXT_RECORD = 1
+IMAGE_RECORD = 2
+
+
+def pack_kfx_content(json_content: str) -> bytes:
+    """
+    Pack the records of `YJ_Book.convert_to_json_content()`. Records are
+    packed when they are decoded, the list of records only has `None`.
+    """
+    parts = []
+
+    def pack_record(obj: dict[str, Any]) -> Any:
+        if obj.keys() >= {"position", "content", "type"}:
+            content = obj["content"].encode("utf-8")
+            parts.append(RECORD_HEADER.pack(obj["position"], obj["type"], len(content)))
+            parts.append(content)
+            return None
+        return obj
+
+    json.loads(json_content, object_hook=pack_record)
+    return b"".join(parts)
+
+
+def iter_record_ranges(kfx_content: bytes) -> Iterator[tuple[int, int, int, int]]:
+    "Yield position, type, start and end offsets of the encoded content"
+    offset = 0
+    while offset < len(kfx_content):
+        position, record_type, size = RECORD_HEADER.unpack_from(kfx_content, offset)
+        offset += RECORD_HEADER.size
+        yield position, record_type, offset, offset + size
+        offset += size
+
+
+def iter_kfx_content(kfx_content: bytes) -> Iterator[KFXRecord]:
+    for position, record_type, start, end in iter_record_ranges(kfx_content):
+        yield KFXRecord(position, kfx_content[start:end].decode("utf-8"), record_type)
+
+
+def kfx_content_end(kfx_content: bytes) -> int:
+    "Position after the last record"
+    last_range = None
+    for last_range in iter_record_ranges(kfx_content):
+        pass
+    if last_range is None:
+        return 0
+    position, _, start, end = last_range
+    return position + len(kfx_content[start:end].decode("utf-8"))
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+"""
+Lemma lookup tables of the Kindle or Wiktionary lemmas database, saved to a
+file next to the database that is opened with mmap. The file is rebuilt when
+the database's modification time changes.
+"""
+
+import json
+import mmap
+import os
+import re
+import sqlite3
+import string
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+INDEX_MAGIC = b"WDLEMMA1"
+INDEX_HEADER = struct.Struct("<8sQ")
+NULL_DIFFICULTY = -(2**31)
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+TABLES = ("lemma", "form", "lemma_pos")
+
+# loaded indexes of this process
+LEMMA_INDEXES: dict[Path, "LemmaIndex"] = {}
+
+
+def lemma_index_path(db_path: Path) -> Path:
+    return db_path.with_suffix(".index")
+
+
+def is_nocase_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ):
+        return re.search(rf"\b{column}\b[^,]*\bCOLLATE\s+NOCASE", sql, re.I) is not None
+    return False
+
+
+class KeyTable:
+    "Sorted UTF-8 keys, can be used with `bisect`"
+
+    def __init__(self, keys: memoryview, offsets: memoryview) -> None:
+        self.keys = keys
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> bytes:
+        return self.keys[self.offsets[index] : self.offsets[index + 1]].tobytes()
+
+
+class LemmaIndex:
+    """
+    Map lemma, form and (lemma, POS) to sense records, records are
+    ordered by sense id like the SQL queries' results.
+    """
+
+    def __init__(self, buffer: memoryview | mmap.mmap) -> None:
+        self.buffer = memoryview(buffer)  # type: ignore
+        magic, header_len = INDEX_HEADER.unpack_from(self.buffer)
+        if magic != INDEX_MAGIC:
+            raise ValueError("Invalid lemma index file")
+        header = json.loads(
+            self.buffer[INDEX_HEADER.size : INDEX_HEADER.size + header_len].tobytes()
+        )
+        self.db_mtime: int = header["db_mtime"]
+        self.byteorder: str = header["byteorder"]
+        self.pos_list: list[str] = header["pos"]
+        self.nocase: dict[str, bool] = header["nocase"]
+        arrays = {
+            name: self.buffer[offset : offset + length].cast(typecode)
+            for name, (offset, length, typecode) in header["arrays"].items()
+        }
+        self.sense_ids = arrays["sense_id"]
+        self.difficulties = arrays["difficulty"]
+        self.enabled = arrays["enabled"]
+        self.record_pos = arrays["pos"]
+        self.tables = {
+            table: (
+                KeyTable(arrays[f"{table}_keys"], arrays[f"{table}_key_offsets"]),
+                arrays[f"{table}_record_offsets"],
+                arrays[f"{table}_records"],
+            )
+            for table in TABLES
+        }
+
+    @classmethod
+    def from_file(cls, path: Path) -> "LemmaIndex":
+        with path.open("rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def fold(self, text: str, column: str) -> str:
+        # SQLite's NOCASE collation only folds ASCII characters
+        return text.translate(ASCII_LOWER) if self.nocase[column] else text
+
+    def find(self, table: str, key: str) -> memoryview:
+        "Return record numbers of the key"
+        keys, record_offsets, records = self.tables[table]
+        key_bytes = key.encode("utf-8")
+        index = bisect_left(keys, key_bytes)
+        if index < len(keys) and keys[index] == key_bytes:
+            return records[record_offsets[index] : record_offsets[index + 1]]
+        return records[0:0]
+
+    def lemma_records(self, lemma: str) -> memoryview:
+        return self.find("lemma", self.fold(lemma, "lemma"))
+
+    def form_records(self, form: str) -> memoryview:
+        return self.find("form", self.fold(form, "form"))
+
+    def lemma_pos_records(self, lemma: str, pos: str) -> memoryview:
+        return self.find("lemma_pos", f"{self.fold(lemma, 'lemma')}\0{pos}")
+
+    def sense_data(self, record: int) -> tuple[int | None, int]:
+        difficulty = self.difficulties[record]
+        return (
+            None if difficulty == NULL_DIFFICULTY else difficulty,
+            self.sense_ids[record],
+        )
+
+    def has_pos(self, record: int, pos: str) -> bool:
+        return self.pos_list[self.record_pos[record]] == pos
+
+    def kindle_data_with_pos(
+        self, lemma: str, pos: str, lemma_lang: str
+    ) -> tuple[int | None, int] | None:
+        for record in self.lemma_pos_records(lemma, pos):
+            return self.sense_data(record)
+        if " " in lemma:
+            for record in self.form_records(lemma):
+                return self.sense_data(record)
+        if lemma_lang == "zh":  # Check simplified form
+            for record in self.form_records(lemma):
+                if self.has_pos(record, pos):
+                    return self.sense_data(record)
+        return None
+
+    def kindle_data_without_pos(self, lemma: str) -> tuple[int | None, int] | None:
+        for records in (self.lemma_records(lemma), self.form_records(lemma)):
+            for record in records:
+                if self.enabled[record]:
+                    return self.sense_data(record)
+        return None
+
+    def gloss_sense_ids_with_pos(self, lemma: str, pos: str, lang: str) -> list[int]:
+        sense_ids = [self.sense_ids[r] for r in self.lemma_pos_records(lemma, pos)]
+        if sense_ids:
+            return sense_ids
+        if " " in lemma:
+            return [self.sense_ids[r] for r in self.form_records(lemma)]
+        elif lang == "zh":
+            return [
+                self.sense_ids[r]
+                for r in self.form_records(lemma)
+                if self.has_pos(r, pos)
+            ]
+        return []
+
+    def gloss_sense_ids_without_pos(self, lemma: str) -> list[int]:
+        data = self.kindle_data_without_pos(lemma)
+        return [] if data is None else [data[1]]
+
+
+def build_lemma_index(conn: sqlite3.Connection, db_mtime: int) -> bytes:
+    nocase = {
+        "lemma": is_nocase_column(conn, "lemmas", "lemma"),
+        "form": is_nocase_column(conn, "forms", "form"),
+    }
+
+    def fold(text: str, column: str) -> str:
+        return text.translate(ASCII_LOWER) if nocase[column] else text
+
+    arrays: dict[str, array] = {
+        "sense_id": array("q"),
+        "difficulty": array("i"),
+        "enabled": array("b"),
+        "pos": array("B"),
+    }
+    pos_ids: dict[str, int] = {}
+    sense_records: dict[int, int] = {}
+    entries: dict[str, dict[str, list[int]]] = {
+        table: defaultdict(list) for table in TABLES
+    }
+    for sense_id, difficulty, enabled, pos, lemma in conn.execute(
+        """
+        SELECT senses.id, difficulty, enabled, pos, lemma
+        FROM senses JOIN lemmas ON senses.lemma_id = lemmas.id
+        ORDER BY senses.id
+        """
+    ):
+        record = len(arrays["sense_id"])
+        sense_records[sense_id] = record
+        arrays["sense_id"].append(sense_id)
+        arrays["difficulty"].append(
+            NULL_DIFFICULTY if difficulty is None else difficulty
+        )
+        arrays["enabled"].append(1 if enabled else 0)
+        arrays["pos"].append(pos_ids.setdefault(pos, len(pos_ids)))
+        entries["lemma"][fold(lemma, "lemma")].append(record)
+        entries["lemma_pos"][f"{fold(lemma, 'lemma')}\0{pos}"].append(record)
+
+    for form, sense_id in conn.execute(
+        """
+        SELECT form, senses.id
+        FROM senses JOIN forms
+        ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos
+        ORDER BY forms.rowid, senses.id
+        """
+    ):
+        entries["form"][fold(form, "form")].append(sense_records[sense_id])
+
+    for table, table_entries in entries.items():
+        keys = bytearray()
+        key_offsets = array("I", [0])
+        record_offsets = array("I", [0])
+        records = array("I")
+        encoded_keys = sorted((k.encode("utf-8"), v) for k, v in table_entries.items())
+        for key, key_records in encoded_keys:
+            keys.extend(key)
+            key_offsets.append(len(keys))
+            records.extend(key_records)
+            record_offsets.append(len(records))
+        arrays[f"{table}_keys"] = array("B", keys)
+        arrays[f"{table}_key_offsets"] = key_offsets
+        arrays[f"{table}_record_offsets"] = record_offsets
+        arrays[f"{table}_records"] = records
+
+    # header size changes the offsets, so compute them after a first pass
+    header: dict = {
+        "db_mtime": db_mtime,
+        "byteorder": sys.byteorder,
+        "pos": list(pos_ids),
+        "nocase": nocase,
+        "arrays": {},
+    }
+    header_len = 0
+    for _ in range(2):
+        offset = align(INDEX_HEADER.size + header_len)
+        for name, data in arrays.items():
+            length = len(data) * data.itemsize
+            header["arrays"][name] = [offset, length, data.typecode]
+            offset = align(offset + length)
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_len = len(header_bytes) + 16  # room for larger offsets
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    buffer = bytearray(INDEX_HEADER.pack(INDEX_MAGIC, len(header_bytes)))
+    buffer.extend(header_bytes)
+    for name, data in arrays.items():
+        buffer.extend(b"\0" * (header["arrays"][name][0] - len(buffer)))
+        buffer.extend(data.tobytes())
+    return bytes(buffer)
+
+
+def align(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+def load_lemma_index(db_path: Path, conn: sqlite3.Connection) -> LemmaIndex | None:
+    "Return `None` if the index can't be created, use SQL queries instead"
+    db_mtime = db_path.stat().st_mtime_ns
+    index = LEMMA_INDEXES.get(db_path)
+    if index is not None and index.db_mtime == db_mtime:
+        return index
+
+    index_path = lemma_index_path(db_path)
+    index = None
+    if index_path.exists():
+        try:
+            index = LemmaIndex.from_file(index_path)
+        except (OSError, ValueError, KeyError, IndexError, TypeError, struct.error):
+            # truncated or corrupted file, rebuild it
+            index = None
+        if index is not None and (
+            index.db_mtime != db_mtime or index.byteorder != sys.byteorder
+        ):
+            index = None
+
+    if index is None:
+        try:
+            data = build_lemma_index(conn, db_mtime)
+        except sqlite3.Error:
+            return None
+        tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, index_path)
+            index = LemmaIndex.from_file(index_path)
+        except OSError:
+            # the old file is still mapped by another process on Windows
+            # or the folder is read-only
+            tmp_path.unlink(missing_ok=True)
+            index = LemmaIndex(memoryview(data))
+
+    LEMMA_INDEXES[db_path] = index
+    return index
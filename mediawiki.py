@@ -1,62 +1,142 @@
 #!/usr/bin/env python3
 
-import sqlite3
+import os
+import threading
+import time
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from functools import partial
 from pathlib import Path
-from typing import TypedDict
+from typing import Any, TypedDict
 from urllib.parse import unquote
 
 try:
+    from .mediawiki_cache import (
+        DEFAULT_TTLS,
+        TitleCache,
+        add_timestamp_columns,
+        connect_cache_db,
+        is_fresh,
+        write_transaction,
+    )
     from .x_ray_share import FUZZ_THRESHOLD, PERSON_LABELS, XRayEntity
 except ImportError:
+    from mediawiki_cache import (
+        DEFAULT_TTLS,
+        TitleCache,
+        add_timestamp_columns,
+        connect_cache_db,
+        is_fresh,
+        write_transaction,
+    )
     from x_ray_share import FUZZ_THRESHOLD, PERSON_LABELS, XRayEntity
 
 # https://www.mediawiki.org/wiki/API:Get_the_contents_of_a_page
 # https://www.mediawiki.org/wiki/Extension:TextExtracts#API
 MEDIAWIKI_API_EXLIMIT = 20
+# concurrent requests sent to a MediaWiki site
+MEDIAWIKI_MAX_WORKERS = 4
+# minimal seconds between two requests to the same site
+MEDIAWIKI_REQUEST_INTERVAL = 0.1
+MEDIAWIKI_RETRIES = 3
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
 
 GPE_LABELS = frozenset(["GPE", "GPE_LOC", "GPE_ORG", "placeName", "LC"])
 
 
+class RateLimiter:
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+def request_json(
+    session: Any, rate_limiter: RateLimiter, url: str, params: dict[str, Any]
+) -> Any:
+    """
+    Retry connection errors and server errors with exponential backoff,
+    return None if the request failed.
+    """
+    import requests
+
+    for attempt in range(MEDIAWIKI_RETRIES + 1):
+        rate_limiter.wait()
+        retry_after = None
+        try:
+            r = session.get(url, params=params, timeout=30)
+            if r.ok:
+                return r.json()
+            if r.status_code not in RETRY_STATUS_CODES:
+                return None
+            retry_after = r.headers.get("retry-after")
+        except (requests.ConnectionError, requests.Timeout):
+            pass
+        if attempt < MEDIAWIKI_RETRIES:
+            time.sleep(
+                float(retry_after)
+                if retry_after is not None and retry_after.isdigit()
+                else 2**attempt
+            )
+    return None
+
+
+def init_requests_session(useragent: str, max_workers: int) -> Any:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.headers.update({"user-agent": useragent})
+    adapter = HTTPAdapter(pool_maxsize=max_workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 class WikipediaCache(TypedDict):
     intro: str
     item_id: str | None
 
 
+class WikipediaResult(TypedDict):
+    pages: list[tuple[str, str, str | None]]
+    converts: dict[str, list[str]]
+    section_texts: list[tuple[str, str]]
+
+
 class Wikipedia:
     def __init__(
-        self, lang: str, useragent: str, plugin_path: Path, zh_wiki_variant: str
+        self,
+        lang: str,
+        useragent: str,
+        plugin_path: Path,
+        zh_wiki_variant: str,
+        max_workers: int = MEDIAWIKI_MAX_WORKERS,
+        ttls: tuple[int, int] = DEFAULT_TTLS,
     ) -> None:
         self.lang = lang
         self.source_id = 1
         self.wiki_api = f"https://{lang}.wikipedia.org/w/api.php"
-        self.db_conn = self.init_db(plugin_path, lang)
-        self.session = self.init_requests_session(useragent, lang, zh_wiki_variant)
-
-    def init_db(self, plugin_path: Path, lang: str) -> sqlite3.Connection:
-        db_path = plugin_path.parent.joinpath(f"worddumb-wikimedia/{lang}.db")
-        if not db_path.parent.exists():
-            db_path.parent.mkdir()
-
-        db_conn = sqlite3.connect(db_path)
-        db_conn.executescript(
-            """
-            CREATE TABLE IF NOT EXISTS titles
-            (title TEXT PRIMARY KEY COLLATE NOCASE, desc_id INTEGER);
-
-            CREATE TABLE IF NOT EXISTS descriptions
-            (id INTEGER PRIMARY KEY, description TEXT, wikidata_item TEXT);
-            """
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(MEDIAWIKI_REQUEST_INTERVAL)
+        self.cache = TitleCache(
+            plugin_path.parent.joinpath(f"worddumb-wikimedia/{lang}.db"),
+            ["description", "wikidata_item"],
+            ttls,
         )
-        return db_conn
+        self.session = self.init_requests_session(useragent, lang, zh_wiki_variant)
 
     def init_requests_session(self, useragent: str, lang: str, zh_wiki_variant: str):
-        import requests
-
-        session = requests.Session()
-        session.headers.update({"user-agent": useragent})
+        session = init_requests_session(useragent, self.max_workers)
         session.params = {"format": "json", "formatversion": 2}
         if lang == "zh":
             session.params["variant"] = f"zh-{zh_wiki_variant}"
@@ -64,60 +144,39 @@ class Wikipedia:
 
     def close(self):
         self.session.close()
-        self.db_conn.execute("CREATE INDEX IF NOT EXISTS idx_titles ON titles(desc_id)")
-        self.db_conn.commit()
-        self.db_conn.close()
+        self.cache.close()
 
     def add_cache(self, title: str, intro: str, wikidata_item: str | None) -> int:
-        desc_id = 0
-        for (new_desc_id,) in self.db_conn.execute(
-            "INSERT INTO descriptions (description, wikidata_item) "
-            "VALUES(?, ?) RETURNING id",
-            (intro, wikidata_item),
-        ):
-            desc_id = new_desc_id
+        desc_id = self.cache.add_description(intro, wikidata_item)
         self.add_title(title, desc_id)
         return desc_id
 
     def has_cache(self, title: str) -> bool:
-        for _ in self.db_conn.execute("SELECT * FROM titles WHERE title = ?", (title,)):
-            return True
-        return False
+        return self.cache.lookup(title)[0]
 
     def get_cache(self, title: str) -> WikipediaCache | None:
-        for desc, wikidata_item in self.db_conn.execute(
-            """
-            SELECT description, wikidata_item
-            FROM titles JOIN descriptions ON titles.desc_id = descriptions.id
-            WHERE title = ?
-            """,
-            (title,),
-        ):
-            return {"intro": desc, "item_id": wikidata_item}
-        return None
+        _, data = self.cache.lookup(title)
+        if data is None:
+            return None
+        desc, wikidata_item = data
+        return {"intro": desc, "item_id": wikidata_item}
 
     def add_title(self, title: str, desc_id: int | None) -> None:
-        self.db_conn.execute(
-            "INSERT OR IGNORE INTO titles VALUES(?, ?)", (title, desc_id)
-        )
+        self.cache.add_titles([title], desc_id)
 
     def redirected_titles(self, title: str) -> list[str]:
-        return [
-            other_title
-            for (other_title,) in self.db_conn.execute(
-                """
-                SELECT title FROM titles
-                WHERE title != ? AND
-                desc_id = (SELECT desc_id FROM titles WHERE title = ?)
-                """,
-                (title, title),
-            )
-        ]
+        return self.cache.redirected_titles(title)
 
     def query(self, titles: set[str]) -> None:
-        result = self.session.get(
+        self.save_result(titles, self.fetch(titles))
+
+    def fetch(self, titles: set[str]) -> WikipediaResult | None:
+        "Only send requests, can be called from other threads"
+        data = request_json(
+            self.session,
+            self.rate_limiter,
             self.wiki_api,
-            params={
+            {
                 "action": "query",
                 "prop": "extracts|pageprops",
                 "exintro": 1,
@@ -127,9 +186,8 @@ class Wikipedia:
                 "titles": "|".join(titles),
             },
         )
-        if not result.ok:
-            return
-        data = result.json()
+        if data is None:
+            return None
         converts = defaultdict(list)
         redirect_to_sections: dict[str, dict[str, str]] = defaultdict(dict)
         for convert_type in ["normalized", "redirects"]:
@@ -139,17 +197,34 @@ class Wikipedia:
                 if "tofragment" in d:
                     redirect_to_sections[d["to"]][d["tofragment"]] = d["from"]
 
+        pages = []
         for v in data["query"]["pages"]:
             if "extract" not in v:  # missing or invalid
                 continue
             # they are ordered by pageid, ehh
             title = v["title"]
-            summary = v["extract"]
             if title in redirect_to_sections and title not in titles:
                 continue
             if "pageprops" in v and "disambiguation" in v["pageprops"]:
                 continue
             wikibase_item = v.get("pageprops", {}).get("wikibase_item")
+            pages.append((title, v["extract"], wikibase_item))
+
+        return {
+            "pages": pages,
+            "converts": converts,
+            "section_texts": self.fetch_section_texts(redirect_to_sections),
+        }
+
+    def save_result(self, titles: set[str], result: WikipediaResult | None) -> None:
+        if result is None:
+            return
+        with self.cache.transaction():
+            self.save_pages(titles.copy(), result)
+
+    def save_pages(self, titles: set[str], result: WikipediaResult) -> None:
+        converts = result["converts"]
+        for title, summary, wikibase_item in result["pages"]:
             desc_id = self.add_cache(title, summary, wikibase_item)
             if title in titles:
                 titles.remove(title)
@@ -162,35 +237,40 @@ class Wikipedia:
                     if k in titles:  # normalize then redirect
                         titles.remove(k)
 
-        self.get_section_text(redirect_to_sections, converts, titles)
+        for redirected_title, text in result["section_texts"]:
+            desc_id = self.add_cache(redirected_title, text, None)
+            if redirected_title in titles:
+                titles.remove(redirected_title)
+            for converted_title in converts.get(redirected_title, []):
+                self.add_title(converted_title, desc_id)
+                if converted_title in titles:
+                    titles.remove(converted_title)
+
         for title in titles:  # use quote next time
             self.add_title(title, None)
 
-    def get_section_text(
-        self,
-        redirect_to_sections: dict[str, dict[str, str]],
-        converts: dict[str, list[str]],
-        titles: set[str],
-    ) -> None:
+    def fetch_section_texts(
+        self, redirect_to_sections: dict[str, dict[str, str]]
+    ) -> list[tuple[str, str]]:
         from lxml import etree
 
+        section_texts = []
         for page, section_to_titles in redirect_to_sections.items():
-            r = self.session.get(
+            result = request_json(
+                self.session,
+                self.rate_limiter,
                 self.wiki_api,
-                params={
-                    "action": "parse",
-                    "prop": "sections",
-                    "page": page,
-                },
+                {"action": "parse", "prop": "sections", "page": page},
             )
-            if not r.ok:
-                return
-            result = r.json()
+            if result is None:
+                break
             for section in result.get("parse", {}).get("sections", []):
                 if section["line"] in section_to_titles:
-                    r = self.session.get(
+                    section_result = request_json(
+                        self.session,
+                        self.rate_limiter,
                         self.wiki_api,
-                        params={
+                        {
                             "action": "parse",
                             "prop": "text",
                             "section": section["index"],
@@ -200,7 +280,8 @@ class Wikipedia:
                             "page": page,
                         },
                     )
-                    section_result = r.json()
+                    if section_result is None:
+                        continue
                     html_text = section_result.get("parse", {}).get("text")
                     if not html_text:
                         continue
@@ -211,48 +292,37 @@ class Wikipedia:
                     text = html.xpath("string(//p[1])")
                     if not text:
                         continue
-                    text = text.strip()
-                    redirected_title = section_to_titles[section["line"]]
-                    desc_id = self.add_cache(redirected_title, text, None)
-                    if redirected_title in titles:
-                        titles.remove(redirected_title)
-                    for converted_title in converts.get(redirected_title, []):
-                        self.add_title(converted_title, desc_id)
-                        if converted_title in titles:
-                            titles.remove(converted_title)
+                    section_texts.append(
+                        (section_to_titles[section["line"]], text.strip())
+                    )
+        return section_texts
 
 
 class Fandom:
-    def __init__(self, useragent: str, plugin_path: Path, fandom_url: str) -> None:
+    def __init__(
+        self,
+        useragent: str,
+        plugin_path: Path,
+        fandom_url: str,
+        max_workers: int = MEDIAWIKI_MAX_WORKERS,
+        ttls: tuple[int, int] = DEFAULT_TTLS,
+    ) -> None:
         self.source_id = 2
         self.wiki_api = f"{fandom_url}/api.php"
-        self.db_conn = self.init_db(plugin_path, fandom_url)
-        self.session = self.init_requests_session(useragent)
-
-    def init_db(self, plugin_path: Path, fandom_url: str) -> sqlite3.Connection:
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(MEDIAWIKI_REQUEST_INTERVAL)
         # Remove "https://" from Fandom URL
-        db_path = plugin_path.parent.joinpath(
-            f"worddumb-fandom/{fandom_url[8:].replace('/', '')}.db"
-        )
-        if not db_path.parent.exists():
-            db_path.parent.mkdir()
-        db_conn = sqlite3.connect(db_path)
-        db_conn.executescript(
-            """
-            CREATE TABLE IF NOT EXISTS titles
-            (title TEXT PRIMARY KEY COLLATE NOCASE, desc_id INTEGER);
-
-            CREATE TABLE IF NOT EXISTS descriptions
-            (id INTEGER PRIMARY KEY, description TEXT);
-            """
+        self.cache = TitleCache(
+            plugin_path.parent.joinpath(
+                f"worddumb-fandom/{fandom_url[8:].replace('/', '')}.db"
+            ),
+            ["description"],
+            ttls,
         )
-        return db_conn
+        self.session = self.init_requests_session(useragent)
 
     def init_requests_session(self, useragent: str):
-        import requests
-
-        session = requests.Session()
-        session.headers.update({"user-agent": useragent})
+        session = init_requests_session(useragent, self.max_workers)
         # Fandom doesn't have TextExtract extension
         # https://www.mediawiki.org/wiki/API:Parse
         session.params = {
@@ -268,64 +338,58 @@ class Fandom:
 
     def close(self):
         self.session.close()
-        self.db_conn.execute("CREATE INDEX IF NOT EXISTS idx_titles ON titles(desc_id)")
-        self.db_conn.commit()
-        self.db_conn.close()
+        self.cache.close()
 
     def add_cache(self, title: str, intro: str) -> int:
-        desc_id = 0
-        for (new_desc_id,) in self.db_conn.execute(
-            "INSERT INTO descriptions (description) VALUES(?) RETURNING id",
-            (intro,),
-        ):
-            desc_id = new_desc_id
+        desc_id = self.cache.add_description(intro)
         self.add_title(title, desc_id)
         return desc_id
 
     def has_cache(self, title: str) -> bool:
-        for _ in self.db_conn.execute("SELECT * FROM titles WHERE title = ?", (title,)):
-            return True
-        return False
+        return self.cache.lookup(title)[0]
 
     def get_cache(self, title: str) -> str | None:
-        for (desc,) in self.db_conn.execute(
-            """
-            SELECT description FROM titles JOIN descriptions
-            ON titles.desc_id = descriptions.id WHERE title = ?
-            """,
-            (title,),
-        ):
-            return desc
-        return None
+        _, data = self.cache.lookup(title)
+        return None if data is None else data[0]
 
     def add_title(self, title: str, desc_id: int | None) -> None:
-        self.db_conn.execute(
-            "INSERT OR IGNORE INTO titles VALUES(?, ?)", (title, desc_id)
-        )
+        self.cache.add_titles([title], desc_id)
 
     def redirected_titles(self, title: str) -> list[str]:
-        return [
-            other_title
-            for (other_title,) in self.db_conn.execute(
-                """
-                SELECT title FROM titles
-                WHERE title != ? AND
-                desc_id = (SELECT desc_id FROM titles WHERE title = ?)
-                """,
-                (title, title),
-            )
-        ]
+        return self.cache.redirected_titles(title)
 
     def query(self, page: str, from_disambiguation_title: str | None = None) -> None:
-        from lxml import etree
+        chosen_title = self.save_result(
+            page, self.fetch(page), from_disambiguation_title
+        )
+        if chosen_title is not None:
+            self.query(chosen_title, page)
+
+    def fetch(self, page: str) -> Any:
+        "Only send the request, can be called from other threads"
+        return request_json(
+            self.session, self.rate_limiter, self.wiki_api, {"page": page}
+        )
+
+    def save_result(
+        self, page: str, data: Any, from_disambiguation_title: str | None = None
+    ) -> str | None:
+        """
+        Return the most similar title if the page is a disambiguation page,
+        the caller should query it next.
+        """
+        if data is None:
+            return None
+        with self.cache.transaction():
+            return self.save_page(page, data, from_disambiguation_title)
+
+    def save_page(
+        self, page: str, data: Any, from_disambiguation_title: str | None
+    ) -> str | None:
         from rapidfuzz.fuzz import token_set_ratio
         from rapidfuzz.process import extractOne
         from rapidfuzz.utils import default_process
 
-        result = self.session.get(self.wiki_api, params={"page": page})
-        if not result.ok:
-            return
-        data = result.json()
         if "parse" in data:
             data = data["parse"]
             if (
@@ -346,28 +410,31 @@ class Fandom:
                     scorer=partial(token_set_ratio, processor=default_process),
                 )
                 if r is not None:
-                    chosen_title = r[0]
-                    self.query(chosen_title, page)
-                else:
-                    self.add_title(page, None)
-                return
-
-            text = data["text"]
-            html = etree.HTML(text)
-            # Remove infobox, quote, references, error
-            for e in html.xpath(
-                "//table | //aside | //dl | //*[contains(@class, 'reference')] | "
-                "//span[contains(@class, 'error')]"
-            ):
-                e.getparent().remove(e)
-            intro = html.xpath("string()").strip()
-            desc_id = self.add_cache(page, intro)
+                    return r[0]
+                self.add_title(page, None)
+                return None
+
+            desc_id = self.add_cache(page, fandom_intro(data["text"]))
             for redirect in data.get("redirects", []):
                 self.add_title(redirect["to"], desc_id)
             if from_disambiguation_title is not None:
                 self.add_title(from_disambiguation_title, desc_id)
         else:
             self.add_title(page, None)  # Not found
+        return None
+
+
+def fandom_intro(text: str) -> str:
+    from lxml import etree
+
+    html = etree.HTML(text)
+    # Remove infobox, quote, references, error
+    for e in html.xpath(
+        "//table | //aside | //dl | //*[contains(@class, 'reference')] | "
+        "//span[contains(@class, 'error')]"
+    ):
+        e.getparent().remove(e)
+    return html.xpath("string()").strip()
 
 
 class Wikimedia_Commons:
@@ -380,7 +447,10 @@ class Wikimedia_Commons:
 
     def get_image(self, filename: str) -> Path | None:
         file_path = self.cache_folder.joinpath(filename)
-        if not file_path.exists() and not self.download_image(filename, file_path):
+        if file_path.exists():
+            # least recently used images are evicted first
+            os.utime(file_path)
+        elif not self.download_image(filename, file_path):
             return None
         return file_path
 
@@ -404,45 +474,72 @@ class WikidataCache(TypedDict):
 
 
 class Wikidata:
-    def __init__(self, plugin_path: Path, useragent: str) -> None:
+    def __init__(
+        self,
+        plugin_path: Path,
+        useragent: str,
+        ttls: tuple[int, int] = DEFAULT_TTLS,
+    ) -> None:
         import requests
 
         self.session = requests.Session()
         self.session.headers.update({"user-agent": useragent})
 
-        cache_db_path = plugin_path.parent.joinpath("worddumb-wikimedia/wikidata.db")
-        self.init_db(cache_db_path)
-
-    def init_db(self, db_path: Path) -> None:
-        create_db = not db_path.exists()
-        self.db_conn = sqlite3.connect(db_path)
-        if create_db:
-            self.db_conn.execute(
-                """
-                CREATE TABLE wikidata
-                (item TEXT PRIMARY KEY, map_filename TEXT, inception TEXT)
-                """
-            )
+        self.db_conn = connect_cache_db(
+            plugin_path.parent.joinpath("worddumb-wikimedia/wikidata.db")
+        )
+        self.db_conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS wikidata
+            (item TEXT PRIMARY KEY, map_filename TEXT, inception TEXT,
+            fetched_at INTEGER, used_at INTEGER)
+            """
+        )
+        add_timestamp_columns(self.db_conn, "wikidata")
+        self.ttls = ttls
+        # update `used_at` when closing the database
+        self.used_items: set[str] = set()
 
     def close(self):
         self.session.close()
-        self.db_conn.commit()
+        if self.used_items:
+            with write_transaction(self.db_conn):
+                now = int(time.time())
+                self.db_conn.executemany(
+                    "UPDATE wikidata SET used_at = ? WHERE item = ?",
+                    ((now, item) for item in self.used_items),
+                )
         self.db_conn.close()
 
     def add_cache(
         self, item: str, map_filename: str | None, inception: str | None
     ) -> None:
+        now = int(time.time())
         self.db_conn.execute(
-            "INSERT INTO wikidata VALUES(?, ?, ?)", (item, map_filename, inception)
+            """
+            INSERT INTO wikidata VALUES(?, ?, ?, ?, ?)
+            ON CONFLICT(item) DO UPDATE SET
+            map_filename = excluded.map_filename, inception = excluded.inception,
+            fetched_at = excluded.fetched_at, used_at = excluded.used_at
+            """,
+            (item, map_filename, inception, now, now),
         )
 
     def has_cache(self, item: str) -> bool:
-        return self.get_cache(item) is not None
+        "Expired items are queried again"
+        for map_filename, inception, fetched_at in self.db_conn.execute(
+            "SELECT map_filename, inception, fetched_at FROM wikidata WHERE item = ?",
+            (item,),
+        ):
+            found = map_filename is not None or inception is not None
+            return is_fresh(fetched_at, found, self.ttls)
+        return False
 
     def get_cache(self, item: str) -> WikidataCache | None:
         for map_filename, inception in self.db_conn.execute(
             "SELECT map_filename, inception FROM wikidata WHERE item = ?", (item,)
         ):
+            self.used_items.add(item)
             return {"map_filename": map_filename, "inception": inception}
         return None
 
@@ -466,7 +563,11 @@ class Wikidata:
         )
         if not result.ok:
             return
-        for binding in result.json().get("results", {}).get("bindings"):
+        with write_transaction(self.db_conn):
+            self.save_bindings(result.json().get("results", {}).get("bindings"))
+
+    def save_bindings(self, bindings: list[dict[str, Any]]) -> None:
+        for binding in bindings:
             item_id = binding["item"]["value"].split("/")[-1]
             map_url = binding.get("map", {}).get("value")
             inception = binding.get("inception", {}).get("value")
@@ -502,23 +603,39 @@ def inception_text(inception_str: str) -> str:
 def query_mediawiki(
     entities: dict[str, XRayEntity], mediawiki: Wikipedia | Fandom, search_people: bool
 ) -> None:
-    pending_entities: set[str] = set()
-    for entity, data in entities.items():
-        if (
-            isinstance(mediawiki, Wikipedia)
-            and len(pending_entities) == MEDIAWIKI_API_EXLIMIT
-        ):
-            mediawiki.query(pending_entities)
-            pending_entities.clear()
-        elif not mediawiki.has_cache(entity) and (
-            search_people or data["label"] not in PERSON_LABELS
-        ):
-            if isinstance(mediawiki, Wikipedia):
-                pending_entities.add(entity)
-            else:
-                mediawiki.query(entity)
-    if len(pending_entities) and isinstance(mediawiki, Wikipedia):
-        mediawiki.query(pending_entities)
+    pending_entities = [
+        entity
+        for entity, data in entities.items()
+        if (search_people or data["label"] not in PERSON_LABELS)
+        and not mediawiki.has_cache(entity)
+    ]
+    if isinstance(mediawiki, Wikipedia):
+        batches = [
+            set(pending_entities[i : i + MEDIAWIKI_API_EXLIMIT])
+            for i in range(0, len(pending_entities), MEDIAWIKI_API_EXLIMIT)
+        ]
+        # send requests in threads, SQLite connection is used in this thread
+        with ThreadPoolExecutor(mediawiki.max_workers) as executor:
+            for titles, result in zip(batches, executor.map(mediawiki.fetch, batches)):
+                mediawiki.save_result(titles, result)
+    else:
+        # parse HTML in this thread while other pages are downloading,
+        # disambiguation pages add the chosen title to the queue
+        with ThreadPoolExecutor(mediawiki.max_workers) as executor:
+            futures: dict[Future, tuple[str, str | None]] = {
+                executor.submit(mediawiki.fetch, entity): (entity, None)
+                for entity in pending_entities
+            }
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page, from_disambiguation_title = futures.pop(future)
+                    chosen_title = mediawiki.save_result(
+                        page, future.result(), from_disambiguation_title
+                    )
+                    if chosen_title is not None:
+                        future = executor.submit(mediawiki.fetch, chosen_title)
+                        futures[future] = (chosen_title, page)
 
 
 def query_wikidata(
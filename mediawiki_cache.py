@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+"""
+SQLite caches of MediaWiki and Wikidata query results. Databases use WAL
+journaling and short write transactions so several jobs can share them.
+
+Rows record when they were fetched and last used: expired rows are queried
+again, `maintain_caches` deletes expired rows, evicts the least recently used
+rows of large databases and map images, then compacts the databases.
+"""
+
+import os
+import sqlite3
+import string
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+try:
+    from .utils import Prefs
+except ImportError:
+    from utils import Prefs
+
+# seconds to wait for other jobs' write transactions
+BUSY_TIMEOUT = 30
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+DAY = 24 * 60 * 60
+# days, results found and not found
+DEFAULT_TTLS = (180, 14)
+MAINTAIN_INTERVAL = DAY
+EVICT_BATCH = 500
+MAINTAIN_LOCK = threading.Lock()
+DB_SUFFIXES = (".db", ".db-wal", ".db-shm")
+
+
+def connect_cache_db(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    # autocommit mode, write transactions are started explicitly
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+@contextmanager
+def write_transaction(conn: sqlite3.Connection) -> Iterator[None]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def add_timestamp_columns(conn: sqlite3.Connection, table: str) -> None:
+    "Add columns to databases created by older versions"
+    with write_transaction(conn):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column in ("fetched_at", "used_at"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+                conn.execute(f"UPDATE {table} SET {column} = ?", (int(time.time()),))
+
+
+def is_fresh(fetched_at: int | None, found: bool, ttls: tuple[int, int]) -> bool:
+    ttl = ttls[0] if found else ttls[1]
+    return fetched_at is not None and time.time() - fetched_at < ttl * DAY
+
+
+class TitleCache:
+    """
+    Map page titles to descriptions, titles redirected to the same page share
+    the description. Title without description is a page not found.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        description_columns: list[str],
+        ttls: tuple[int, int] = DEFAULT_TTLS,
+    ) -> None:
+        self.conn = connect_cache_db(db_path)
+        self.columns = description_columns
+        self.ttls = ttls
+        columns_sql = ", ".join(f"{column} TEXT" for column in description_columns)
+        self.conn.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS titles
+            (title TEXT PRIMARY KEY COLLATE NOCASE, desc_id INTEGER,
+            fetched_at INTEGER, used_at INTEGER);
+
+            CREATE TABLE IF NOT EXISTS descriptions
+            (id INTEGER PRIMARY KEY, {columns_sql});
+
+            CREATE INDEX IF NOT EXISTS idx_titles ON titles(desc_id);
+            """
+        )
+        add_timestamp_columns(self.conn, "titles")
+        self.lookup_sql = (
+            f"SELECT desc_id, fetched_at, {', '.join(description_columns)} "
+            "FROM titles LEFT JOIN descriptions ON titles.desc_id = descriptions.id "
+            "WHERE title = ?"
+        )
+        self.insert_sql = (
+            f"INSERT INTO descriptions ({', '.join(description_columns)}) "
+            f"VALUES({', '.join('?' * len(description_columns))}) RETURNING id"
+        )
+        # lookup results, keys are folded like the NOCASE collation
+        self.lookups: dict[str, tuple[bool, tuple[Any, ...] | None]] = {}
+        # update `used_at` when closing the database
+        self.used_titles: set[str] = set()
+
+    def close(self) -> None:
+        if self.used_titles:
+            with self.transaction():
+                now = int(time.time())
+                self.conn.executemany(
+                    "UPDATE titles SET used_at = ? WHERE title = ?",
+                    ((now, title) for title in self.used_titles),
+                )
+        self.conn.close()
+
+    def transaction(self):
+        return write_transaction(self.conn)
+
+    def lookup(self, title: str) -> tuple[bool, tuple[Any, ...] | None]:
+        """
+        Return whether the title is cached and not expired, and the description
+        columns. Expired description is still returned.
+        """
+        key = title.translate(ASCII_LOWER)
+        if key in self.lookups:
+            return self.lookups[key]
+        result: tuple[bool, tuple[Any, ...] | None] = (False, None)
+        for desc_id, fetched_at, *columns in self.conn.execute(
+            self.lookup_sql, (title,)
+        ):
+            result = (
+                is_fresh(fetched_at, desc_id is not None, self.ttls),
+                None if desc_id is None else tuple(columns),
+            )
+            self.used_titles.add(title)
+        self.lookups[key] = result
+        return result
+
+    def add_description(self, *columns: Any) -> int:
+        desc_id = 0
+        for (new_desc_id,) in self.conn.execute(self.insert_sql, columns):
+            desc_id = new_desc_id
+        return desc_id
+
+    def add_titles(self, titles: Iterable[str], desc_id: int | None) -> None:
+        """
+        Insert titles or replace expired titles. Titles are NOCASE, a fresh
+        description is never replaced by not found.
+        """
+        titles = list(titles)
+        now = int(time.time())
+        found_expired_at = now - self.ttls[0] * DAY
+        self.conn.executemany(
+            """
+            INSERT INTO titles (title, desc_id, fetched_at, used_at)
+            VALUES(?, ?, ?, ?)
+            ON CONFLICT(title) DO UPDATE SET
+            desc_id = excluded.desc_id, fetched_at = excluded.fetched_at,
+            used_at = excluded.used_at
+            WHERE excluded.desc_id IS NOT NULL OR titles.desc_id IS NULL
+            OR titles.fetched_at IS NULL OR titles.fetched_at < ?
+            """,
+            ((title, desc_id, now, now, found_expired_at) for title in titles),
+        )
+        for title in titles:
+            self.lookups.pop(title.translate(ASCII_LOWER), None)
+
+    def redirected_titles(self, title: str) -> list[str]:
+        return [
+            other_title
+            for (other_title,) in self.conn.execute(
+                """
+                SELECT title FROM titles
+                WHERE title != ? AND
+                desc_id = (SELECT desc_id FROM titles WHERE title = ?)
+                """,
+                (title, title),
+            )
+        ]
+
+
+def cache_ttls(prefs: Prefs) -> tuple[int, int]:
+    return prefs["mediawiki_cache_ttl"], prefs["mediawiki_not_found_ttl"]
+
+
+def database_size(conn: sqlite3.Connection) -> int:
+    (page_size,) = conn.execute("PRAGMA page_size").fetchone()
+    (page_count,) = conn.execute("PRAGMA page_count").fetchone()
+    (freelist_count,) = conn.execute("PRAGMA freelist_count").fetchone()
+    return page_size * (page_count - freelist_count)
+
+
+def compact_cache_db(db_path: Path, ttls: tuple[int, int], max_bytes: int) -> None:
+    "Delete expired rows, evict least recently used rows then VACUUM"
+    conn = connect_cache_db(db_path)
+    is_wikidata = db_path.name == "wikidata.db"
+    table = "wikidata" if is_wikidata else "titles"
+    found_sql = (
+        "map_filename IS NOT NULL OR inception IS NOT NULL"
+        if is_wikidata
+        else "desc_id IS NOT NULL"
+    )
+    try:
+        add_timestamp_columns(conn, table)
+        now = int(time.time())
+        with write_transaction(conn):
+            conn.execute(
+                f"DELETE FROM {table} WHERE ({found_sql}) AND fetched_at < ?",
+                (now - ttls[0] * DAY,),
+            )
+            conn.execute(
+                f"DELETE FROM {table} WHERE NOT ({found_sql}) AND fetched_at < ?",
+                (now - ttls[1] * DAY,),
+            )
+            delete_orphan_descriptions(conn, is_wikidata)
+        while database_size(conn) > max_bytes:
+            with write_transaction(conn):
+                deleted = conn.execute(
+                    f"""
+                    DELETE FROM {table} WHERE rowid IN
+                    (SELECT rowid FROM {table} ORDER BY used_at LIMIT ?)
+                    """,
+                    (EVICT_BATCH,),
+                ).rowcount
+                delete_orphan_descriptions(conn, is_wikidata)
+            if deleted == 0:
+                break
+        # WAL can't be truncated while other connections read or write it
+        busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        if not busy:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def delete_orphan_descriptions(conn: sqlite3.Connection, is_wikidata: bool) -> None:
+    if not is_wikidata:
+        conn.execute(
+            """
+            DELETE FROM descriptions WHERE id NOT IN
+            (SELECT desc_id FROM titles WHERE desc_id IS NOT NULL)
+            """
+        )
+
+
+def evict_files(folder: Path, max_bytes: int) -> None:
+    "Delete least recently used files except databases"
+    files = [
+        (stat.st_mtime, stat.st_size, path)
+        for path in folder.iterdir()
+        if path.is_file()
+        and not path.name.endswith(DB_SUFFIXES)
+        and not path.name.startswith(".")
+        for stat in [path.stat()]
+    ]
+    total_size = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total_size <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total_size -= size
+
+
+def maintain_caches(plugin_path: Path, prefs: Prefs) -> None:
+    "Run at most once a day, skip databases used by other jobs"
+    # jobs of the GUI run in threads
+    if not MAINTAIN_LOCK.acquire(blocking=False):
+        return
+    try:
+        maintain_cache_folders(plugin_path, prefs)
+    finally:
+        MAINTAIN_LOCK.release()
+
+
+def maintain_cache_folders(plugin_path: Path, prefs: Prefs) -> None:
+    wikimedia_folder = plugin_path.parent / "worddumb-wikimedia"
+    stamp_path = wikimedia_folder / ".maintained"
+    if not wikimedia_folder.is_dir() or (
+        stamp_path.exists()
+        and time.time() - stamp_path.stat().st_mtime < MAINTAIN_INTERVAL
+    ):
+        return
+    stamp_path.touch()
+
+    max_bytes = prefs["mediawiki_cache_max_mb"] * 1024 * 1024
+    for folder in (wikimedia_folder, plugin_path.parent / "worddumb-fandom"):
+        if not folder.is_dir():
+            continue
+        for db_path in folder.glob("*.db"):
+            try:
+                compact_cache_db(db_path, cache_ttls(prefs), max_bytes)
+            except sqlite3.OperationalError:  # locked by other jobs
+                continue
+    evict_files(wikimedia_folder, prefs["map_cache_max_mb"] * 1024 * 1024)
+    os.utime(stamp_path)
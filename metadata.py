@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 
-import json
 import random
 import re
 import string
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, BinaryIO, TypedDict
+from typing import TYPE_CHECKING, Any, BinaryIO
 
 if TYPE_CHECKING:
     from .parse_job import ParseJobData
@@ -53,7 +52,10 @@ def check_metadata(
     )
 
 
-def cli_check_metadata(book_path_str: str, log: Any) -> tuple[str, Any, str] | None:
+def cli_check_metadata(
+    book_path_str: str, log: Any
+) -> tuple[str, Any, str, tuple[str, Any] | None] | None:
+    "The KFX book is returned for `ParseJobData.kfx_book`"
     from .utils import get_plugin_path, load_plugin_json
 
     lang_dict = load_plugin_json(get_plugin_path(), "data/languages.json")
@@ -61,12 +63,14 @@ def cli_check_metadata(book_path_str: str, log: Any) -> tuple[str, Any, str] | N
     book_path = Path(book_path_str)
     book_fmt = book_path.suffix.upper()[1:]
     mi = None
+    kfx_book = None
     if book_fmt == "KFX":
         from calibre.ebooks.metadata.book.base import Metadata
         from calibre.utils.localization import canonicalize_lang
         from calibre_plugins.kfx_input.kfxlib import YJ_Book
 
-        yj_book = YJ_Book(str(book_path))
+        yj_book = YJ_Book(book_path_str)
+        kfx_book = (book_path_str, yj_book)
         yj_md = yj_book.get_metadata()
         title = getattr(yj_md, "title", None)
         language = getattr(yj_md, "language", None)
@@ -91,7 +95,7 @@ def cli_check_metadata(book_path_str: str, log: Any) -> tuple[str, Any, str] | N
                 f"The language of the book {mi.get('title')} is not supported.",
             )
             return None
-        return book_fmt, mi, supported_languages[book_language]
+        return book_fmt, mi, supported_languages[book_language], kfx_book
 
     log.prints(log.WARN, "The book format is not supported.")
     return None
@@ -114,19 +118,13 @@ def validate_asin(asin: str | None, mi: Any) -> tuple[str, bool]:
     return asin, update_asin
 
 
-class KFXJson(TypedDict):
-    position: int
-    content: str
-    type: int
-
-
 def get_asin_etc(
     data: "ParseJobData", library_asin: str | None = None, set_en_lang: bool = False
 ) -> None:
     if data.book_fmt == "KFX":
-        from calibre_plugins.kfx_input.kfxlib import YJ_Book
+        from .kfx_content import pack_kfx_content
 
-        yj_book = YJ_Book(data.book_path)
+        yj_book = get_kfx_book(data)
         yj_md = yj_book.get_metadata()
         data.asin = getattr(yj_md, "asin", "")
         data.acr = getattr(yj_md, "asset_id", "")
@@ -141,9 +139,12 @@ def get_asin_etc(
             update_lang = True
             lang = "en"
         if data.update_asin or update_lang:
-            update_kfx_metedata(data.book_path, data.asin, lang)
+            update_kfx_metedata(yj_book, data.book_path, data.asin, lang)
         if library_asin is None:
-            data.kfx_json = json.loads(yj_book.convert_to_json_content())["data"]
+            # converted from the fragments decoded by `update_kfx_metedata`
+            data.kfx_content = pack_kfx_content(yj_book.convert_to_json_content())
+        # decoded fragments are not needed after the content is packed
+        data.kfx_book = None
     elif data.book_fmt != "EPUB":
         from calibre.ebooks.metadata.mobi import MetadataUpdater
 
@@ -207,10 +208,22 @@ def extract_mobi(book_path: str) -> bytes:
         return html
 
 
-def update_kfx_metedata(book_path: str, asin: str, lang: str):
-    from calibre_plugins.kfx_input.kfxlib import YJ_Book, YJ_Metadata
+def get_kfx_book(data: "ParseJobData") -> Any:
+    """
+    kfxlib `YJ_Book` of the job's book file, opened by `cli_check_metadata`
+    or here. `book_path` could change.
+    """
+    if data.kfx_book is None or data.kfx_book[0] != data.book_path:
+        from calibre_plugins.kfx_input.kfxlib import YJ_Book
+
+        data.kfx_book = (data.book_path, YJ_Book(data.book_path))
+    return data.kfx_book[1]
+
+
+def update_kfx_metedata(yj_book: Any, book_path: str, asin: str, lang: str):
+    "Decode the book with new metadata and rewrite the file"
+    from calibre_plugins.kfx_input.kfxlib import YJ_Metadata
 
-    yj_book = YJ_Book(book_path)
     yj_md = YJ_Metadata()
     yj_md.asin = asin
     yj_md.language = lang
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+"""
+Save spaCy docs of a book so later jobs of the same book text, spaCy model and
+pipeline options only need to redo matching and creating files.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Iterable, Iterator, TypeVar
+
+try:
+    from .text_chunks import pipe_texts
+    from .utils import load_plugin_json
+    from .x_ray_share import get_custom_x_path
+except ImportError:
+    from text_chunks import pipe_texts
+    from utils import load_plugin_json
+    from x_ray_share import get_custom_x_path
+
+# number of books to keep, files also use at most "parse_cache_max_mb"
+PARSE_CACHE_LIMIT = 50
+
+Context = TypeVar("Context")
+
+
+def parse_cache_folder(plugin_path: Path) -> Path:
+    return plugin_path.parent / "worddumb-parse-cache"
+
+
+def parse_cache_path(
+    texts: list[str],
+    model: str,
+    plugin_path: Path,
+    book_path: str | None,
+    use_pos: bool,
+    chunk_size: int,
+) -> Path:
+    """
+    `book_path` is None if the pipeline doesn't have NER, custom X-Ray
+    changes entities so the custom file is part of the key.
+    """
+    import spacy
+
+    pkg_versions = load_plugin_json(plugin_path, "data/deps.json")
+    model_version = pkg_versions[
+        "spacy_trf_model" if model.endswith("_trf") else "spacy_cpu_model"
+    ]
+    key = hashlib.sha256()
+    for value in (
+        model,
+        model_version,
+        spacy.about.__version__,
+        str(use_pos),
+        str(chunk_size),
+    ):
+        key.update(value.encode())
+        key.update(b"\0")
+    if book_path is not None:
+        key.update(b"ner\0")
+        custom_x_path = get_custom_x_path(book_path)
+        if custom_x_path.exists():
+            key.update(custom_x_path.read_bytes())
+        key.update(b"\0")
+    for text in texts:
+        key.update(text.encode("utf-8", "surrogatepass"))
+        key.update(b"\0")
+    return parse_cache_folder(plugin_path) / f"{key.hexdigest()}.spacy"
+
+
+def pipe_with_cache(
+    nlp: Any,
+    text_tuples: Iterable[tuple[str, Context]],
+    model: str,
+    plugin_path: Path,
+    book_path: str | None,
+    use_pos: bool,
+    chunk_size: int,
+    max_bytes: int,
+    **pipe_options: int,
+) -> Iterator[tuple[Any, Context]]:
+    "Same as `pipe_texts(nlp, text_tuples, chunk_size, **pipe_options)`"
+    from spacy.tokens import DocBin
+
+    text_tuples = list(text_tuples)
+    cache_path = parse_cache_path(
+        [text for text, _ in text_tuples],
+        model,
+        plugin_path,
+        book_path,
+        use_pos,
+        chunk_size,
+    )
+    if cache_path.exists():
+        try:
+            doc_bin = DocBin().from_bytes(cache_path.read_bytes())
+        except (OSError, ValueError, KeyError):
+            # removed by another job, truncated or not a DocBin file
+            cache_path.unlink(missing_ok=True)
+        else:
+            if len(doc_bin) == len(text_tuples):
+                os.utime(cache_path)
+                yield from zip(
+                    doc_bin.get_docs(nlp.vocab),
+                    (context for _, context in text_tuples),
+                )
+                return
+
+    doc_bin = DocBin()
+    for doc, context in pipe_texts(nlp, text_tuples, chunk_size, **pipe_options):
+        doc_bin.add(doc)
+        yield doc, context
+    save_parse_cache(cache_path, doc_bin.to_bytes(), max_bytes)
+
+
+def save_parse_cache(cache_path: Path, data: bytes, max_bytes: int) -> None:
+    "Delete least recently used files over the count or size limit"
+    if len(data) > max_bytes:
+        return
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, cache_path)
+
+    cache_files = sorted(
+        cache_path.parent.glob("*.spacy"),
+        key=lambda path: path.stat().st_mtime_ns,
+        reverse=True,
+    )
+    total_size = 0
+    for index, path in enumerate(cache_files):
+        total_size += path.stat().st_size
+        if index >= PARSE_CACHE_LIMIT or total_size > max_bytes:
+            path.unlink(missing_ok=True)
@@ -1,33 +1,47 @@
 #!/usr/bin/env python3
 import json
-import random
 import re
 import shutil
 import sqlite3
-from dataclasses import asdict, dataclass
-from html import escape, unescape
+from dataclasses import asdict, dataclass, field
+from html import unescape
 from itertools import chain
 from pathlib import Path
 from sqlite3 import Connection
-from typing import Any, Iterator
+from typing import Any, Iterable, Iterator
 
 try:
     from calibre.constants import isfrozen
 
     from .database import (
+        LangLayerWriter,
         create_lang_layer,
         create_x_ray_db,
+        discard_db,
         get_ll_path,
         get_x_ray_path,
-        insert_lemma,
         save_db,
     )
     from .deps import download_word_wise_file, install_deps, which_python
-    from .dump_lemmas import save_spacy_docs, spacy_doc_path
+    from .dump_lemmas import (
+        lemma_pattern_texts_without_pos,
+        save_spacy_docs,
+        spacy_doc_path,
+    )
     from .epub import EPUB, spacy_to_wiktionary_pos
-    from .interval import Interval, IntervalTree
+    from .escaped_text import EscapedText
+    from .interval import Interval, IntervalIndex
+    from .kfx_content import TEXT_RECORD, iter_kfx_content, kfx_content_end
+    from .lemma_index import LemmaIndex, load_lemma_index
     from .mediawiki import Fandom, Wikidata, Wikimedia_Commons, Wikipedia
-    from .metadata import KFXJson
+    from .mediawiki_cache import cache_ttls, maintain_caches
+    from .parse_cache import pipe_with_cache
+    from .text_chunks import pipe_texts
+    from .token_matcher import (
+        TokenMatcher,
+        blank_pipeline_lang,
+        can_use_token_matcher,
+    )
     from .utils import (
         CJK_LANGS,
         Prefs,
@@ -39,28 +53,43 @@ try:
         kindle_db_path,
         load_languages_data,
         load_plugin_json,
-        run_subprocess,
         spacy_model_name,
         use_kindle_ww_db,
         wiktionary_db_path,
     )
+    from .wikipedia_dump import OfflineWikipedia, wikipedia_dump_path
     from .x_ray import X_Ray
     from .x_ray_share import NER_LABELS, CustomX, get_custom_x_path, load_custom_x_desc
 except ImportError:
     isfrozen = False
     from database import (
+        LangLayerWriter,
         create_lang_layer,
         create_x_ray_db,
+        discard_db,
         get_ll_path,
         get_x_ray_path,
-        insert_lemma,
         save_db,
     )
-    from dump_lemmas import save_spacy_docs, spacy_doc_path
+    from dump_lemmas import (
+        lemma_pattern_texts_without_pos,
+        save_spacy_docs,
+        spacy_doc_path,
+    )
     from epub import EPUB, spacy_to_wiktionary_pos
-    from interval import Interval, IntervalTree
+    from escaped_text import EscapedText
+    from interval import Interval, IntervalIndex
+    from kfx_content import TEXT_RECORD, iter_kfx_content, kfx_content_end
+    from lemma_index import LemmaIndex, load_lemma_index
     from mediawiki import Fandom, Wikidata, Wikimedia_Commons, Wikipedia
-    from metadata import KFXJson
+    from mediawiki_cache import cache_ttls, maintain_caches
+    from parse_cache import pipe_with_cache
+    from text_chunks import pipe_texts
+    from token_matcher import (
+        TokenMatcher,
+        blank_pipeline_lang,
+        can_use_token_matcher,
+    )
     from utils import (
         CJK_LANGS,
         Prefs,
@@ -71,6 +100,7 @@ except ImportError:
         use_kindle_ww_db,
         wiktionary_db_path,
     )
+    from wikipedia_dump import OfflineWikipedia, wikipedia_dump_path
     from x_ray import X_Ray
     from x_ray_share import NER_LABELS, CustomX, get_custom_x_path, load_custom_x_desc
 
@@ -91,9 +121,12 @@ class ParseJobData:
     acr: str = ""
     revision: str = ""
     update_asin: bool = False
-    kfx_json: KFXJson | None = None
+    kfx_content: bytes | None = None
+    # book path and kfxlib YJ_Book, not sent to the worker
+    kfx_book: tuple[str, Any] | None = None
     mobi_html: bytes | None = b""
     mobi_codec: str = ""
+    stats: dict[str, int] = field(default_factory=dict)
 
 
 def do_job(
@@ -101,7 +134,12 @@ def do_job(
     abort: Any = None,
     log: Any = None,
     notifications: Any = None,
+    job_worker: Any = None,
 ) -> ParseJobData:
+    """
+    `job_worker` is the worker process used by batch jobs,
+    otherwise an idle worker is chosen for frozen calibre build.
+    """
     from .config import prefs
     from .metadata import get_asin_etc
 
@@ -135,15 +173,6 @@ def do_job(
         data.create_ww = data.create_ww and not new_epub_path.exists()
         shutil.copy(data.book_path, new_epub_path)
         data.book_path = str(new_epub_path)
-        if (
-            data.create_ww
-            and not wiktionary_db_path(
-                data.plugin_path, data.book_lang, prefs["wiktionary_gloss_lang"]
-            ).exists()
-        ):
-            download_word_wise_file(
-                False, data.book_lang, prefs, notifications=notifications
-            )
     else:
         data.create_ww = (
             data.create_ww and not get_ll_path(data.asin, data.book_path).exists()
@@ -151,23 +180,25 @@ def do_job(
         data.create_x = (
             data.create_x and not get_x_ray_path(data.asin, data.book_path).exists()
         )
-        if data.create_ww and (
-            not kindle_db_path(data.plugin_path, data.book_lang, prefs).exists()
-            or not get_wiktionary_klld_path(
-                data.plugin_path, data.book_lang, prefs["kindle_gloss_lang"]
-            ).exists()
-        ):
-            download_word_wise_file(
-                True, data.book_lang, prefs, notifications=notifications
-            )
+    is_kindle = data.book_fmt != "EPUB"
+    if data.create_ww and is_ww_file_missing(
+        is_kindle, data.book_lang, data.plugin_path, prefs
+    ):
+        download_word_wise_file(
+            is_kindle, data.book_lang, prefs, notifications=notifications
+        )
 
     if not data.create_ww and not data.create_x:
         return data
 
-    if isfrozen and (data.book_fmt == "EPUB" or data.create_x):
+    run_in_worker = isfrozen or job_worker is not None
+    if run_in_worker and (data.book_fmt == "EPUB" or data.create_x):
         # parse Fandom page and Wikipedia section requires lxml
         install_deps("lxml", notifications)
-    install_deps(data.spacy_model, notifications)
+    if can_use_token_matcher(data.book_lang, data.create_x, prefs["use_pos"]):
+        install_deps("spacy", notifications)
+    else:
+        install_deps(data.spacy_model, notifications)
 
     if notifications:
         notifications.put((0, "Creating files"))
@@ -177,59 +208,193 @@ def do_job(
     # official calibre build: calibre's optimize level is 2 which removes docstring,
     # but the "transformers" package formats docstrings in their code
     # and calibre-debug can't be used as Python interpreter for pip
-    if isfrozen:
-        py_path, _ = which_python()
+    if run_in_worker:
+        from .worker import acquire_job_worker
+
         # copy data can't be converted by `asdict`
         copy_mi = data.mi
         copy_mobi_html = data.mobi_html  # bytes
-        copy_kfx_json = data.kfx_json  # too long
+        copy_kfx_content = data.kfx_content  # bytes
         data.mi = None
         data.mobi_html = None
-        data.kfx_json = None
+        data.kfx_content = None
+        data.kfx_book = None
         data.plugin_path = str(data.plugin_path)
-        args = [
-            py_path,
-            str(data.plugin_path),
-            json.dumps(asdict(data)),
-            dump_prefs(prefs),
-        ]
+        job_data = asdict(data)
         data.mi = copy_mi
-        input_str = None
+        payload = b""
         if data.book_fmt == "KFX":
-            input_str = json.dumps(copy_kfx_json).encode("utf-8")
+            payload = copy_kfx_content  # type: ignore
         elif data.book_fmt != "EPUB":
-            input_str = copy_mobi_html
+            payload = copy_mobi_html  # type: ignore
 
-        run_subprocess(args, input_str)
+        if job_worker is not None:
+            data.stats = job_worker.run_job(
+                job_data, dump_prefs(prefs), payload, notifications
+            )
+        else:
+            # reuse the spaCy pipeline loaded by previous jobs
+            py_path, _ = which_python()
+            with acquire_job_worker(py_path, data.plugin_path, prefs) as worker:
+                data.stats = worker.run_job(
+                    job_data, dump_prefs(prefs), payload, notifications
+                )
     else:
         create_files(data, prefs, notifications)
 
+    if data.create_x and job_worker is None:
+        # batch jobs maintain caches once after all books
+        maintain_caches(Path(data.plugin_path), prefs)
     return data
 
 
+def is_ww_file_missing(
+    is_kindle: bool, lemma_lang: str, plugin_path: Path, prefs: Prefs
+) -> bool:
+    if is_kindle:
+        return (
+            not kindle_db_path(plugin_path, lemma_lang, prefs).exists()
+            or not get_wiktionary_klld_path(
+                plugin_path, lemma_lang, prefs["kindle_gloss_lang"]
+            ).exists()
+        )
+    return not wiktionary_db_path(
+        plugin_path, lemma_lang, prefs["wiktionary_gloss_lang"]
+    ).exists()
+
+
+def do_batch_jobs(jobs: list[ParseJobData], num_workers: int, log: Any) -> None:
+    """
+    Create files for many books with a pool of worker processes, books
+    are grouped by language and spaCy model so each worker process
+    loads the same pipeline for consecutive books.
+    """
+    import threading
+    import time
+    from collections import deque
+
+    from .config import prefs
+    from .worker import JobWorker
+
+    plugin_path = get_plugin_path()
+    languages = load_plugin_json(plugin_path, "data/languages.json")
+    groups: dict[tuple[str, str], deque[ParseJobData]] = {}
+    for data in jobs:
+        model = spacy_model_name(data.book_lang, languages, prefs)
+        groups.setdefault((data.book_lang, model), deque()).append(data)
+
+    # install packages and download files before starting parallel jobs
+    install_deps("lxml", None)
+    for (book_lang, model), group_jobs in groups.items():
+        install_deps(model, None)
+        for is_kindle in {data.book_fmt != "EPUB" for data in group_jobs}:
+            if any(data.create_ww for data in group_jobs) and is_ww_file_missing(
+                is_kindle, book_lang, plugin_path, prefs
+            ):
+                download_word_wise_file(is_kindle, book_lang, prefs)
+
+    py_path, _ = which_python()
+    groups_lock = threading.Lock()
+    job_times: list[float] = []
+    failed_books: list[str] = []
+
+    def next_job(group_key: tuple[str, str] | None) -> tuple[Any, Any]:
+        with groups_lock:
+            if not groups:
+                return None, None
+            if group_key not in groups:
+                # continue with the largest group left
+                group_key = max(groups, key=lambda k: len(groups[k]))
+            group_jobs = groups[group_key]  # type: ignore
+            data = group_jobs.popleft()
+            if not group_jobs:
+                del groups[group_key]  # type: ignore
+            return group_key, data
+
+    def run_jobs(job_worker: JobWorker) -> None:
+        group_key = None
+        while True:
+            group_key, data = next_job(group_key)
+            if data is None:
+                break
+            title = data.mi.get("title")
+            start_time = time.perf_counter()
+            try:
+                with job_worker.lock:
+                    do_job(data, job_worker=job_worker)
+            except Exception as e:
+                failed_books.append(title)
+                stderr = getattr(e, "stderr", None)
+                log.error(
+                    f"Failed to create files for book {title}: {e}",
+                    stderr.decode("utf-8", "ignore") if stderr else "",
+                )
+                continue
+            job_time = time.perf_counter() - start_time
+            job_times.append(job_time)
+            stats = ", ".join(f"{k}: {v}" for k, v in data.stats.items())
+            log.info(f"Created files for book {title} in {job_time:.1f}s {stats}")
+
+    job_workers = [
+        JobWorker(py_path, str(plugin_path), prefs) for _ in range(num_workers)
+    ]
+    threads = [threading.Thread(target=run_jobs, args=(w,)) for w in job_workers]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time.perf_counter() - start_time
+    for job_worker in job_workers:
+        with job_worker.lock:
+            job_worker.stop()
+    if any(data.create_x for data in jobs):
+        maintain_caches(plugin_path, prefs)
+
+    log.info(
+        f"Processed {len(job_times)} books in {total_time:.1f}s with "
+        f"{num_workers} workers, {len(failed_books)} failed: "
+        f"{len(job_times) / total_time * 60:.1f} books per minute, "
+        f"{sum(job_times) / max(len(job_times), 1):.1f}s per book"
+    )
+
+
 def calulate_final_start(data: ParseJobData) -> int:
     match data.book_fmt:
         case "KFX":
-            return data.kfx_json[-1]["position"] + len(  # type: ignore
-                data.kfx_json[-1]["content"]  # type: ignore
-            )
+            return kfx_content_end(data.kfx_content)  # type: ignore
         case "AZW3" | "MOBI":
             return len(data.mobi_html)  # type: ignore
         case _:
             return 0
 
 
-def create_files(data: ParseJobData, prefs: Prefs, notif: Any) -> None:
+def create_files(
+    data: ParseJobData, prefs: Prefs, notif: Any, keep_pipelines: bool = False
+) -> None:
     """
     This function runs in system Python subprocess for official(frozen) calibre build.
+    `keep_pipelines` is used by the worker process to reuse spaCy pipelines
+    and matchers in later jobs.
     """
     is_epub = data.book_fmt == "EPUB"
     data.plugin_path = Path(data.plugin_path)
     insert_installed_libs(data.plugin_path)
-    nlp = load_spacy(
-        data.spacy_model, data.book_path if data.create_x else None, prefs["use_pos"]
+    # Word Wise only jobs don't need the spaCy model
+    use_token_matcher = can_use_token_matcher(
+        data.book_lang, data.create_x, prefs["use_pos"]
     )
+    if use_token_matcher:
+        nlp = load_blank_spacy(data.spacy_model, keep_pipelines)
+    else:
+        nlp = load_spacy(
+            data.spacy_model,
+            data.book_path if data.create_x else None,
+            prefs["use_pos"],
+            keep_pipelines,
+        )
     lemmas_conn = None
+    lemma_index = None
     if data.create_ww:
         lemmas_db_path = (
             wiktionary_db_path(
@@ -239,30 +404,58 @@ def create_files(data: ParseJobData, prefs: Prefs, notif: Any) -> None:
             else kindle_db_path(data.plugin_path, data.book_lang, prefs)
         )
         lemmas_conn = sqlite3.connect(lemmas_db_path)
-        lemma_matcher, phrase_matcher = create_spacy_matcher(
-            nlp,
-            data.spacy_model,
-            data.book_lang,
-            not is_epub,
-            lemmas_conn,
-            data.plugin_path,
-            prefs,
-        )
+        if prefs["use_lemma_index"]:
+            lemma_index = load_lemma_index(lemmas_db_path, lemmas_conn)
+        if use_token_matcher:
+            lemma_matcher = None
+            phrase_matcher = load_token_matcher(
+                nlp,
+                lemmas_db_path,
+                lemmas_conn,
+                (
+                    prefs[f"{data.book_lang}_wiktionary_difficulty_limit"]
+                    if is_epub
+                    else None
+                ),
+                keep_pipelines,
+            )
+        else:
+            lemma_matcher, phrase_matcher = create_spacy_matcher(
+                nlp,
+                data.spacy_model,
+                data.book_lang,
+                not is_epub,
+                lemmas_conn,
+                data.plugin_path,
+                prefs,
+                keep_pipelines,
+            )
 
     if data.create_x:
-        mediawiki = (
-            Fandom(data.useragent, data.plugin_path, prefs["fandom"])
-            if prefs["fandom"]
-            else Wikipedia(
+        dump_index_path = wikipedia_dump_path(data.plugin_path, data.book_lang)
+        mediawiki: Wikipedia | Fandom
+        wikidata: Wikidata | None = None
+        if prefs["fandom"]:
+            mediawiki = Fandom(
+                data.useragent,
+                data.plugin_path,
+                prefs["fandom"],
+                prefs["mediawiki_workers"],
+                cache_ttls(prefs),
+            )
+        elif dump_index_path.exists():
+            # dump doesn't have Wikidata items
+            mediawiki = OfflineWikipedia(data.book_lang, dump_index_path)
+        else:
+            mediawiki = Wikipedia(
                 data.book_lang,
                 data.useragent,
                 data.plugin_path,
                 prefs["zh_wiki_variant"],
+                prefs["mediawiki_workers"],
+                cache_ttls(prefs),
             )
-        )
-        wikidata = (
-            None if prefs["fandom"] else Wikidata(data.plugin_path, data.useragent)
-        )
+            wikidata = Wikidata(data.plugin_path, data.useragent, cache_ttls(prefs))
         custom_x_ray = load_custom_x_desc(data.book_path)
 
     if is_epub:
@@ -274,8 +467,8 @@ def create_files(data: ParseJobData, prefs: Prefs, notif: Any) -> None:
         elif data.create_ww:
             epub = EPUB(data.book_path, None, None, None, None)
 
-        for doc, (start, escaped_text, xhtml_path) in nlp.pipe(
-            epub.extract_epub(), as_tuples=True
+        for doc, (start, escaped_text, xhtml_path) in parse_texts(
+            nlp, epub.extract_epub(), data, prefs
         ):
             intervals = []
             if data.create_x:
@@ -290,18 +483,14 @@ def create_files(data: ParseJobData, prefs: Prefs, notif: Any) -> None:
                     xhtml_path,
                 )
             if data.create_ww:
-                interval_tree = None
-                if intervals:
-                    random.shuffle(intervals)
-                    interval_tree = IntervalTree()
-                    interval_tree.insert_intervals(intervals)
+                interval_index = IntervalIndex.build(intervals) if intervals else None
                 epub_find_lemma(
                     doc,
                     lemma_matcher,
                     phrase_matcher,
                     start,
                     escaped_text,
-                    interval_tree,
+                    interval_index,
                     epub,
                     xhtml_path,
                     prefs["use_pos"],
@@ -312,104 +501,156 @@ def create_files(data: ParseJobData, prefs: Prefs, notif: Any) -> None:
             supported_languages[gloss_lang]["gloss_source"] == "kaikki"
             and prefs.get(f"{data.book_lang}_ipa") is not None
         )
-        epub.modify_epub(prefs, data.book_lang, lemmas_conn, has_multiple_ipas)
+        epub.modify_epub(
+            prefs, data.book_lang, lemmas_conn, has_multiple_ipas, lemma_index
+        )
         return
 
     # Kindle
     final_start = calulate_final_start(data)
-    if data.create_ww:
-        ll_conn, ll_path = create_lang_layer(
-            data.asin,
-            data.book_path,
-            data.acr,
-            data.revision,
-        )
-
-    if data.create_x:
-        x_ray_conn, x_ray_path = create_x_ray_db(
-            data.asin,
-            data.book_path,
-            data.book_lang,
-            data.plugin_path,
-            prefs,
-        )
-        x_ray = X_Ray(x_ray_conn, mediawiki, wikidata, custom_x_ray)
+    # temporary files of a failed job are deleted
+    sidecars: list[tuple[sqlite3.Connection, Path]] = []
+    try:
+        if data.create_ww:
+            lemma_lookup = KindleLemmaLookup(
+                lemmas_conn, data.book_lang, prefs, lemma_index
+            )
+            ll_conn, ll_path = create_lang_layer(
+                data.asin,
+                data.book_path,
+                data.acr,
+                data.revision,
+            )
+            sidecars.append((ll_conn, ll_path))
+            ll_writer = LangLayerWriter(ll_conn)
 
-    for doc, context in nlp.pipe(parse_book(data), as_tuples=True):
-        if data.kfx_json is not None:
-            start = context
-            escaped_text = None
-        else:
-            start, escaped_text = context
         if data.create_x:
-            find_named_entity(
-                start,
-                x_ray,
-                doc,
-                data.mobi_codec,
+            x_ray_conn, x_ray_path = create_x_ray_db(
+                data.asin,
+                data.book_path,
                 data.book_lang,
-                escaped_text,
-                custom_x_ray,
+                data.plugin_path,
+                prefs,
             )
-        if data.create_ww:
-            kindle_find_lemma(
-                doc,
-                lemma_matcher,
-                phrase_matcher,
-                start,
+            sidecars.append((x_ray_conn, x_ray_path))
+            x_ray = X_Ray(x_ray_conn, mediawiki, wikidata, custom_x_ray)
+
+        for doc, context in parse_texts(nlp, parse_book(data), data, prefs):
+            if data.kfx_content is not None:
+                start = context
+                escaped_text = None
+            else:
+                start, escaped_text = context
+            if data.create_x:
+                find_named_entity(
+                    start,
+                    x_ray,
+                    doc,
+                    data.mobi_codec,
+                    data.book_lang,
+                    escaped_text,
+                    custom_x_ray,
+                )
+            if data.create_ww:
+                kindle_find_lemma(
+                    doc,
+                    lemma_matcher,
+                    phrase_matcher,
+                    start,
+                    data.mobi_codec,
+                    escaped_text,
+                    lemma_lookup,
+                    ll_writer,
+                    prefs["use_pos"],
+                )
+            if notif:
+                notif.put((start / final_start, "Creating files"))
+
+        if data.create_x:
+            x_ray.finish(
+                x_ray_path,
+                final_start,
+                data.kfx_content,
+                data.mobi_html,
                 data.mobi_codec,
-                escaped_text,
-                lemmas_conn,
-                ll_conn,
-                data.book_lang,
                 prefs,
             )
-        if notif:
-            notif.put((start / final_start, "Creating files"))
+        if data.create_ww:
+            ll_writer.flush()
+            save_db(ll_conn, ll_path)
+            lemmas_conn.close()  # type: ignore
+            data.stats.update(lemma_lookup.stats())
+            data.stats.update(ll_writer.stats())
+    except BaseException:
+        for conn, db_path in sidecars:
+            discard_db(conn, db_path)
+        raise
 
-    if data.create_x:
-        x_ray.finish(
-            x_ray_path,
-            final_start,
-            data.kfx_json,
-            data.mobi_html,
-            data.mobi_codec,
-            prefs,
-        )
-    if data.create_ww:
-        save_db(ll_conn, ll_path)
-        lemmas_conn.close()  # type: ignore
+
+MOBI_BODY = re.compile(b"<body.{3,}?</body>", re.DOTALL)
+# text inside HTML tags
+MOBI_TEXT_NODE = re.compile(b">([^<]{2,})<")
+# byte order mark and word joiner
+INVISIBLE_CHARS = re.compile(r"\ufeff|\u2060")
 
 
-def parse_book(data: ParseJobData) -> Iterator[tuple[str, tuple[int, str] | int]]:
-    if data.kfx_json is not None:
-        for entry in filter(lambda x: x["type"] == 1, data.kfx_json):
-            # Remove byte order mark and word joiner
-            yield re.sub(r"\ufeff|\u2060", " ", entry["content"]), entry["position"]
+def parse_book(
+    data: ParseJobData,
+) -> Iterator[tuple[str, tuple[int, EscapedText] | int]]:
+    if data.kfx_content is not None:
+        for record in iter_kfx_content(data.kfx_content):
+            if record.type == TEXT_RECORD:
+                yield INVISIBLE_CHARS.sub(" ", record.content), record.position
     elif data.mobi_html is not None:
-        # match text inside HTML tags
-        for match_body in re.finditer(b"<body.{3,}?</body>", data.mobi_html, re.DOTALL):
-            for m in re.finditer(b">[^<]{2,}<", match_body.group(0)):
-                text = m.group(0)[1:-1].decode(data.mobi_codec)
-                text = re.sub(r"\ufeff|\u2060", " ", text)
-                yield unescape(text), (match_body.start() + m.start() + 1, text)
-
-
-def index_in_escaped_text(
-    token: str, escaped_text: str, start_offset: int
-) -> tuple[int, int] | None:
-    if token not in escaped_text[start_offset:]:
-        # replace Unicode character to numeric character reference
-        token = escape(token, False).encode("ascii", "xmlcharrefreplace").decode()
-
-    if token in escaped_text[start_offset:]:
-        token_start = escaped_text.index(token, start_offset)
-        return token_start, token_start + len(token)
-    else:
-        return None
+        yield from parse_mobi_html(data.mobi_html, data.mobi_codec)
+
+
+def parse_mobi_html(
+    html: bytes, codec: str
+) -> Iterator[tuple[str, tuple[int, EscapedText]]]:
+    "Scan text nodes of body elements without copying the body"
+    for match_body in MOBI_BODY.finditer(html):
+        for m in MOBI_TEXT_NODE.finditer(html, match_body.start(), match_body.end()):
+            text = m.group(1).decode(codec)
+            if not text.isascii():
+                text = INVISIBLE_CHARS.sub(" ", text)
+            yield unescape(text), (m.start(1), EscapedText(text, codec))
+
+
+def parse_texts(nlp, text_tuples, data: ParseJobData, prefs: Prefs):
+    """
+    Docs are yielded in the order of texts. Child processes only parse texts,
+    contexts and matchers stay in this process. Short texts are parsed
+    together, see `pipe_texts`. Blank pipelines only tokenize texts.
+    """
+    if not nlp.pipe_names:
+        return ((nlp.make_doc(text), context) for text, context in text_tuples)
+    pipe_options: dict[str, int] = {}
+    # spaCy doesn't support multiprocessing on GPU
+    if prefs["parse_processes"] > 1 and not prefs["use_gpu"]:
+        pipe_options = {
+            "n_process": prefs["parse_processes"],
+            "batch_size": prefs["parse_batch_size"],
+        }
+    if prefs["use_parse_cache"]:
+        return pipe_with_cache(
+            nlp,
+            text_tuples,
+            data.spacy_model,
+            data.plugin_path,
+            data.book_path if data.create_x else None,
+            prefs["use_pos"],
+            prefs["parse_chunk_size"],
+            prefs["parse_cache_max_mb"] * 1024 * 1024,
+            **pipe_options,
+        )
+    return pipe_texts(nlp, text_tuples, prefs["parse_chunk_size"], **pipe_options)
 
 
 def match_lemmas(doc, lemma_matcher, phrase_matcher):
+    if isinstance(phrase_matcher, TokenMatcher):
+        return phrase_matcher(doc)
+
     from spacy.util import filter_spans
 
     phrase_spans = phrase_matcher(doc, as_spans=True)
@@ -426,30 +667,30 @@ def kindle_find_lemma(
     start,
     mobi_codec,
     escaped_text,
-    lemmas_conn,
-    ll_conn,
-    lemma_lang,
-    prefs,
+    lemma_lookup,
+    ll_writer,
+    use_pos,
 ):
-    lemma_starts: set[int] = set()
-    for span in match_lemmas(doc, lemma_matcher, phrase_matcher):
-        data = get_kindle_lemma_data(
-            span.lemma_ if prefs["use_pos"] and hasattr(span, "lemma_") else span.text,
-            span.doc[span.start].pos_ if prefs["use_pos"] else None,
-            lemmas_conn,
-            lemma_lang,
-            prefs,
+    spans = match_lemmas(doc, lemma_matcher, phrase_matcher)
+    lemmas = [
+        (
+            span.lemma_ if use_pos and hasattr(span, "lemma_") else span.text,
+            span.doc[span.start].pos_ if use_pos else None,
         )
+        for span in spans
+    ]
+    lemma_lookup.prefetch(lemmas)
+    for span, (lemma, pos) in zip(spans, lemmas):
+        data = lemma_lookup.get(lemma, pos)
         if data is not None:
             kindle_add_lemma(
                 span.start_char,
                 span.end_char,
                 start,
                 doc.text,
-                ll_conn,
+                ll_writer,
                 mobi_codec,
                 escaped_text,
-                lemma_starts,
                 data,
             )
 
@@ -460,7 +701,7 @@ def epub_find_lemma(
     phrase_matcher,
     start,
     escaped_text,
-    interval_tree,
+    interval_index,
     epub,
     xhtml_path,
     use_pos,
@@ -470,7 +711,7 @@ def epub_find_lemma(
         epub_add_lemma(
             span.start_char,
             span.end_char,
-            interval_tree,
+            interval_index,
             doc.text,
             escaped_text,
             start,
@@ -502,88 +743,181 @@ def spacy_to_kindle_pos(pos: str) -> str:
             return "other"
 
 
-def get_kindle_lemma_data(
-    lemma: str,
-    pos: str | None,
-    conn: sqlite3.Connection,
-    lemma_lang: str,
-    prefs: Prefs,
-) -> tuple[int, int] | None:
-    if pos is not None:
-        return get_kindle_lemma_with_pos(lemma, pos, conn, lemma_lang, prefs)
-    else:
-        return get_kindle_lemma_without_pos(lemma, conn)
-
-
-def get_kindle_lemma_with_pos(
-    lemma: str,
-    pos: str,
-    conn: sqlite3.Connection,
-    lemma_lang: str,
-    prefs: Prefs,
-) -> tuple[int, int] | None:
-    if use_kindle_ww_db(lemma_lang, prefs):
-        pos = spacy_to_kindle_pos(pos)
-    else:
-        pos = spacy_to_wiktionary_pos(pos)
-    for data in conn.execute(
-        """
-        SELECT difficulty, senses.id
-        FROM senses JOIN lemmas ON senses.lemma_id = lemmas.id
-        WHERE lemma = ? AND pos = ? LIMIT 1
-        """,
-        (lemma, pos),
+class KindleLemmaLookup:
+    """
+    Find lemma difficulty and sense id for Kindle Word Wise. Results are cached
+    for the whole job including lemmas not found, lemmas not in the cache are
+    queried in batches. The first sense by sense id is chosen, forms are
+    ordered by rowid, same as `LemmaIndex`.
+    """
+
+    # SQLite's default variable limit is 999 before version 3.32
+    BATCH_SIZE = 400
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        lemma_lang: str,
+        prefs: Prefs,
+        lemma_index: LemmaIndex | None = None,
     ):
-        return data
-    if " " in lemma:
-        for data in conn.execute(
+        self.conn = conn
+        self.lemma_index = lemma_index
+        self.lemma_lang = lemma_lang
+        self.use_kindle_pos = use_kindle_ww_db(lemma_lang, prefs)
+        self.cache: dict[tuple[str, str | None], tuple[int, int] | None] = {}
+        self.lookups = 0
+        self.queried_lemmas = 0
+
+    def convert_pos(self, pos: str | None) -> str | None:
+        if pos is None:
+            return None
+        if self.use_kindle_pos:
+            return spacy_to_kindle_pos(pos)
+        return spacy_to_wiktionary_pos(pos)
+
+    def get(self, lemma: str, pos: str | None) -> tuple[int, int] | None:
+        key = (lemma, self.convert_pos(pos))
+        self.lookups += 1
+        if key not in self.cache:
+            self.resolve([key])
+        return self.cache[key]
+
+    def prefetch(self, lemmas: Iterable[tuple[str, str | None]]) -> None:
+        keys = {(lemma, self.convert_pos(pos)) for lemma, pos in lemmas}
+        keys.difference_update(self.cache)
+        if keys:
+            self.resolve(list(keys))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "lemma_lookups": self.lookups,
+            "lemma_cache_hits": self.lookups - self.queried_lemmas,
+            "lemma_cache_misses": self.queried_lemmas,
+        }
+
+    def query(
+        self, sql: str, keys: list[tuple[str, ...]]
+    ) -> dict[tuple[str, ...], tuple[int, int]]:
+        """
+        `sql` selects key columns then difficulty and sense id, the keys
+        are passed in a VALUES list so the result rows return the queried
+        keys even if the database column is case insensitive.
+        """
+        results: dict[tuple[str, ...], tuple[int, int]] = {}
+        values_sql = "(" + ", ".join("?" * len(keys[0])) + ")"
+        for index in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[index : index + self.BATCH_SIZE]
+            for *key, difficulty, sense_id in self.conn.execute(
+                sql.format(", ".join([values_sql] * len(batch))),
+                list(chain.from_iterable(batch)),
+            ):
+                # keep the first row like "LIMIT 1"
+                results.setdefault(tuple(key), (difficulty, sense_id))
+        return results
+
+    def resolve(self, keys: list[tuple[str, str | None]]) -> None:
+        self.queried_lemmas += len(keys)
+        if self.lemma_index is not None:
+            for lemma, pos in keys:
+                self.cache[(lemma, pos)] = (
+                    self.lemma_index.kindle_data_without_pos(lemma)
+                    if pos is None
+                    else self.lemma_index.kindle_data_with_pos(
+                        lemma, pos, self.lemma_lang
+                    )
+                )
+            return
+        for key in keys:
+            self.cache[key] = None
+        pos_keys = [key for key in keys if key[1] is not None]
+        if pos_keys:
+            self.resolve_with_pos(pos_keys)  # type: ignore
+        lemmas = [(lemma,) for lemma, pos in keys if pos is None]
+        if lemmas:
+            self.resolve_without_pos(lemmas)
+
+    def resolve_with_pos(self, keys: list[tuple[str, str]]) -> None:
+        for key, data in self.query(
             """
-            SELECT difficulty, senses.id
-            FROM senses JOIN forms
-            ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos
-            WHERE form = ? LIMIT 1
+            WITH keys(key_lemma, key_pos) AS (VALUES {})
+            SELECT key_lemma, key_pos, difficulty, senses.id
+            FROM keys JOIN lemmas ON lemma = key_lemma
+            JOIN senses ON senses.lemma_id = lemmas.id AND pos = key_pos
+            ORDER BY senses.id
             """,
-            (lemma,),
-        ):
-            return data
-    if lemma_lang == "zh":  # Check simplified form
-        for data in conn.execute(
+            keys,  # type: ignore
+        ).items():
+            self.cache[key] = data  # type: ignore
+
+        phrases = {
+            (lemma,)
+            for lemma, pos in keys
+            if " " in lemma and self.cache[(lemma, pos)] is None
+        }
+        if phrases:
+            found_forms = self.query(
+                """
+                WITH keys(key_form) AS (VALUES {})
+                SELECT key_form, difficulty, senses.id
+                FROM keys JOIN forms ON form = key_form
+                JOIN senses
+                ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos
+                ORDER BY forms.rowid, senses.id
+                """,
+                list(phrases),
+            )
+            for lemma, pos in keys:
+                if self.cache[(lemma, pos)] is None:
+                    self.cache[(lemma, pos)] = found_forms.get((lemma,))
+
+        if self.lemma_lang == "zh":  # Check simplified form
+            not_found = [key for key in keys if self.cache[key] is None]
+            if not_found:
+                for key, data in self.query(
+                    """
+                    WITH keys(key_form, key_pos) AS (VALUES {})
+                    SELECT key_form, key_pos, difficulty, senses.id
+                    FROM keys JOIN forms ON form = key_form
+                    JOIN senses
+                    ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos
+                    WHERE senses.pos = key_pos
+                    ORDER BY forms.rowid, senses.id
+                    """,
+                    not_found,  # type: ignore
+                ).items():
+                    self.cache[key] = data  # type: ignore
+
+    def resolve_without_pos(self, lemmas: list[tuple[str]]) -> None:
+        found = self.query(
             """
-            SELECT difficulty, senses.id
-            FROM senses JOIN forms
-            ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos
-            WHERE form = ? AND senses.pos = ? LIMIT 1
+            WITH keys(key_lemma) AS (VALUES {})
+            SELECT key_lemma, difficulty, senses.id
+            FROM keys JOIN lemmas ON lemma = key_lemma
+            JOIN senses ON senses.lemma_id = lemmas.id
+            WHERE enabled = 1
+            ORDER BY senses.id
             """,
-            (lemma, pos),
-        ):
-            return data
-    return None
-
-
-def get_kindle_lemma_without_pos(
-    lemma: str, conn: sqlite3.Connection
-) -> tuple[int, int] | None:
-    for data in conn.execute(
-        """
-        SELECT difficulty, senses.id
-        FROM senses JOIN lemmas
-        ON senses.lemma_id = lemmas.id
-        WHERE lemma = ? AND enabled = 1 LIMIT 1
-        """,
-        (lemma,),
-    ):
-        return data
-    for data in conn.execute(
-        """
-        SELECT difficulty, senses.id
-        FROM senses JOIN forms
-        ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos
-        WHERE form = ? AND enabled = 1 LIMIT 1
-        """,
-        (lemma,),
-    ):
-        return data
-    return None
+            lemmas,  # type: ignore
+        )
+        not_found = [lemma for lemma in lemmas if lemma not in found]
+        if not_found:
+            found.update(
+                self.query(
+                    """
+                    WITH keys(key_form) AS (VALUES {})
+                    SELECT key_form, difficulty, senses.id
+                    FROM keys JOIN forms ON form = key_form
+                    JOIN senses
+                    ON senses.lemma_id = forms.lemma_id AND senses.pos = forms.pos
+                    WHERE enabled = 1
+                    ORDER BY forms.rowid, senses.id
+                    """,
+                    not_found,  # type: ignore
+                )
+            )
+        for (lemma,), data in found.items():
+            self.cache[(lemma, None)] = data
 
 
 def kindle_add_lemma(
@@ -591,56 +925,44 @@ def kindle_add_lemma(
     token_end: int,
     text_start: int,
     text: str,
-    ll_conn: Connection,
+    ll_writer: LangLayerWriter,
     mobi_codec: str,
-    escaped_text: str,
-    starts: set[int],
+    escaped_text: EscapedText,
     data: tuple[int, int],
 ):
     end = None
     lemma = text[token_start:token_end]
     if mobi_codec:
-        result = index_in_escaped_text(lemma, escaped_text, token_start)
-        if result is None:
-            return
-        lemma_start, lemma_end = result
-        index = text_start + len(escaped_text[:lemma_start].encode(mobi_codec))
+        lemma_start, lemma_end = escaped_text.escaped_range(token_start, token_end)
+        index = text_start + escaped_text.byte_offset(lemma_start)
     else:
         index = text_start + token_start
 
-    if index in starts:
-        return
-    else:
-        starts.add(index)
-
     if " " in lemma:
         if mobi_codec:
-            end = index + len(escaped_text[lemma_start:lemma_end].encode(mobi_codec))
+            end = text_start + escaped_text.byte_offset(lemma_end)
         else:
             end = index + len(lemma)
-    insert_lemma(ll_conn, (index, end) + data)
+    ll_writer.add(index, end, *data)
 
 
 def epub_add_lemma(
     token_start: int,
     token_end: int,
-    interval_tree: IntervalTree | None,
+    interval_index: IntervalIndex | None,
     text: str,
-    escaped_text: str,
+    escaped_text: EscapedText,
     start: int,
     starts: set[int],
     epub: EPUB,
-    xhtml_path: Path,
+    xhtml_path: str,
     lemma_pos: str | None = None,
 ) -> None:
     word = text[token_start:token_end]
-    result = index_in_escaped_text(word, escaped_text, token_start)
-    if result is None:
-        return
-    word_start, word_end = result
+    word_start, word_end = escaped_text.escaped_range(token_start, token_end)
     if word_start in starts:
         return
-    if interval_tree and interval_tree.is_overlap(Interval(word_start, word_end - 1)):
+    if interval_index and interval_index.is_overlap(Interval(word_start, word_end - 1)):
         return
 
     starts.add(word_start)
@@ -649,7 +971,7 @@ def epub_add_lemma(
         start + word_start,
         start + word_end,
         xhtml_path,
-        escaped_text[word_start:word_end],
+        escaped_text.text[word_start:word_end],
     )
 
 
@@ -702,9 +1024,9 @@ def find_named_entity(
     doc: Any,
     mobi_codec: str,
     lang: str,
-    escaped_text: str,
+    escaped_text: EscapedText | None,
     custom_x_ray: CustomX,
-    xhtml_path: Path | None = None,
+    xhtml_path: str | None = None,
 ) -> list[Interval]:
     len_limit = 2 if lang in CJK_LANGS else 3
     starts = set()
@@ -719,20 +1041,11 @@ def find_named_entity(
             continue
 
         ent_text = ent.text if ent.ent_id_ else text
+        start_char = ent.start_char + ent.text.index(ent_text)
+        end_char = start_char + len(ent_text)
         if escaped_text:
-            result = index_in_escaped_text(ent_text, escaped_text, ent.start_char)
-            if result is None:
-                continue
-            start_char, end_char = result
-            if start_char is None:
-                continue
-        elif not ent.ent_id_:
-            start_char = ent.start_char + ent.text.index(ent_text)
-            end_char = start_char + len(ent_text)
-        else:
-            start_char = ent.start_char
-            end_char = ent.end_char
-        book_text = escaped_text if escaped_text else doc.text
+            start_char, end_char = escaped_text.escaped_range(start_char, end_char)
+        book_text = escaped_text.text if escaped_text else doc.text
         selectable_text = book_text[start_char:end_char]
         if start_char in starts:
             continue
@@ -755,9 +1068,10 @@ def find_named_entity(
         # Include the next punctuation so the word can be selected on Kindle
         if re.match(r"[^\w\s]", book_text[end_char : end_char + 1]):
             selectable_text = book_text[start_char : end_char + 1]
-        if mobi_codec:
-            ent_start = start + len(escaped_text[:start_char].encode(mobi_codec))
-            ent_len = len(selectable_text.encode(mobi_codec))
+        if mobi_codec and escaped_text:
+            ent_end = escaped_text.byte_offset(start_char + len(selectable_text))
+            ent_len = ent_end - escaped_text.byte_offset(start_char)
+            ent_start = start + escaped_text.byte_offset(start_char)
         else:
             ent_start = start + start_char
             ent_len = len(selectable_text)
@@ -767,26 +1081,24 @@ def find_named_entity(
     return intervals
 
 
-def load_spacy(model: str, book_path: str | None, use_pos: bool):
-    import spacy
-
-    excluded_components = []
-    if not use_pos:
-        excluded_components.extend(
-            ["tok2vec", "morphologizer", "tagger", "attribute_ruler", "lemmatizer"]
-        )
-    if book_path is None:
-        excluded_components.append("ner")
+# spaCy pipelines and matchers kept by the worker process for later jobs
+SPACY_PIPELINES: dict[tuple[str, bool, bool], Any] = {}
+SPACY_MATCHERS: dict[tuple[int, str, int], tuple[Any, Any]] = {}
+TOKEN_MATCHERS: dict[tuple[int, str, int, int | None], TokenMatcher] = {}
 
-    if model.endswith("_trf"):
-        spacy.require_gpu()
-    else:
-        excluded_components.append("parser")
 
-    nlp = spacy.load(model, exclude=excluded_components)
-    if not model.endswith("_trf") and book_path is not None:
-        # simpler and faster https://spacy.io/usage/linguistic-features#sbd
-        nlp.enable_pipe("senter")
+def load_spacy(
+    model: str, book_path: str | None, use_pos: bool, keep_pipeline: bool = False
+):
+    pipeline_key = (model, use_pos, book_path is not None)
+    nlp = SPACY_PIPELINES.get(pipeline_key)
+    if nlp is None:
+        nlp = create_spacy_pipeline(model, book_path is not None, use_pos)
+        if keep_pipeline:
+            SPACY_PIPELINES[pipeline_key] = nlp
+    elif "entity_ruler" in nlp.pipe_names:
+        # remove previous book's custom X-Ray patterns
+        nlp.remove_pipe("entity_ruler")
 
     if book_path is not None:
         custom_x_path = get_custom_x_path(book_path)
@@ -805,8 +1117,38 @@ def load_spacy(model: str, book_path: str | None, use_pos: bool):
     return nlp
 
 
+def create_spacy_pipeline(model: str, has_ner: bool, use_pos: bool):
+    import spacy
+
+    excluded_components = []
+    if not use_pos:
+        excluded_components.extend(
+            ["tok2vec", "morphologizer", "tagger", "attribute_ruler", "lemmatizer"]
+        )
+    if not has_ner:
+        excluded_components.append("ner")
+
+    if model.endswith("_trf"):
+        spacy.require_gpu()
+    else:
+        excluded_components.append("parser")
+
+    nlp = spacy.load(model, exclude=excluded_components)
+    if not model.endswith("_trf") and has_ner:
+        # simpler and faster https://spacy.io/usage/linguistic-features#sbd
+        nlp.enable_pipe("senter")
+    return nlp
+
+
 def create_spacy_matcher(
-    nlp, model, lemma_lang, is_kindle, lemmas_conn, plugin_path, prefs
+    nlp,
+    model,
+    lemma_lang,
+    is_kindle,
+    lemmas_conn,
+    plugin_path,
+    prefs,
+    keep_matchers=False,
 ):
     from spacy.matcher import PhraseMatcher
     from spacy.tokens import DocBin
@@ -816,7 +1158,6 @@ def create_spacy_matcher(
     model_version = model_version = pkg_versions[
         "spacy_trf_model" if model.endswith("_trf") else "spacy_cpu_model"
     ]
-    phrase_matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
     phrases_doc_path = spacy_doc_path(
         model, model_version, lemma_lang, is_kindle, True, plugin_path, prefs
     )
@@ -831,6 +1172,16 @@ def create_spacy_matcher(
             plugin_path,
             prefs,
         )
+    # doc files are rewritten after customizing lemmas
+    matcher_key = (
+        id(nlp),
+        str(phrases_doc_path),
+        phrases_doc_path.stat().st_mtime_ns,
+    )
+    if matcher_key in SPACY_MATCHERS:
+        return SPACY_MATCHERS[matcher_key]
+
+    phrase_matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
     with phrases_doc_path.open("rb") as f:
         phrases_doc_bin = DocBin().from_bytes(f.read())
 
@@ -841,11 +1192,52 @@ def create_spacy_matcher(
         )
         with lemmas_doc_path.open("rb") as f:
             lemmas_doc_bin = DocBin().from_bytes(f.read())
+    else:
+        lemma_matcher = None
 
     with nlp.select_pipes(disable=disabled_pipes):
         phrase_matcher.add("phrases", phrases_doc_bin.get_docs(nlp.vocab))
-        if prefs["use_pos"] and lemma_lang != "zh":
+        if lemma_matcher is not None:
             lemma_matcher.add("lemmas", lemmas_doc_bin.get_docs(nlp.vocab))
-            return lemma_matcher, phrase_matcher
-        else:
-            return None, phrase_matcher
+
+    if keep_matchers:
+        SPACY_MATCHERS[matcher_key] = (lemma_matcher, phrase_matcher)
+    return lemma_matcher, phrase_matcher
+
+
+def load_blank_spacy(model: str, keep_pipeline: bool = False):
+    "Tokenizer only pipeline, doesn't need the model package"
+    import spacy
+
+    lang = blank_pipeline_lang(model)
+    pipeline_key = (lang, False, False)
+    nlp = SPACY_PIPELINES.get(pipeline_key)
+    if nlp is None:
+        nlp = spacy.blank(lang)
+        if keep_pipeline:
+            SPACY_PIPELINES[pipeline_key] = nlp
+    return nlp
+
+
+def load_token_matcher(
+    nlp,
+    lemmas_db_path: Path,
+    lemmas_conn: Connection,
+    difficulty_limit: int | None,
+    keep_matcher: bool = False,
+) -> TokenMatcher:
+    # database file is rewritten after customizing lemmas
+    matcher_key = (
+        id(nlp),
+        str(lemmas_db_path),
+        lemmas_db_path.stat().st_mtime_ns,
+        difficulty_limit,
+    )
+    if matcher_key in TOKEN_MATCHERS:
+        return TOKEN_MATCHERS[matcher_key]
+    matcher = TokenMatcher(
+        nlp, lemma_pattern_texts_without_pos(lemmas_conn, difficulty_limit)
+    )
+    if keep_matcher:
+        TOKEN_MATCHERS[matcher_key] = matcher
+    return matcher
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import (  # noqa: E402
+    LangLayerWriter,
+    create_lang_layer,
+    discard_db,
+    save_db,
+    sidecar_tmp_path,
+)
+
+
+class TestSidecarDatabase(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.book_path = str(Path(tmp_dir.name) / "book.azw3")
+
+    def test_lang_layer_rows(self):
+        ll_conn, ll_path = create_lang_layer("B000000000", self.book_path, "acr", "0")
+        writer = LangLayerWriter(ll_conn)
+        for start, end, difficulty, sense_id in [
+            (30, 35, 1, 3),
+            (10, 15, 2, 1),
+            (30, 40, 5, 9),
+            (20, None, 3, 2),
+            (10, 12, 4, 8),
+        ]:
+            writer.add(start, end, difficulty, sense_id)
+        writer.flush()
+        writer.add(50, 55, 1, 4)
+        writer.flush()
+        self.assertEqual(
+            writer.stats(), {"word_wise_rows": 4, "word_wise_duplicates": 2}
+        )
+        save_db(ll_conn, ll_path)
+
+        conn = sqlite3.connect(ll_path)
+        self.addCleanup(conn.close)
+        self.assertEqual(
+            conn.execute("SELECT * FROM glosses ORDER BY rowid").fetchall(),
+            [
+                (10, 15, 2, 1, 0),
+                (20, None, 3, 2, 0),
+                (30, 35, 1, 3, 0),
+                (50, 55, 1, 4, 0),
+            ],
+        )
+
+    def test_save_replaces_stale_files(self):
+        ll_path = Path(self.book_path).parent / "LanguageLayer.en.B000000000.kll"
+        ll_path.write_bytes(b"old file")
+        tmp_path = sidecar_tmp_path(ll_path)
+        tmp_path.write_bytes(b"left by a crashed job")
+
+        ll_conn, ll_path = create_lang_layer("B000000000", self.book_path, "acr", "0")
+        self.assertTrue(tmp_path.exists())
+        self.assertEqual(ll_path.read_bytes(), b"old file")
+        save_db(ll_conn, ll_path)
+        self.assertFalse(tmp_path.exists())
+
+        conn = sqlite3.connect(ll_path)
+        self.addCleanup(conn.close)
+        self.assertIn(("acr", "acr"), conn.execute("SELECT * FROM metadata").fetchall())
+
+    def test_discard_failed_job(self):
+        ll_conn, ll_path = create_lang_layer("B000000000", self.book_path, "acr", "0")
+        discard_db(ll_conn, ll_path)
+        self.assertFalse(sidecar_tmp_path(ll_path).exists())
+        self.assertFalse(ll_path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import unittest
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import rapidfuzz
+except ImportError:
+    rapidfuzz = None
+
+from x_ray_share import FUZZ_THRESHOLD, EntityIndex  # noqa: E402
+
+NAMES = [
+    "Harry",
+    "Harry Potter",
+    "Potter",
+    "Mr. Potter",
+    "Hermione Granger",
+    "Hermione",
+    "Ron Weasley",
+    "Ronald",
+    "Weasleys",
+    "Albus Dumbledore",
+    "Dumbledore's",
+    "Hogwarts",
+    "Hogwarts School",
+    "Diagon Alley",
+    "Ministry of Magic",
+    "Sirius",
+    "Serious",
+    "Élodie",
+    "Elodie",
+    "王小明",
+    "...",
+]
+
+
+@unittest.skipIf(rapidfuzz is None, "rapidfuzz is not installed")
+class TestEntityIndex(unittest.TestCase):
+    def test_same_as_extract_one(self):
+        from rapidfuzz.fuzz import token_set_ratio
+        from rapidfuzz.process import extractOne
+        from rapidfuzz.utils import default_process
+
+        scorer = partial(token_set_ratio, processor=default_process)
+        rng = random.Random(0)
+        for _ in range(100):
+            entities: dict[str, None] = {}
+            index = EntityIndex()
+            for name in rng.sample(NAMES, rng.randrange(1, len(NAMES))):
+                entities[name] = None
+                index.add(name)
+            # removed and renamed entities change the dictionary order
+            for name in rng.sample(list(entities), rng.randrange(len(entities))):
+                if rng.random() < 0.5:
+                    del entities[name]
+                    index.remove(name)
+                else:
+                    new_name = name.upper()
+                    if new_name not in entities:
+                        del entities[name]
+                        entities[new_name] = None
+                        index.replace(name, new_name)
+
+            for query in NAMES + ["Harry Potter's", "Mister Weasley", "hogwart"]:
+                result = extractOne(
+                    query, entities.keys(), score_cutoff=FUZZ_THRESHOLD, scorer=scorer
+                )
+                with self.subTest(query=query, names=list(entities)):
+                    self.assertEqual(
+                        index.find(query), None if result is None else result[0]
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
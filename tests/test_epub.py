@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import io
+import sys
+import tempfile
+import tracemalloc
+import unittest
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from epub import EPUB, copy_zip_member, write_zip_member  # noqa: E402
+
+
+class UnseekableWriter:
+    def __init__(self, buffer: io.BytesIO) -> None:
+        self.write = buffer.write
+        self.flush = buffer.flush
+
+
+class TestZipMembers(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.tmp_path = Path(self.tmp_dir.name)
+
+    def test_write_chapter_parts(self):
+        parts = ['<?xml version="1.0" encoding="utf-8"?>\r\n<html><body><p>']
+        for index in range(50000):
+            parts.append(f'<a epub:type="noteref" href="x_ray.xhtml#{index}">Été</a>')
+            parts.append("\r\n" if index % 100 == 0 else " ")
+        parts.append("</p></body></html>\n")
+        expected = "".join(parts).encode("utf-8")
+
+        zip_path = self.tmp_path / "parts.zip"
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            # parts are encoded and compressed without the joined chapter
+            tracemalloc.start()
+            try:
+                write_zip_member(zf, zipfile.ZipInfo("parts.xhtml"), parts)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.assertLess(peak, len(expected) // 4)
+            write_zip_member(zf, zipfile.ZipInfo("joined.xhtml"), "".join(parts))
+        with zipfile.ZipFile(zip_path) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.read("parts.xhtml"), expected)
+            self.assertEqual(zf.read("joined.xhtml"), expected)
+
+    def test_copy_members(self):
+        members = {
+            "mimetype": b"application/epub+zip",
+            "stored.txt": b"stored " * 1000,
+            "deflated.txt": "deflated é ".encode("utf-8") * 1000,
+            "streamed.txt": b"streamed " * 1000,
+        }
+        # members written to an unseekable stream have data descriptors
+        src_buffer = io.BytesIO()
+        with zipfile.ZipFile(UnseekableWriter(src_buffer), "w") as zf:
+            zf.writestr("mimetype", members["mimetype"])
+            zf.writestr("stored.txt", members["stored.txt"])
+            zf.writestr("deflated.txt", members["deflated.txt"], zipfile.ZIP_DEFLATED)
+            with zf.open("streamed.txt", "w") as f:
+                f.write(members["streamed.txt"])
+        src_path = self.tmp_path / "src.zip"
+        src_path.write_bytes(src_buffer.getvalue())
+        dest_path = self.tmp_path / "dest.zip"
+
+        with (
+            zipfile.ZipFile(src_path) as src_zf,
+            zipfile.ZipFile(dest_path, "w", zipfile.ZIP_DEFLATED) as dest_zf,
+        ):
+            self.assertTrue(src_zf.getinfo("streamed.txt").flag_bits & 0x08)
+            for info in src_zf.infolist():
+                copy_zip_member(src_zf, dest_zf, info)
+            write_zip_member(dest_zf, zipfile.ZipInfo("new.txt"), "new member")
+        with zipfile.ZipFile(dest_path) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(zf.namelist()[0], "mimetype")
+            self.assertEqual(zf.getinfo("stored.txt").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(
+                zf.getinfo("deflated.txt").compress_type, zipfile.ZIP_DEFLATED
+            )
+            self.assertEqual(zf.read("new.txt"), b"new member")
+            for name, data in members.items():
+                self.assertEqual(zf.read(name), data)
+
+        # only copied members, appended to an existing archive
+        append_path = self.tmp_path / "append.zip"
+        zipfile.ZipFile(append_path, "w").close()
+        with (
+            zipfile.ZipFile(src_path) as src_zf,
+            zipfile.ZipFile(append_path, "a") as dest_zf,
+        ):
+            for info in src_zf.infolist():
+                copy_zip_member(src_zf, dest_zf, info)
+        with zipfile.ZipFile(append_path) as zf:
+            self.assertIsNone(zf.testzip())
+            for name, data in members.items():
+                self.assertEqual(zf.read(name), data)
+
+    def test_missing_zip_name(self):
+        epub = EPUB("book.epub", None, None, None, {})
+        epub.zip_names = ["OEBPS/text/chapter.xhtml"]
+        self.assertEqual(
+            epub.find_zip_name("chapter.xhtml", "OEBPS"), "OEBPS/text/chapter.xhtml"
+        )
+        with self.assertRaisesRegex(KeyError, "missing.xhtml"):
+            epub.find_zip_name("missing.xhtml", "OEBPS")
+
+
+if __name__ == "__main__":
+    unittest.main()
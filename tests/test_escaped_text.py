@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import unittest
+from html import unescape
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from escaped_text import EscapedText  # noqa: E402
+
+WORDS = [
+    "plain",
+    "caf&eacute;",
+    "&amp;",
+    "&lt;tag&gt;",
+    "&#233;t&#xE9;",
+    "&#x1F600;",
+    "&copy",
+    "&notit;",
+    "&unknown;",
+    "&acE;",
+    "&",
+    "Ünïcödé",
+    "文字",
+]
+
+
+class TestEscapedText(unittest.TestCase):
+    def test_same_as_unescape(self):
+        rng = random.Random(0)
+        for _ in range(500):
+            words = rng.choices(WORDS, k=rng.randrange(1, 8))
+            escaped = " ".join(words)
+            text = unescape(escaped)
+            escaped_text = EscapedText(escaped, "utf-8")
+
+            start = 0
+            escaped_start = 0
+            for word in words:
+                word_text = unescape(word)
+                end = start + len(word_text)
+                self.assertEqual(
+                    escaped_text.escaped_range(start, end),
+                    (escaped_start, escaped_start + len(word)),
+                    escaped,
+                )
+                start = end + 1
+                escaped_start += len(word) + 1
+            self.assertEqual(start - 1, len(text))
+
+            for index in range(len(escaped) + 1):
+                self.assertEqual(
+                    escaped_text.byte_offset(index),
+                    len(escaped[:index].encode("utf-8")),
+                )
+
+    def test_partial_references(self):
+        # "&notit;" is unescaped to "¬it;"
+        escaped_text = EscapedText("&notit;")
+        self.assertEqual(escaped_text.escaped_range(0, 1), (0, 4))
+        self.assertEqual(escaped_text.escaped_range(1, 4), (4, 7))
+
+    def test_references_of_last_character(self):
+        # "&semi;" and "&#59;" are unescaped to ";"
+        escaped_text = EscapedText("a&semi;b&#59;c")
+        self.assertEqual(escaped_text.escaped_range(1, 2), (1, 7))
+        self.assertEqual(escaped_text.escaped_range(3, 4), (8, 13))
+        self.assertEqual(escaped_text.escaped_range(4, 5), (13, 14))
+
+    def test_plain_text(self):
+        escaped_text = EscapedText("plain text", "cp1252")
+        self.assertEqual(escaped_text.escaped_range(6, 10), (6, 10))
+        self.assertEqual(escaped_text.byte_offset(10), 10)
+        self.assertIsNone(escaped_text.starts)
+        self.assertIsNone(escaped_text.byte_offsets)
+
+
+if __name__ == "__main__":
+    unittest.main()
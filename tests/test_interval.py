@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from interval import Interval, IntervalIndex  # noqa: E402
+
+
+def brute_force_overlaps(intervals: list[Interval], query: Interval) -> bool:
+    return any(
+        interval.low <= query.high and query.low <= interval.high
+        for interval in intervals
+    )
+
+
+class TestIntervalIndex(unittest.TestCase):
+    def test_same_as_brute_force(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            intervals = []
+            for _ in range(rng.randrange(1, 30)):
+                low = rng.randrange(1000)
+                intervals.append(Interval(low, low + rng.randrange(50)))
+            index = IntervalIndex.build(intervals)
+            self.assertEqual(len(index), len(intervals))
+            for _ in range(50):
+                low = rng.randrange(-20, 1050)
+                query = Interval(low, low + rng.randrange(20))
+                overlap = index.is_overlap(query)
+                self.assertEqual(
+                    overlap is not None, brute_force_overlaps(intervals, query)
+                )
+                if overlap is not None:
+                    self.assertIn(overlap, intervals)
+                    self.assertTrue(brute_force_overlaps([overlap], query))
+
+    def test_touching_ends(self):
+        index = IntervalIndex.build([Interval(5, 10), Interval(0, 2)])
+        self.assertEqual(index.is_overlap(Interval(10, 12)), Interval(5, 10))
+        self.assertEqual(index.is_overlap(Interval(2, 2)), Interval(0, 2))
+        self.assertIsNone(index.is_overlap(Interval(3, 4)))
+        self.assertIsNone(index.is_overlap(Interval(11, 20)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from kfx_content import (  # noqa: E402
+    IMAGE_RECORD,
+    TEXT_RECORD,
+    KFXRecord,
+    iter_kfx_content,
+    kfx_content_end,
+    pack_kfx_content,
+)
+
+
+class TestKFXContent(unittest.TestCase):
+    def test_round_trip(self):
+        records = [
+            KFXRecord(0, "Chapter 1", TEXT_RECORD),
+            KFXRecord(10, "Ünïcödé 文字 😀", TEXT_RECORD),
+            KFXRecord(24, "", TEXT_RECORD),
+            KFXRecord(24, "resource/rsrc1", IMAGE_RECORD),
+            KFXRecord(2**40, "end", TEXT_RECORD),
+        ]
+        json_content = json.dumps(
+            {"data": [record._asdict() for record in records]}, ensure_ascii=False
+        )
+        kfx_content = pack_kfx_content(json_content)
+        self.assertEqual(list(iter_kfx_content(kfx_content)), records)
+        self.assertEqual(kfx_content_end(kfx_content), 2**40 + 3)
+
+    def test_empty_payload(self):
+        kfx_content = pack_kfx_content(json.dumps({"data": []}))
+        self.assertEqual(kfx_content, b"")
+        self.assertEqual(list(iter_kfx_content(kfx_content)), [])
+        self.assertEqual(kfx_content_end(kfx_content), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
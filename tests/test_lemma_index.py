@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from epub import EPUB  # noqa: E402
+from lemma_index import LEMMA_INDEXES, lemma_index_path, load_lemma_index  # noqa: E402
+from parse_job import KindleLemmaLookup  # noqa: E402
+
+LEMMAS = [
+    # lemma, [(pos, enabled, difficulty)], [(form, pos)]
+    ("Apple", [("noun", 1, 1), ("verb", 0, 2)], [("apples", "noun")]),
+    ("apple", [("noun", 1, 3)], [("Apples", "noun")]),
+    ("run", [("verb", 1, 2), ("verb", 1, None), ("noun", 1, 4)], [("ran", "verb")]),
+    ("look up", [("verb", 1, 3)], [("looked up", "verb"), ("look it up", "verb")]),
+    ("Äpfel", [("noun", 0, 5), ("noun", 1, 5)], [("äpfel", "noun")]),
+    ("汉字", [("noun", 1, 1)], [("漢字", "noun"), ("漢字", "verb")]),
+]
+WORDS = [
+    "apple",
+    "APPLE",
+    "apples",
+    "run",
+    "ran",
+    "look up",
+    "looked up",
+    "look it up",
+    "Äpfel",
+    "äpfel",
+    "汉字",
+    "漢字",
+    "missing",
+]
+POS = ["noun", "verb", "adj"]
+
+
+def create_lemmas_db(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE lemmas (id INTEGER PRIMARY KEY, lemma TEXT COLLATE NOCASE);
+        CREATE TABLE senses (
+        id INTEGER PRIMARY KEY, enabled INTEGER, lemma_id INTEGER, pos TEXT,
+        short_def TEXT, full_def TEXT, example TEXT, difficulty INTEGER, ipa TEXT);
+        CREATE TABLE forms (form TEXT COLLATE NOCASE, pos TEXT, lemma_id INTEGER);
+        CREATE INDEX idx_lemmas ON lemmas (lemma);
+        CREATE INDEX idx_senses ON senses (lemma_id, pos);
+        CREATE INDEX idx_forms ON forms (form, pos);
+        """
+    )
+    for lemma_id, (lemma, senses, forms) in enumerate(LEMMAS, 1):
+        conn.execute("INSERT INTO lemmas VALUES(?, ?)", (lemma_id, lemma))
+        for pos, enabled, difficulty in senses:
+            conn.execute(
+                "INSERT INTO senses (enabled, lemma_id, pos, short_def, full_def, "
+                "example, difficulty, ipa) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                (enabled, lemma_id, pos, f"{lemma} {pos}", "", "", difficulty, ""),
+            )
+        conn.executemany(
+            "INSERT INTO forms VALUES(?, ?, ?)",
+            ((form, pos, lemma_id) for form, pos in forms),
+        )
+    conn.commit()
+    return conn
+
+
+class TestLemmaIndex(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.db_path = Path(tmp_dir.name) / "lemmas.db"
+        self.conn = create_lemmas_db(self.db_path)
+        self.addCleanup(self.conn.close)
+        self.addCleanup(LEMMA_INDEXES.clear)
+        self.epub = EPUB("book.epub", None, None, None, {})
+        self.epub.lemmas_conn = self.conn
+        self.epub.has_multiple_ipas = False
+        self.select_sql = self.epub.gloss_select_sql("en")
+
+    def test_same_glosses_as_sql(self):
+        lemma_index = load_lemma_index(self.db_path, self.conn)
+        self.assertIsNotNone(lemma_index)
+        for word in WORDS:
+            with self.subTest(word=word):
+                self.assertEqual(
+                    self.epub.query_gloss_by_ids(
+                        self.select_sql, lemma_index.gloss_sense_ids_without_pos(word)
+                    ),
+                    self.epub.query_gloss_without_pos(self.select_sql, word),
+                )
+            for lang in ("en", "zh"):
+                for pos in POS:
+                    with self.subTest(word=word, pos=pos, lang=lang):
+                        self.assertEqual(
+                            self.epub.query_gloss_by_ids(
+                                self.select_sql,
+                                lemma_index.gloss_sense_ids_with_pos(word, pos, lang),
+                            ),
+                            self.epub.query_gloss_with_pos(
+                                self.select_sql, word, pos, lang
+                            ),
+                        )
+
+    def test_same_kindle_data_as_sql(self):
+        lemma_index = load_lemma_index(self.db_path, self.conn)
+        prefs = {"kindle_gloss_lang": "en", "use_wiktionary_for_kindle": True}
+        keys = [(word, pos) for word in WORDS for pos in POS + [None]]
+        for lang in ("en", "zh"):
+            with self.subTest(lang=lang):
+                sql_lookup = KindleLemmaLookup(self.conn, lang, prefs)
+                index_lookup = KindleLemmaLookup(self.conn, lang, prefs, lemma_index)
+                sql_lookup.resolve(keys)
+                index_lookup.resolve(keys)
+                self.assertEqual(index_lookup.cache, sql_lookup.cache)
+
+    def test_rebuild_corrupted_file(self):
+        load_lemma_index(self.db_path, self.conn)
+        LEMMA_INDEXES.clear()
+        index_path = lemma_index_path(self.db_path)
+        index_path.write_bytes(index_path.read_bytes()[:20])
+        lemma_index = load_lemma_index(self.db_path, self.conn)
+        self.assertIsNotNone(lemma_index)
+        self.assertEqual(lemma_index.gloss_sense_ids_without_pos("ran"), [4])
+
+    def test_sql_fallback(self):
+        self.conn.execute("DROP TABLE forms")
+        self.assertIsNone(load_lemma_index(self.db_path, self.conn))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from mediawiki_cache import TitleCache  # noqa: E402
+
+
+class TestTitleCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache = TitleCache(Path(tmp_dir.name) / "en.db", ["description"])
+        self.addCleanup(self.cache.close)
+
+    def rows(self) -> list[tuple[str, int | None]]:
+        return self.cache.conn.execute("SELECT title, desc_id FROM titles").fetchall()
+
+    def test_not_found_keeps_fresh_description(self):
+        with self.cache.transaction():
+            desc_id = self.cache.add_description("Apple fruit")
+            self.cache.add_titles(["Apple"], desc_id)
+            self.cache.add_titles(["APPLE"], None)
+        self.assertEqual(self.rows(), [("Apple", desc_id)])
+        self.assertEqual(self.cache.lookup("apple"), (True, ("Apple fruit",)))
+
+    def test_replace_expired_and_not_found_titles(self):
+        with self.cache.transaction():
+            self.cache.add_titles(["Pear"], None)
+            desc_id = self.cache.add_description("Pear fruit")
+            self.cache.add_titles(["pear"], desc_id)
+        self.assertEqual(self.rows(), [("Pear", desc_id)])
+
+        self.cache.conn.execute("UPDATE titles SET fetched_at = 0")
+        with self.cache.transaction():
+            self.cache.add_titles(["PEAR"], None)
+        self.assertEqual(self.rows(), [("Pear", None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import spacy
+except ImportError:
+    spacy = None
+
+from parse_cache import parse_cache_folder, save_parse_cache  # noqa: E402
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.plugin_path = Path(tmp_dir.name) / "WordDumb.zip"
+        with zipfile.ZipFile(self.plugin_path, "w") as zf:
+            zf.writestr(
+                "data/deps.json",
+                json.dumps({"spacy_cpu_model": "3.6.0", "spacy_trf_model": "3.6.1"}),
+            )
+        self.cache_folder = parse_cache_folder(self.plugin_path)
+
+    def test_evict_by_size(self):
+        for index in range(4):
+            path = self.cache_folder / f"{index}.spacy"
+            save_parse_cache(path, b"x" * 100, 250)
+            os.utime(path, ns=(index, index))
+        save_parse_cache(self.cache_folder / "big.spacy", b"x" * 300, 250)
+        self.assertEqual(
+            sorted(path.name for path in self.cache_folder.iterdir()),
+            ["2.spacy", "3.spacy"],
+        )
+
+    @unittest.skipIf(spacy is None, "spaCy is not installed")
+    def test_corrupted_cache_file(self):
+        from parse_cache import parse_cache_path, pipe_with_cache
+
+        nlp = spacy.blank("en")
+        text_tuples = [("Hello world.", 0), ("Second text", 1)]
+        cache_path = parse_cache_path(
+            [text for text, _ in text_tuples],
+            "en_core_web_sm",
+            self.plugin_path,
+            None,
+            False,
+            0,
+        )
+        for data in (b"", b"not a DocBin file"):
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_path.write_bytes(data)
+            results = list(
+                pipe_with_cache(
+                    nlp,
+                    text_tuples,
+                    "en_core_web_sm",
+                    self.plugin_path,
+                    None,
+                    False,
+                    0,
+                    1024 * 1024,
+                )
+            )
+            self.assertEqual(
+                [(doc.text, context) for doc, context in results], text_tuples
+            )
+            self.assertNotEqual(cache_path.read_bytes(), data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import spacy
+except ImportError:
+    spacy = None
+
+from text_chunks import pipe_texts  # noqa: E402
+
+WORDS = ["The", "cat", "sat", "on", "Mr.", "Smith's", "mat", "can't", "é", "1,000"]
+
+
+def random_texts(rng: random.Random) -> list[tuple[str, int]]:
+    texts = []
+    for index in range(rng.randrange(1, 40)):
+        words = rng.choices(WORDS, k=rng.randrange(0, 60))
+        text = ""
+        for word in words:
+            text += word + rng.choice([" ", " ", ". ", "! ", "\n"])
+        texts.append((text.rstrip(" ") if rng.random() < 0.5 else text, index))
+    return texts
+
+
+@unittest.skipIf(spacy is None, "spaCy is not installed")
+class TestPipeTexts(unittest.TestCase):
+    def test_same_as_pipe(self):
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        rng = random.Random(0)
+        for chunk_size in (0, 1, 8, 50, 500):
+            for _ in range(20):
+                text_tuples = random_texts(rng)
+                expected = list(nlp.pipe(text_tuples, as_tuples=True))
+                results = list(pipe_texts(nlp, text_tuples, chunk_size))
+                self.assertEqual(
+                    [context for _, context in results],
+                    [context for _, context in expected],
+                )
+                for (doc, _), (expected_doc, _) in zip(results, expected):
+                    with self.subTest(chunk_size=chunk_size, text=expected_doc.text):
+                        self.assertIn(
+                            doc.text, (expected_doc.text, expected_doc.text + " ")
+                        )
+                        self.assertEqual(
+                            [token.text for token in doc],
+                            [token.text for token in expected_doc],
+                        )
+                        self.assertEqual(
+                            [token.idx for token in doc],
+                            [token.idx for token in expected_doc],
+                        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+try:
+    import spacy
+except ImportError:
+    spacy = None
+
+from token_matcher import TokenMatcher  # noqa: E402
+
+TEXT = (
+    "I can't say he'll come, won't he? John's dog didn't bark at "
+    "John. Can't you see? I've got a red Shoe and the shoe horn "
+    "in New York City; New York is big."
+)
+PATTERNS = [
+    "ca",
+    "n't",
+    "can't",
+    "'ll",
+    "he'll",
+    "say",
+    "John",
+    "'s",
+    "dog",
+    "bark at",
+    "I",
+    "red shoe",
+    "shoe",
+    "shoe horn",
+    "New York",
+    "York City",
+    "New York City",
+    "see",
+]
+
+
+@unittest.skipIf(spacy is None, "spaCy is not installed")
+class TestTokenMatcher(unittest.TestCase):
+    def test_same_spans_as_phrase_matcher(self):
+        from spacy.matcher import PhraseMatcher
+        from spacy.util import filter_spans
+
+        nlp = spacy.blank("en")
+        phrase_matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+        phrase_matcher.add("phrases", list(nlp.tokenizer.pipe(PATTERNS)))
+        token_matcher = TokenMatcher(nlp, PATTERNS)
+
+        doc = nlp(TEXT)
+        expected = [
+            (span.start, span.end)
+            for span in filter_spans(phrase_matcher(doc, as_spans=True))
+        ]
+        self.assertIn("n't", [token.text for token in doc])
+        self.assertEqual(
+            [(span.start, span.end) for span in token_matcher(doc)], expected
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import bz2
+import gzip
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from wikipedia_dump import (  # noqa: E402
+    OfflineWikipedia,
+    build_wikipedia_dump_index,
+)
+
+PAGES_ARTICLES = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+  <page>
+    <title>Ada Lovelace</title>
+    <ns>0</ns>
+    <revision><text>{{Infobox person|name={{nowrap|Ada}}}}
+'''Augusta Ada King''' was an English [[mathematician]] and
+[[Writer|writer]].<ref>Source</ref> [[File:Ada.jpg|thumb|A [[portrait]]]]
+&lt;!-- comment --&gt;
+== Early life ==
+Not in the intro.</text></revision>
+  </page>
+  <page>
+    <title>Lady Lovelace</title>
+    <ns>0</ns>
+    <redirect title="Ada Lovelace" />
+    <revision><text>#REDIRECT [[Ada Lovelace]]</text></revision>
+  </page>
+  <page>
+    <title>Lovelace</title>
+    <ns>0</ns>
+    <redirect title="Ada Lovelace#Early life" />
+    <revision><text>#REDIRECT [[Ada Lovelace#Early life]]</text></revision>
+  </page>
+  <page>
+    <title>Ada</title>
+    <ns>0</ns>
+    <revision><text>'''Ada''' may refer to: {{disambiguation}}</text></revision>
+  </page>
+  <page>
+    <title>Talk:Ada Lovelace</title>
+    <ns>1</ns>
+    <revision><text>Talk page.</text></revision>
+  </page>
+</mediawiki>
+"""
+ABSTRACT = """<feed>
+  <doc>
+    <title>Wikipedia: Charles Babbage</title>
+    <url>https://en.wikipedia.org/wiki/Charles_Babbage</url>
+    <abstract>Charles Babbage was an English polymath.</abstract>
+  </doc>
+  <doc>
+    <title>Wikipedia: Empty</title>
+    <url>https://en.wikipedia.org/wiki/Empty</url>
+    <abstract></abstract>
+  </doc>
+</feed>
+"""
+
+
+class TestWikipediaDump(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.tmp_path = Path(self.tmp_dir.name)
+
+    def open_index(self, dump_path: Path, expected_count: int) -> OfflineWikipedia:
+        index_path = self.tmp_path / "index/en.db"
+        self.assertEqual(
+            build_wikipedia_dump_index(dump_path, index_path), expected_count
+        )
+        wikipedia = OfflineWikipedia("en", index_path)
+        self.addCleanup(wikipedia.close)
+        return wikipedia
+
+    def test_pages_articles_dump(self):
+        dump_path = self.tmp_path / "pages-articles.xml.bz2"
+        dump_path.write_bytes(bz2.compress(PAGES_ARTICLES.encode("utf-8")))
+        wikipedia = self.open_index(dump_path, 2)
+
+        intro = "Augusta Ada King was an English mathematician and\nwriter."
+        self.assertEqual(
+            wikipedia.get_cache("ada lovelace"), {"intro": intro, "item_id": None}
+        )
+        self.assertEqual(wikipedia.get_cache("Lady Lovelace")["intro"], intro)
+        self.assertEqual(wikipedia.redirected_titles("Ada Lovelace"), ["Lady Lovelace"])
+        for title in ("Lovelace", "Ada", "Talk:Ada Lovelace", "Missing"):
+            self.assertIsNone(wikipedia.get_cache(title))
+
+    def test_abstract_dump(self):
+        dump_path = self.tmp_path / "abstract.xml.gz"
+        dump_path.write_bytes(gzip.compress(ABSTRACT.encode("utf-8")))
+        wikipedia = self.open_index(dump_path, 1)
+
+        self.assertEqual(
+            wikipedia.get_cache("Charles Babbage")["intro"],
+            "Charles Babbage was an English polymath.",
+        )
+        self.assertIsNone(wikipedia.get_cache("Empty"))
+        self.assertEqual(wikipedia.redirected_titles("Charles Babbage"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
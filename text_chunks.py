@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+Run the spaCy pipeline on docs of similar length: adjacent short texts are
+joined to one doc and long texts are split, then the parsed docs are split
+back so each text still gets a doc of its own text and its context.
+
+Joined texts are separated by a space, so named entities and sentences could
+cross text boundaries and the results differ from parsing each text alone.
+Disabled unless the "parse_chunk_size" preference is set.
+"""
+
+from typing import Any, Iterable, Iterator, TypeVar
+
+Context = TypeVar("Context")
+
+SENTENCE_END_CHARS = frozenset(".!?。！？…")
+# tokens of a batch sent to the pipeline
+PIPE_BATCH_TOKENS = 16000
+
+
+class TextNode:
+    def __init__(self, context: Any, part_count: int) -> None:
+        self.context = context
+        self.part_count = part_count
+        self.parts: list[Any] = []
+
+
+def pipe_texts(
+    nlp: Any,
+    text_tuples: Iterable[tuple[str, Context]],
+    chunk_size: int,
+    **pipe_options: int,
+) -> Iterator[tuple[Any, Context]]:
+    """
+    Same as `nlp.pipe(text_tuples, as_tuples=True, **pipe_options)`,
+    `chunk_size` is the maximum tokens of a doc passed to the pipeline.
+    Docs of joined texts end with a space if the text doesn't.
+    """
+    from spacy.tokens import Doc
+
+    if chunk_size <= 0:
+        yield from nlp.pipe(text_tuples, as_tuples=True, **pipe_options)
+        return
+
+    pipe_options.setdefault("batch_size", max(1, PIPE_BATCH_TOKENS // chunk_size))
+    for chunk, segments in nlp.pipe(
+        chunk_docs(nlp, text_tuples, chunk_size), as_tuples=True, **pipe_options
+    ):
+        for token_start, token_end, node in segments:
+            if token_start == 0 and token_end == len(chunk):
+                node.parts.append(chunk)
+            else:
+                node.parts.append(chunk[token_start:token_end].as_doc())
+            if len(node.parts) == node.part_count:
+                if node.part_count == 1:
+                    yield node.parts[0], node.context
+                else:
+                    doc = Doc.from_docs(node.parts, ensure_whitespace=False)
+                    yield doc, node.context
+
+
+def chunk_docs(
+    nlp: Any, text_tuples: Iterable[tuple[str, Any]], chunk_size: int
+) -> Iterator[tuple[Any, list[tuple[int, int, TextNode]]]]:
+    "Yield tokenized docs and token ranges of their texts"
+    pending: list[tuple[Any, Any]] = []
+    pending_tokens = 0
+    for text, context in text_tuples:
+        doc = nlp.make_doc(text)
+        if pending and (
+            len(doc) > chunk_size or pending_tokens + len(doc) > chunk_size
+        ):
+            yield join_docs(pending)
+            pending = []
+            pending_tokens = 0
+        if len(doc) > chunk_size:
+            pieces = split_doc(doc, chunk_size)
+            node = TextNode(context, len(pieces))
+            for piece in pieces:
+                yield piece, [(0, len(piece), node)]
+        else:
+            pending.append((doc, context))
+            pending_tokens += len(doc)
+    if pending:
+        yield join_docs(pending)
+
+
+def join_docs(
+    doc_tuples: list[tuple[Any, Any]],
+) -> tuple[Any, list[tuple[int, int, TextNode]]]:
+    from spacy.tokens import Doc
+
+    segments = []
+    token_start = 0
+    for doc, context in doc_tuples:
+        segments.append((token_start, token_start + len(doc), TextNode(context, 1)))
+        token_start += len(doc)
+    if len(doc_tuples) == 1:
+        return doc_tuples[0][0], segments
+    return Doc.from_docs([doc for doc, _ in doc_tuples]), segments
+
+
+def split_doc(doc: Any, chunk_size: int) -> list[Any]:
+    "Split after sentence end punctuation in the second half of a chunk"
+    pieces = []
+    start = 0
+    while len(doc) - start > chunk_size:
+        end = start + chunk_size
+        for index in range(end - 1, start + chunk_size // 2, -1):
+            if doc[index].text[-1] in SENTENCE_END_CHARS:
+                end = index + 1
+                break
+        pieces.append(doc[start:end].as_doc())
+        start = end
+    pieces.append(doc[start:].as_doc())
+    return pieces
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Find Word Wise lemmas and forms without the spaCy model. Used when POS and
+X-Ray are disabled: the model's pipeline would only tokenize texts for a
+`PhraseMatcher` on `LOWER`. Texts are tokenized by the rule-based tokenizer of
+`spacy.blank(lang)` instead and matched with a token trie of the same patterns.
+"""
+
+from typing import Any, Iterable
+
+# tokenizers of these languages use segmenters installed with the model
+NO_BLANK_TOKENIZER_LANGS = frozenset(["ja", "ko", "zh"])
+# trie key of the last token of a pattern, tokens are never empty
+PATTERN_END = ""
+
+
+def can_use_token_matcher(lang: str, create_x: bool, use_pos: bool) -> bool:
+    return not create_x and not use_pos and lang not in NO_BLANK_TOKENIZER_LANGS
+
+
+def blank_pipeline_lang(spacy_model: str) -> str:
+    "spaCy language code, Norwegian models start with 'nb'"
+    return spacy_model.split("_", 1)[0]
+
+
+class TokenMatcher:
+    def __init__(self, nlp: Any, patterns: Iterable[str]) -> None:
+        self.trie: dict[str, Any] = {}
+        for doc in nlp.tokenizer.pipe(patterns):
+            node = self.trie
+            for token in doc:
+                node = node.setdefault(token.lower_, {})
+            if node is not self.trie:
+                node[PATTERN_END] = True
+
+    def __call__(self, doc: Any) -> list[Any]:
+        "Same as `filter_spans(phrase_matcher(doc, as_spans=True))`"
+        words = [token.lower_ for token in doc]
+        matches = []
+        for start in range(len(words)):
+            node = self.trie
+            for end in range(start, len(words)):
+                node = node.get(words[end])
+                if node is None:
+                    break
+                if PATTERN_END in node:
+                    matches.append((start, end + 1))
+
+        # longer then earlier matches first, like `spacy.util.filter_spans`
+        matches.sort(key=lambda match: (match[0] - match[1], match[0]))
+        seen_tokens: set[int] = set()
+        spans = []
+        for start, end in matches:
+            if start not in seen_tokens and end - 1 not in seen_tokens:
+                spans.append((start, end))
+                seen_tokens.update(range(start, end))
+        return [doc[start:end] for start, end in sorted(spans)]
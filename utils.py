@@ -38,6 +38,19 @@ class Prefs(TypedDict):
     last_opened_kindle_lemmas_language: str
     last_opened_wiktionary_lemmas_language: str
     use_wiktionary_for_kindle: bool
+    worker_idle_timeout: int
+    worker_memory_limit: int
+    use_lemma_index: bool
+    use_parse_cache: bool
+    parse_cache_max_mb: int
+    mediawiki_workers: int
+    mediawiki_cache_ttl: int
+    mediawiki_not_found_ttl: int
+    mediawiki_cache_max_mb: int
+    map_cache_max_mb: int
+    parse_processes: int
+    parse_batch_size: int
+    parse_chunk_size: int
 
 
 def load_plugin_json(plugin_path: Path, filepath: str) -> Any:
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+"""
+Create X-Ray without network: build a SQLite index of Wikipedia intros and
+redirects from a local dump file, then answer `Wikipedia` queries from it.
+
+Supported dumps: "pages-articles" and "abstract" XML files, could be
+compressed with bzip2 or gzip.
+"""
+
+import bz2
+import gzip
+import os
+import re
+import sqlite3
+from html import unescape
+from pathlib import Path
+from typing import IO, Iterator
+from urllib.parse import unquote
+from xml.etree.ElementTree import Element, iterparse
+
+try:
+    from .mediawiki import Wikipedia, WikipediaCache
+except ImportError:
+    from mediawiki import Wikipedia, WikipediaCache
+
+INSERT_BATCH = 10000
+WIKITEXT_COMMENT = re.compile(r"<!--.*?-->", re.S)
+WIKITEXT_REF = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.S | re.I)
+WIKITEXT_TAG = re.compile(r"<[^>]+>")
+WIKITEXT_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}|\{\|[^{}]*?\|\}")
+# file and category namespaces of common languages
+WIKITEXT_FILE_LINK = re.compile(
+    r"\[\[\s*(?:File|Image|Category|Datei|Bild|Kategorie|Fichier|Catégorie|Archivo|"
+    r"Imagen|Categoría|Ficheiro|Imagem|Categoria|Plik|Kategoria|Файл|Категория|"
+    r"ファイル|画像|カテゴリ|文件|图像|分类):"
+    r"[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]",
+    re.I,
+)
+WIKITEXT_LINK = re.compile(r"\[\[(?:[^\[\]|]*\|)?([^\[\]]*)\]\]")
+WIKITEXT_EXTERNAL_LINK = re.compile(r"\[(?:https?:)?//[^\s\]]+ ?([^\]]*)\]")
+WIKITEXT_QUOTES = re.compile(r"'{2,}")
+DISAMBIGUATION_TEMPLATE = re.compile(
+    r"\{\{\s*(?:disambig|dab|hndis|geodis|set index|surname|given name)[^{}]*\}\}",
+    re.I,
+)
+
+
+def wikipedia_dump_path(plugin_path: Path, lang: str) -> Path:
+    return plugin_path.parent / f"worddumb-wikipedia-dump/{lang}.db"
+
+
+def open_dump(dump_path: Path) -> IO[bytes]:
+    if dump_path.suffix == ".bz2":
+        return bz2.open(dump_path)
+    if dump_path.suffix == ".gz":
+        return gzip.open(dump_path)
+    return dump_path.open("rb")
+
+
+def local_name(element: Element) -> str:
+    return element.tag.rpartition("}")[2]
+
+
+def child_text(element: Element, name: str) -> str:
+    for child in element:
+        if local_name(child) == name:
+            return child.text or ""
+    return ""
+
+
+def wikitext_intro(wikitext: str) -> str:
+    "Plain text paragraphs before the first section heading"
+    text = re.split(r"^==", wikitext, maxsplit=1, flags=re.M)[0]
+    text = WIKITEXT_COMMENT.sub("", text)
+    text = WIKITEXT_REF.sub("", text)
+    # nested templates and tables are removed from inside out
+    while True:
+        text, count = WIKITEXT_TEMPLATE.subn("", text)
+        if count == 0:
+            break
+    text = WIKITEXT_FILE_LINK.sub("", text)
+    text = WIKITEXT_LINK.sub(r"\1", text)
+    text = WIKITEXT_EXTERNAL_LINK.sub(r"\1", text)
+    text = WIKITEXT_TAG.sub("", text)
+    text = WIKITEXT_QUOTES.sub("", unescape(text))
+    paragraphs = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(p for p in paragraphs if p and not p.startswith(("|", "!")))
+
+
+def iter_dump(dump_file: IO[bytes]) -> Iterator[tuple[str, str, str | None]]:
+    "Yield title, intro and redirect target of article pages"
+    for _, element in iterparse(dump_file):
+        name = local_name(element)
+        if name == "page":
+            title = child_text(element, "title")
+            if child_text(element, "ns") == "0" and title:
+                redirect = next(
+                    (e.get("title") for e in element if local_name(e) == "redirect"),
+                    None,
+                )
+                if redirect is not None:
+                    # section redirects point to text of the whole page
+                    if "#" not in redirect:
+                        yield title, "", redirect
+                else:
+                    revision = next(
+                        (e for e in element if local_name(e) == "revision"), None
+                    )
+                    wikitext = "" if revision is None else child_text(revision, "text")
+                    if not DISAMBIGUATION_TEMPLATE.search(wikitext):
+                        yield title, wikitext_intro(wikitext), None
+            element.clear()
+        elif name == "doc":
+            # abstract dump
+            url = child_text(element, "url")
+            abstract = child_text(element, "abstract").strip()
+            if "/wiki/" in url and abstract:
+                title = unquote(url.rsplit("/wiki/", 1)[1]).replace("_", " ")
+                yield title, abstract, None
+            element.clear()
+
+
+def build_wikipedia_dump_index(dump_path: Path, index_path: Path) -> int:
+    "Return the number of titles in the index"
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(
+        """
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+
+        CREATE TABLE titles (title TEXT PRIMARY KEY COLLATE NOCASE, desc_id INTEGER);
+        CREATE TABLE descriptions (id INTEGER PRIMARY KEY, description TEXT);
+        CREATE TEMP TABLE redirects (title TEXT, target TEXT);
+        """
+    )
+    pages: list[tuple[int, str, str]] = []
+    redirects: list[tuple[str, str]] = []
+
+    def insert_rows() -> None:
+        conn.executemany(
+            "INSERT INTO descriptions VALUES(?, ?)",
+            ((desc_id, intro) for desc_id, _, intro in pages),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO titles VALUES(?, ?)",
+            ((title, desc_id) for desc_id, title, _ in pages),
+        )
+        conn.executemany("INSERT INTO redirects VALUES(?, ?)", redirects)
+        pages.clear()
+        redirects.clear()
+
+    with open_dump(dump_path) as dump_file:
+        for desc_id, (title, intro, redirect) in enumerate(iter_dump(dump_file)):
+            if redirect is not None:
+                redirects.append((title, redirect))
+            elif intro:
+                pages.append((desc_id, title, intro))
+            if len(pages) + len(redirects) >= INSERT_BATCH:
+                insert_rows()
+    insert_rows()
+    conn.executescript(
+        """
+        INSERT OR IGNORE INTO titles
+        SELECT redirects.title, titles.desc_id FROM redirects
+        JOIN titles ON redirects.target = titles.title;
+
+        CREATE INDEX idx_titles ON titles(desc_id);
+        """
+    )
+    conn.commit()
+    (count,) = conn.execute("SELECT count(*) FROM titles").fetchone()
+    conn.close()
+    os.replace(tmp_path, index_path)
+    return count
+
+
+class OfflineWikipedia(Wikipedia):
+    "Read intros from the index, titles not in the index are not found"
+
+    def __init__(self, lang: str, index_path: Path) -> None:
+        self.lang = lang
+        self.source_id = 1
+        self.max_workers = 1
+        self.conn = sqlite3.connect(f"{index_path.as_uri()}?mode=ro", uri=True)
+        self.intros: dict[str, WikipediaCache | None] = {}
+
+    def close(self):
+        self.conn.close()
+
+    def has_cache(self, title: str) -> bool:
+        return True
+
+    def get_cache(self, title: str) -> WikipediaCache | None:
+        if title in self.intros:
+            return self.intros[title]
+        intro = None
+        for (desc,) in self.conn.execute(
+            """
+            SELECT description FROM titles
+            JOIN descriptions ON titles.desc_id = descriptions.id WHERE title = ?
+            """,
+            (title,),
+        ):
+            intro = {"intro": desc, "item_id": None}
+        self.intros[title] = intro
+        return intro
+
+    def add_title(self, title: str, desc_id: int | None) -> None:
+        pass
+
+    def redirected_titles(self, title: str) -> list[str]:
+        return [
+            other_title
+            for (other_title,) in self.conn.execute(
+                """
+                SELECT title FROM titles
+                WHERE title != ? AND
+                desc_id = (SELECT desc_id FROM titles WHERE title = ?)
+                """,
+                (title, title),
+            )
+        ]
+
+    def query(self, titles: set[str]) -> None:
+        pass
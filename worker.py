@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+"""
+Keep spaCy pipelines loaded between jobs: the plugin sends jobs to long-lived
+system Python processes started with `__main__.py --worker`.
+
+Messages are length-prefixed frames on the worker's stdin and stdout.
+A job is a JSON header frame followed by a payload frame (MOBI HTML or packed
+KFX content bytes), the worker answers with progress frames then a result frame.
+Jobs with "db_path" rebuild spaCy docs of customized lemmas.
+"""
+
+import json
+import platform
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+FRAME_HEADER = struct.Struct(">Q")
+
+
+def write_frame(stream: IO[bytes], data: bytes) -> None:
+    stream.write(FRAME_HEADER.pack(len(data)))
+    stream.write(data)
+
+
+def read_exactly(stream: IO[bytes], size: int) -> bytes | None:
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(stream: IO[bytes]) -> bytes | None:
+    header = read_exactly(stream, FRAME_HEADER.size)
+    if header is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    if size == 0:
+        return b""
+    return read_exactly(stream, size)
+
+
+def peak_memory_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return max_rss / 1024**2 if platform.system() == "Darwin" else max_rss / 1024
+
+
+class WorkerNotifications:
+    "Forward `create_files` progress to the plugin process"
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        self.stream = stream
+
+    def put(self, notification: tuple[float, str]) -> None:
+        write_frame(self.stream, json.dumps({"progress": notification}).encode())
+        self.stream.flush()
+
+
+def run_worker(memory_limit: int) -> None:
+    """
+    Worker process main loop, exit when stdin is closed or the process
+    uses more than `memory_limit` MB of memory.
+    """
+    try:
+        from .dump_lemmas import dump_spacy_docs
+        from .parse_job import ParseJobData, create_files
+    except ImportError:
+        from dump_lemmas import dump_spacy_docs
+        from parse_job import ParseJobData, create_files
+
+    job_in = sys.stdin.buffer
+    job_out = sys.stdout.buffer
+    # keep libraries' output away from the job channel
+    sys.stdout = sys.stderr
+    notif = WorkerNotifications(job_out)
+
+    while (header := read_frame(job_in)) is not None:
+        payload = read_frame(job_in)
+        if payload is None:
+            break
+        job = json.loads(header)
+        job_data = job["job_data"]
+        error = None
+        stats: dict[str, int] = {}
+        if "db_path" in job_data:
+            # rebuild spaCy docs of customized lemmas
+            try:
+                dump_spacy_docs(
+                    job_data["model_name"],
+                    job_data["is_kindle"],
+                    job_data["lemma_lang"],
+                    Path(job_data["db_path"]),
+                    Path(job_data["plugin_path"]),
+                    job["prefs"],
+                    notif,
+                )
+            except Exception:
+                error = traceback.format_exc()
+        else:
+            data = ParseJobData(**job_data)
+            if data.book_fmt == "KFX":
+                data.kfx_content = payload
+            elif data.book_fmt != "EPUB":
+                data.mobi_html = payload
+
+            try:
+                create_files(data, job["prefs"], notif, keep_pipelines=True)
+            except Exception:
+                error = traceback.format_exc()
+            stats = data.stats
+            del data
+
+        peak_memory = peak_memory_mb()
+        restart = peak_memory is not None and peak_memory > memory_limit
+        result = {"error": error, "restart": restart, "stats": stats}
+        write_frame(job_out, json.dumps(result).encode())
+        job_out.flush()
+        if restart:
+            break
+
+
+class JobWorker:
+    def __init__(self, py_path: str, plugin_path: str, prefs: Any) -> None:
+        self.args = [
+            py_path,
+            plugin_path,
+            "--worker",
+            str(prefs["worker_memory_limit"]),
+        ]
+        self.idle_timeout: int = prefs["worker_idle_timeout"]
+        self.lock = threading.Lock()
+        self.proc: subprocess.Popen | None = None
+        self.stderr: IO[bytes] | None = None
+        self.last_used = time.monotonic()
+        self.idle_timer: threading.Timer | None = None
+
+    def start(self) -> None:
+        from calibre.gui2 import sanitize_env_vars
+
+        self.stderr = tempfile.TemporaryFile()
+        with sanitize_env_vars():
+            self.proc = subprocess.Popen(
+                self.args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=self.stderr,
+                creationflags=(
+                    subprocess.CREATE_NO_WINDOW  # type: ignore
+                    if platform.system() == "Windows"
+                    else 0
+                ),
+            )
+
+    def is_running(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def stop(self) -> None:
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()  # type: ignore
+                self.proc.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+            self.proc = None
+        if self.stderr is not None:
+            self.stderr.close()
+            self.stderr = None
+
+    def stop_if_idle(self) -> None:
+        with self.lock:
+            if time.monotonic() - self.last_used >= self.idle_timeout:
+                self.stop()
+
+    def schedule_stop(self) -> None:
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        self.idle_timer = threading.Timer(self.idle_timeout, self.stop_if_idle)
+        self.idle_timer.daemon = True
+        self.idle_timer.start()
+
+    def crashed_error(self) -> subprocess.CalledProcessError:
+        returncode = self.proc.wait() if self.proc is not None else -1
+        stderr = b""
+        if self.stderr is not None:
+            self.stderr.seek(0)
+            stderr = self.stderr.read()
+        self.proc = None
+        self.stop()
+        return subprocess.CalledProcessError(returncode, self.args, stderr=stderr)
+
+    def run_job(
+        self, job_data: dict[str, Any], prefs_str: str, payload: bytes, notif: Any
+    ) -> dict[str, int]:
+        """
+        Caller should hold `self.lock`, return statistics of the job.
+        """
+        if not self.is_running():
+            self.stop()
+            self.start()
+        elif self.stderr is not None:
+            # keep output of this job for `crashed_error`, the worker
+            # process shares the file offset
+            self.stderr.seek(0)
+            self.stderr.truncate()
+        header = f'{{"job_data": {json.dumps(job_data)}, "prefs": {prefs_str}}}'
+        try:
+            write_frame(self.proc.stdin, header.encode())  # type: ignore
+            write_frame(self.proc.stdin, payload)  # type: ignore
+            self.proc.stdin.flush()  # type: ignore
+            while True:
+                frame = read_frame(self.proc.stdout)  # type: ignore
+                if frame is None:
+                    raise self.crashed_error()
+                message = json.loads(frame)
+                if "progress" not in message:
+                    break
+                if notif:
+                    notif.put(tuple(message["progress"]))
+        except OSError:
+            raise self.crashed_error()
+        finally:
+            self.last_used = time.monotonic()
+
+        if message["restart"]:
+            self.stop()
+        else:
+            self.schedule_stop()
+        if message["error"] is not None:
+            raise subprocess.CalledProcessError(
+                1, self.args, stderr=message["error"].encode("utf-8")
+            )
+        return message["stats"]
+
+
+JOB_WORKERS: list[JobWorker] = []
+JOB_WORKERS_LOCK = threading.Lock()
+
+
+@contextmanager
+def acquire_job_worker(
+    py_path: str, plugin_path: Path, prefs: Any
+) -> Iterator[JobWorker]:
+    """
+    Use an idle worker, start a new one if all workers are busy
+    so concurrent jobs still run in parallel.
+    """
+    with JOB_WORKERS_LOCK:
+        for worker in JOB_WORKERS:
+            if worker.lock.acquire(blocking=False):
+                break
+        else:
+            worker = JobWorker(py_path, str(plugin_path), prefs)
+            worker.lock.acquire()
+            JOB_WORKERS.append(worker)
+    try:
+        yield worker
+    finally:
+        worker.lock.release()
@@ -2,7 +2,7 @@
 
 import re
 from collections import Counter, defaultdict
-from functools import partial
+from itertools import chain, pairwise
 from pathlib import Path
 from sqlite3 import Connection
 
@@ -17,6 +17,7 @@ try:
         insert_x_type,
         save_db,
     )
+    from .kfx_content import IMAGE_RECORD, TEXT_RECORD, iter_kfx_content
     from .mediawiki import (
         Fandom,
         Wikidata,
@@ -25,9 +26,8 @@ try:
         query_mediawiki,
         query_wikidata,
     )
-    from .metadata import KFXJson
     from .utils import Prefs
-    from .x_ray_share import FUZZ_THRESHOLD, PERSON_LABELS, XRayEntity, is_full_name
+    from .x_ray_share import PERSON_LABELS, EntityIndex, XRayEntity, is_full_name
 except ImportError:
     from database import (
         create_x_indices,
@@ -39,6 +39,7 @@ except ImportError:
         insert_x_type,
         save_db,
     )
+    from kfx_content import IMAGE_RECORD, TEXT_RECORD, iter_kfx_content
     from mediawiki import (
         Fandom,
         Wikidata,
@@ -47,9 +48,8 @@ except ImportError:
         query_mediawiki,
         query_wikidata,
     )
-    from metadata import KFXJson
     from utils import Prefs
-    from x_ray_share import FUZZ_THRESHOLD, PERSON_LABELS, XRayEntity, is_full_name
+    from x_ray_share import PERSON_LABELS, EntityIndex, XRayEntity, is_full_name
 
 
 class X_Ray:
@@ -65,6 +65,7 @@ class X_Ray:
         self.num_people = 0
         self.num_terms = 0
         self.entities: dict[str, XRayEntity] = {}
+        self.entity_index = EntityIndex()
         self.people_counter: Counter[str] = Counter()
         self.terms_counter: Counter[str] = Counter()
         self.num_images = 0
@@ -107,22 +108,12 @@ class X_Ray:
     def add_entity(
         self, entity: str, ner_label: str, start: int, quote: str, entity_len: int
     ) -> None:
-        from rapidfuzz.fuzz import token_set_ratio
-        from rapidfuzz.process import extractOne
-        from rapidfuzz.utils import default_process
-
         if entity_data := self.entities.get(entity):
             entity_id = entity_data["id"]
             ner_label = entity_data["label"]
         elif entity not in self.custom_x_ray and (
-            r := extractOne(
-                entity,
-                self.entities.keys(),
-                score_cutoff=FUZZ_THRESHOLD,
-                scorer=partial(token_set_ratio, processor=default_process),
-            )
+            matched_name := self.entity_index.find(entity)
         ):
-            matched_name = r[0]
             matched_entity = self.entities[matched_name]
             matched_label = matched_entity["label"]
             entity_id = matched_entity["id"]
@@ -130,6 +121,7 @@ class X_Ray:
                 # replace partial name with full name
                 self.entities[entity] = self.entities[matched_name]
                 del self.entities[matched_name]
+                self.entity_index.replace(matched_name, entity)
             ner_label = matched_label
         else:
             entity_id = self.entity_id
@@ -138,6 +130,7 @@ class X_Ray:
                 "label": ner_label,
                 "quote": quote,
             }
+            self.entity_index.add(entity)
             self.entity_id += 1
 
         if ner_label in PERSON_LABELS:
@@ -188,7 +181,7 @@ class X_Ray:
         self,
         db_path: Path,
         erl: int,
-        kfx_json: list[KFXJson],
+        kfx_content: bytes | None,
         mobi_html: bytes,
         mobi_codec: str,
         prefs: Prefs,
@@ -225,8 +218,8 @@ class X_Ray:
         )
         self.insert_descriptions(prefs["search_people"])
 
-        if kfx_json:
-            self.find_kfx_images(kfx_json)
+        if kfx_content:
+            self.find_kfx_images(kfx_content)
         else:
             self.find_mobi_images(mobi_html, mobi_codec)
         if self.num_images:
@@ -253,30 +246,30 @@ class X_Ray:
         if self.wikidata is not None:
             self.wikidata.close()
 
-    def find_kfx_images(self, kfx_json: list[KFXJson]) -> None:
+    def find_kfx_images(self, kfx_content: bytes) -> None:
         images = set()
-        for index, image in filter(lambda x: x[1]["type"] == 2, enumerate(kfx_json)):
-            if image["content"] in images:
+        records = iter_kfx_content(kfx_content)
+        for image, caption in pairwise(chain(records, [None])):
+            if image.type != IMAGE_RECORD or image.content in images:
                 continue
-            images.add(image["content"])
-            caption_start = image["position"]
+            images.add(image.content)
+            caption_start = image.position
             caption_length = 0
             if (
-                index + 1 < len(kfx_json)
-                and kfx_json[index + 1]["type"] == 1
-                and len(kfx_json[index + 1]["content"]) < 450
+                caption is not None
+                and caption.type == TEXT_RECORD
+                and len(caption.content) < 450
             ):
-                caption = kfx_json[index + 1]
-                caption_start = caption["position"]
-                caption_length = len(caption["content"])
+                caption_start = caption.position
+                caption_length = len(caption.content)
             insert_x_excerpt_image(
                 self.conn,
                 (
                     self.num_images,
                     caption_start,
                     caption_length,
-                    image["content"],
-                    image["position"],
+                    image.content,
+                    image.position,
                 ),
             )
             self.num_images += 1
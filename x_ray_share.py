@@ -59,6 +59,85 @@ def is_full_name(
     )
 
 
+class EntityIndex:
+    """
+    Find the entity name `extractOne` with `token_set_ratio` would choose
+    without scoring every name. Names share a processed token with the query
+    are scored directly, `token_set_ratio` of other names equals the `ratio` of
+    the sorted tokens so they are found with `rapidfuzz.process.extract`.
+    Positions follow the insertion order of the entities dictionary.
+    """
+
+    def __init__(self) -> None:
+        self.names: list[str | None] = []
+        self.positions: dict[str, int] = {}
+        self.token_positions: dict[str, set[int]] = {}
+        # sorted processed tokens of each name for `extract`
+        self.sorted_tokens: list[str | None] = []
+
+    @staticmethod
+    def tokens(name: str) -> set[str]:
+        from rapidfuzz.utils import default_process
+
+        return set(default_process(name).split())
+
+    def add(self, name: str) -> None:
+        position = len(self.names)
+        self.names.append(name)
+        self.positions[name] = position
+        tokens = self.tokens(name)
+        for token in tokens:
+            self.token_positions.setdefault(token, set()).add(position)
+        self.sorted_tokens.append(" ".join(sorted(tokens)) if tokens else None)
+
+    def remove(self, name: str) -> None:
+        position = self.positions.pop(name)
+        self.names[position] = None
+        self.sorted_tokens[position] = None
+        for token in self.tokens(name):
+            self.token_positions[token].discard(position)
+
+    def find(self, query: str) -> str | None:
+        from rapidfuzz.fuzz import ratio, token_set_ratio
+        from rapidfuzz.process import extract
+        from rapidfuzz.utils import default_process
+
+        tokens = self.tokens(query)
+        if not tokens:
+            return None
+        candidates = set()
+        for token in tokens:
+            candidates.update(self.token_positions.get(token, ()))
+        if self.positions:
+            # lower cutoff, scores are recalculated below
+            for _, _, position in extract(
+                " ".join(sorted(tokens)),
+                self.sorted_tokens,
+                scorer=ratio,
+                processor=None,
+                score_cutoff=FUZZ_THRESHOLD - 1,
+                limit=None,
+            ):
+                candidates.add(position)
+
+        best_score = 0.0
+        best_name = None
+        for position in sorted(candidates):
+            name = self.names[position]
+            score = token_set_ratio(
+                query, name, processor=default_process, score_cutoff=FUZZ_THRESHOLD
+            )
+            if score >= FUZZ_THRESHOLD and score > best_score:
+                best_score = score
+                best_name = name
+        return best_name
+
+    def replace(self, old_name: str, new_name: str) -> None:
+        "Same as moving the entity to the end of the dictionary with a new key"
+        self.remove(old_name)
+        self.add(new_name)
+
+
 def x_ray_source(source_id: int, prefs: Prefs, lang: str) -> tuple[str, str | None]:
     if source_id == 1:
         source_link = (